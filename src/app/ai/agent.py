@@ -1,13 +1,21 @@
-from typing import Annotated, TypedDict, List, Literal
+from typing import Annotated, TypedDict, List, Literal, Iterator, AsyncIterator, Optional, Tuple
 import json
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, BaseMessage, ToolMessage
+import threading
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, AIMessageChunk, BaseMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig, RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode
 
 from app.config import Config
+from app.ai.checkpointer import get_checkpointer
+from app.ai.context import build_prompt, facts_from_tool_results, merge_facts
+from app.ai.router import route_turn
+from app.ai import response_cache
+from app.ai.tool_executor import ToolExecutor
+from app.ai.steps import STEP_TOOLS, STEP_INTAKE, STEP_PAYMENT, STEP_DONE, STEP_STAFF, registration_step
+from app.ai.callbacks import StageTimingCallback, ProfilingCallback
+from app.utils import metrics
+from app.utils.profiler import profiling_configured
 
 # Import AI tools
 from app.ai.tools import (
@@ -22,6 +30,13 @@ from app.ai.tools import (
 # --- 1. Define the State ---
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], add_messages]
+    # Registration facts (course, card check, payment...) kept outside the trimmed history
+    facts: Annotated[dict, merge_facts]
+    # Frontend step sent with the current message, and what the fast path asked for last turn
+    current_step: Optional[str]
+    awaiting: Optional[str]
+    # Registration step (app.ai.steps); selects the tools and prompt section of each LLM call
+    step: str
 
 # --- 2. Setup LLM & Tools ---
 tools = [
@@ -33,53 +48,101 @@ tools = [
     find_existing_client
 ]
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0, api_key=Config.OPENAI_API_KEY)
-llm_with_tools = llm.bind_tools(tools)
+tools_by_name = {t.name: t for t in tools}
+step_tools = {step: [tools_by_name[name] for name in names] for step, names in STEP_TOOLS.items()}
 
-# --- 3. Define Nodes ---
+def create_llm():
+    """
+    The chat model. langchain_openai (and the OpenAI SDK) are imported here
+    rather than at module load, and the model's HTTP client is created in the
+    process that uses it: after the fork when gunicorn preloads the app.
+    """
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model="gpt-4o", temperature=0, api_key=Config.OPENAI_API_KEY)
 
-def greeting_node(state: AgentState):
+def bind_step_models(model) -> dict:
     """
-    Entry node. Checks if we should greet or pass to agent.
+    Bind `model` once per step to that step's tools. The agent node picks the
+    variant for the current step, so no call carries tools it cannot use.
     """
-    # In this simplified flow, we just pass through. 
-    # The system prompt in the agent node handles the persona.
-    return {}
+    return {step: model.bind_tools(step_tools[step]) for step in STEP_TOOLS}
 
-def agent_node(state: AgentState):
+# Set by get_app_graph() (or by a test harness swapping the model in beforehand)
+step_models: Optional[dict] = None
+# One executor per step: a call to a tool outside the step gets an error result instead of running
+step_executors = {step: ToolExecutor(step_tools[step]) for step in STEP_TOOLS}
+
+# --- 3. Define Nodes ---
+
+def greeting_node(state: AgentState):
     """
-    The Brain. Decides to call tools or respond.
+    Entry node. Answers routine turns (greetings, course list, course pick,
+    PR yes/no) and repeated FAQ-style questions without the LLM; everything
+    else goes on to the agent.
     """
-    messages = state["messages"]
-    
-    # System Prompt to guide the agent and UI tags
-    system_prompt = SystemMessage(content="""
-        You are a helpful Registration Assistant for a course system.
-        Your goal is to help users register for courses, validate their identity (PR card), and confirm payment.
-
-        You have access to tools. Use them when appropriate.
-
-        **UI Triggers:**
-        You must include specific tags in your response when you want the user to see a specific UI widget.
-        - If the user asks about courses or you list them, include `[SHOW_COURSE_SELECTOR]` at the end.
-        - If the user selects a course, ask if they are a Permanent Resident (PR).
-        - If they are a PR, ask them to upload their PR card FIRST and include `[SHOW_UPLOAD]`.
-        - Once you have the PR card (or if they are not a PR), ask them to fill out the registration details and include `[SHOW_REGISTRATION_FORM]`.
-        - When you receive the registration details (and have the PR card URL if applicable), call `store_registration_info`. Ensure you include the PR card URL in the `clearFront` field of the user_info if they are a PR.
-        - If storage is successful, ask for payment and include `[SHOW_PAYMENT]`.
-        - If the user confirms payment and you verify it, congratulate them and include `[SUCCESS_COMPLETION]`.
-
-        **Flow:**
-        1. Greet the user if they say hi.
-        2. Guide them through: Course Selection -> Check PR Status -> PR Upload (if PR) -> Registration Form -> Store Info -> Payment -> Success.
-        3. Always be polite.
-    """)
-            
-    # We prepend the system prompt to the messages list for the invocation
-    # This ensures the model sees it every time without adding it to the history permanently if we don't want to.
-    # However, LangGraph add_messages handles history. Let's just pass it in the invoke call.
-    response = llm_with_tools.invoke([system_prompt] + messages)
-    
+    step = registration_step(state.get("facts"), state.get("current_step"))
+    if Config.FAST_PATH_ENABLED:
+        update = route_turn(state["messages"], state.get("current_step"), state.get("awaiting"), step)
+        if update is not None:
+            facts = merge_facts(state.get("facts"), update.get("facts"))
+            return {**update, "step": registration_step(facts, state.get("current_step"))}
+    if Config.RESPONSE_CACHE_ENABLED:
+        reply = response_cache.lookup(state["messages"], step, state.get("facts"))
+        if reply is not None:
+            return {"messages": [AIMessage(content=reply)], "awaiting": None, "step": step}
+    return {"awaiting": None, "step": step}
+
+# System Prompt to guide the agent and UI tags. The base is sent with every
+# call; each step adds only the instructions (and tools) it needs.
+PROMPT_BASE = """
+    You are a helpful Registration Assistant for a course system.
+    Your goal is to help users register for courses, validate their identity (PR card), and confirm payment.
+
+    You have access to tools. Use them when appropriate.
+
+    **UI Triggers:**
+    You must include specific tags in your response when you want the user to see a specific UI widget.
+    - If the user asks about courses or you list them, include `[SHOW_COURSE_SELECTOR]` at the end.
+"""
+
+PROMPT_INTAKE = """
+    - If the user selects a course, ask if they are a Permanent Resident (PR).
+    - If they are a PR, ask them to upload their PR card FIRST and include `[SHOW_UPLOAD]`.
+    - Once you have the PR card (or if they are not a PR), ask them to fill out the registration details and include `[SHOW_REGISTRATION_FORM]`.
+    - When you receive the registration details (and have the PR card URL if applicable), call `store_registration_info`. Ensure you include the PR card URL in the `clearFront` field of the user_info if they are a PR.
+    - If storage is successful, ask for payment and include `[SHOW_PAYMENT]`.
+"""
+
+PROMPT_PAYMENT = """
+    - The registration is stored. If the user has not paid yet, ask for payment and include `[SHOW_PAYMENT]`.
+    - If the user confirms payment and you verify it with `check_payment_status`, congratulate them and include `[SUCCESS_COMPLETION]`.
+"""
+
+PROMPT_DONE = """
+    - The user has completed a registration and its payment. If they want another course, start again from course selection.
+"""
+
+PROMPT_STAFF = """
+    - You are talking to staff. `search_nonpaid_email` lists yesterday's registrations that are still unpaid and sends the reminders.
+"""
+
+PROMPT_FLOW = """
+    **Flow:**
+    1. Greet the user if they say hi.
+    2. Guide them through: Course Selection -> Check PR Status -> PR Upload (if PR) -> Registration Form -> Store Info -> Payment -> Success.
+    3. Always be polite.
+"""
+
+STEP_PROMPTS = {
+    STEP_INTAKE: SystemMessage(content=PROMPT_BASE + PROMPT_INTAKE + PROMPT_FLOW),
+    STEP_PAYMENT: SystemMessage(content=PROMPT_BASE + PROMPT_PAYMENT + PROMPT_FLOW),
+    STEP_DONE: SystemMessage(content=PROMPT_BASE + PROMPT_DONE + PROMPT_INTAKE + PROMPT_FLOW),
+    STEP_STAFF: SystemMessage(content=PROMPT_BASE + PROMPT_INTAKE + PROMPT_PAYMENT + PROMPT_STAFF + PROMPT_FLOW),
+}
+# The full prompt (every section)
+SYSTEM_PROMPT = STEP_PROMPTS[STEP_STAFF]
+
+def _log_decision(response: AIMessage):
     # --- LOGGING ---
     print("\n--- 🤖 Agent Decision ---")
     if response.tool_calls:
@@ -87,63 +150,281 @@ def agent_node(state: AgentState):
     print("-------------------------\n")
     # ---------------
 
+def _current_step(state: AgentState) -> str:
+    return state.get("step") or registration_step(state.get("facts"), state.get("current_step"))
+
+def _prompt(state: AgentState, step: str) -> List[BaseMessage]:
+    prompt, stats = build_prompt(STEP_PROMPTS[step], state["messages"], state.get("facts"))
+    print(f"🧮 Prompt ≈{stats['tokens']} tokens ({stats['kept']}/{stats['total']} messages, budget {stats['budget']}, step {step})")
+    metrics.inc("app_llm_prompt_tokens_total", stats["tokens"], "Approximate prompt tokens sent to the chat LLM.", step=step)
+    return prompt
+
+def agent_node(state: AgentState):
+    """
+    The Brain. Decides to call tools or respond.
+    """
+    # The step's prompt and tools, the known facts and as much recent history
+    # as fits the token budget; see app.ai.context and app.ai.steps
+    step = _current_step(state)
+    response = step_models[step].invoke(_prompt(state, step))
+    _log_decision(response)
+
     return {"messages": [response]}
 
-def tools_node(state: AgentState):
+async def aagent_node(state: AgentState):
     """
-    Executes tools.
+    Async variant of `agent_node`, used when the graph runs under the ASGI server.
     """
-  
-    result = ToolNode(tools).invoke(state)
+    step = _current_step(state)
+    response = await step_models[step].ainvoke(_prompt(state, step))
+    _log_decision(response)
 
+    return {"messages": [response]}
+
+def _with_facts(state: AgentState, result: dict) -> dict:
+    facts = facts_from_tool_results(state["messages"][-1], result.get("messages", []))
+    if facts:
+        # The step follows the facts, e.g. a stored registration moves on to payment
+        merged = merge_facts(state.get("facts"), facts)
+        result = {**result, "facts": facts, "step": registration_step(merged, state.get("current_step"))}
     return result
 
+def tools_node(state: AgentState, config: RunnableConfig):
+    """
+    Executes tools. Several calls in one step run concurrently (see
+    app.ai.tool_executor).
+    """
+    tool_calls = state["messages"][-1].tool_calls
+    result = {"messages": step_executors[_current_step(state)].run(tool_calls, config)}
+
+    return _with_facts(state, result)
+
+async def atools_node(state: AgentState, config: RunnableConfig):
+    """
+    Async variant of `tools_node`; tools with a coroutine (validate_pr_card)
+    run natively, the rest on the tool thread pool.
+    """
+    tool_calls = state["messages"][-1].tool_calls
+    result = {"messages": await step_executors[_current_step(state)].arun(tool_calls, config)}
+    return _with_facts(state, result)
+
+def _image_check_summary(messages: List[BaseMessage], start: int) -> Optional[str]:
+    # The validate_pr_card result of the turn that started at messages[start], if any
+    for message in messages[start + 1:]:
+        if isinstance(message, HumanMessage):
+            break
+        if isinstance(message, ToolMessage) and message.name == "validate_pr_card":
+            try:
+                result = json.loads(message.content)
+            except (TypeError, ValueError):
+                return f"Card check: {str(message.content)[:200]}"
+            doc_type = ", ".join(result.get("doc_type") or []) or "unknown"
+            return (
+                f"Card check: status={result.get('status')}, is_valid={result.get('is_valid')}, "
+                f"doc_type={doc_type}, confidence={result.get('confidence')}. {result.get('message', '')}"
+            ).strip()
+    return None
+
+def compact_node(state: AgentState):
+    """
+    Runs when a turn is done. Replaces the inline (base64) image parts of
+    earlier user messages with a short text reference: the upload URL plus
+    the card check result. The model already looked at the image during its
+    turn; keeping the bytes would re-send them with every later request and
+    store them in the checkpoint forever.
+
+    A reply that is the same for anyone asking (no side effects, no personal
+    data) is also stored in the response cache here.
+    """
+    messages = state["messages"]
+    if Config.RESPONSE_CACHE_ENABLED:
+        response_cache.store(messages, state.get("step") or STEP_INTAKE, state.get("facts"))
+    compacted = []
+    for i, message in enumerate(messages):
+        if not isinstance(message, HumanMessage) or not isinstance(message.content, list):
+            continue
+        if not any(isinstance(part, dict) and part.get("type") == "image_url" for part in message.content):
+            continue
+        upload_url = message.additional_kwargs.get("upload_url") or "not stored"
+        reference = f"[Image uploaded earlier: {upload_url}]"
+        summary = _image_check_summary(messages, i)
+        if summary:
+            reference += f" {summary}"
+        content = [
+            {"type": "text", "text": reference} if isinstance(part, dict) and part.get("type") == "image_url" else part
+            for part in message.content
+        ]
+        # Same ID: add_messages replaces the message in place
+        compacted.append(HumanMessage(content=content, additional_kwargs=message.additional_kwargs, id=message.id))
+    if not compacted:
+        return {}
+    return {"messages": compacted}
+
 # --- 4. Build the Graph ---
 workflow = StateGraph(AgentState)
 
 workflow.add_node("greeting", greeting_node)
-workflow.add_node("agent", agent_node)
-workflow.add_node("tools", tools_node)
+# Each node has a sync and an async implementation: invoke/stream use the first,
+# ainvoke/astream (ASGI server) the second
+workflow.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
+workflow.add_node("tools", RunnableLambda(tools_node, afunc=atools_node, name="tools"))
+workflow.add_node("compact", compact_node)
 
 # Edges
 workflow.add_edge(START, "greeting")
-workflow.add_edge("greeting", "agent")
 
-def should_continue(state: AgentState) -> Literal["tools", END]:
+def after_greeting(state: AgentState) -> Literal["agent", END]:
+    # The fast path ends the turn with its own reply
+    if isinstance(state["messages"][-1], AIMessage):
+        return END
+    return "agent"
+
+workflow.add_conditional_edges("greeting", after_greeting)
+
+def should_continue(state: AgentState) -> Literal["tools", "compact"]:
     messages = state["messages"]
     last_message = messages[-1]
     if last_message.tool_calls:
         return "tools"
-    return END
+    return "compact"
 
 workflow.add_conditional_edges("agent", should_continue)
 workflow.add_edge("tools", "agent")
+workflow.add_edge("compact", END)
+
+# Compiled on first use, see get_app_graph()
+_app_graph = None
+_app_graph_lock = threading.Lock()
+
+def get_app_graph():
+    """
+    The compiled graph, built on first call together with the chat model.
+    Gunicorn's post_fork hook calls this in each worker (see gunicorn.conf.py),
+    so the first request does not pay for it.
+    """
+    global _app_graph, step_models
+    if _app_graph is None:
+        with _app_graph_lock:
+            if _app_graph is None:
+                if step_models is None:
+                    step_models = bind_step_models(create_llm())
+                _app_graph = workflow.compile(checkpointer=get_checkpointer())
+    return _app_graph
+
+# --- 5. UI Tags ---
+# Tags the agent appends to its reply to drive the frontend, in priority order
+UI_ACTION_TAGS = {
+    "[SHOW_COURSE_SELECTOR]": "show_course_selector",
+    "[SHOW_REGISTRATION_FORM]": "show_registration_form",
+    "[SHOW_UPLOAD]": "show_upload",
+    "[SHOW_PAYMENT]": "show_payment",
+    "[SUCCESS_COMPLETION]": "success_completion",
+}
+
+# Progress text shown to the user while a tool runs
+TOOL_PROGRESS_MESSAGES = {
+    "get_available_courses": "Looking up available courses…",
+    "store_registration_info": "Saving your registration…",
+    "validate_pr_card": "Verifying your card…",
+    "check_payment_status": "Checking your payment…",
+    "search_nonpaid_email": "Searching unpaid registrations…",
+    "find_existing_client": "Looking up your records…",
+}
+
+def extract_ui_action(response: str) -> Tuple[str, Optional[str]]:
+    """
+    Strip the first UI tag found in the response and return (text, ui_action).
+    """
+    for tag, action in UI_ACTION_TAGS.items():
+        if tag in response:
+            return response.replace(tag, ""), action
+    return response, None
+
+class UITagStreamParser:
+    """
+    Incrementally removes UI tags from streamed text. Text that could still be
+    the start of a tag is held back until the next chunk decides it.
+    """
+
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, chunk: str) -> Tuple[str, List[str]]:
+        """
+        Returns:
+            (text safe to emit, list of UI actions completed in this chunk)
+        """
+        self._pending += chunk
+        out = []
+        actions = []
+        while self._pending:
+            start = self._pending.find("[")
+            if start == -1:
+                out.append(self._pending)
+                self._pending = ""
+                break
+            out.append(self._pending[:start])
+            candidate = self._pending[start:]
+            tag = next((t for t in UI_ACTION_TAGS if candidate.startswith(t)), None)
+            if tag:
+                actions.append(UI_ACTION_TAGS[tag])
+                self._pending = candidate[len(tag):]
+                continue
+            if any(t.startswith(candidate) for t in UI_ACTION_TAGS):
+                # Possibly an incomplete tag; wait for more text
+                self._pending = candidate
+                break
+            out.append("[")
+            self._pending = candidate[1:]
+        return "".join(out), actions
 
-# Compile
-memory = MemorySaver()
-app_graph = workflow.compile(checkpointer=memory)
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return text
 
-# --- 5. Process Message Function ---
-def process_message(user_input: str, thread_id: str, image_url: str = None, original_image_url: str = None):
+# --- 6. Process Message Function ---
+def _run_config(thread_id: str) -> dict:
     config = {"configurable": {"thread_id": thread_id}}
-    
+    callbacks = []
+    if Config.METRICS_ENABLED:
+        callbacks.append(StageTimingCallback())
+    if profiling_configured():
+        callbacks.append(ProfilingCallback(thread_id))
+    if callbacks:
+        config["callbacks"] = callbacks
+    return config
+
+def _build_human_message(user_input: str, image_url: str = None, original_image_url: str = None, image_detail: str = None) -> HumanMessage:
     # Construct input message
     content = []
     if user_input:
         content.append({"type": "text", "text": user_input})
     if image_url:
-        content.append({"type": "image_url", "image_url": {"url": image_url}})
+        image_part = {"url": image_url}
+        if image_detail:
+            image_part["detail"] = image_detail
+        content.append({"type": "image_url", "image_url": image_part})
         # Also add a text hint so the agent knows an image was uploaded
         hint_text = " (User uploaded an image)."
         if original_image_url:
             hint_text += f" The URL for this image is: {original_image_url}. Use this URL when calling tools."
         content.append({"type": "text", "text": hint_text})
-        
-    human_msg = HumanMessage(content=content)
+
+    additional_kwargs = {}
+    upload_url = original_image_url or (image_url if image_url and not image_url.startswith("data:") else None)
+    if upload_url:
+        # Kept so compact_node can replace the inline image with a reference once the turn is done
+        additional_kwargs["upload_url"] = upload_url
+    return HumanMessage(content=content, additional_kwargs=additional_kwargs)
+
+def process_message(user_input: str, thread_id: str, image_url: str = None, original_image_url: str = None, image_detail: str = None, current_step: str = None):
+    config = _run_config(thread_id)
+    
+    human_msg = _build_human_message(user_input, image_url, original_image_url, image_detail)
     
     # Run the graph
     # We use invoke to run until the graph stops (at END)
-    result = app_graph.invoke({"messages": [human_msg]}, config=config)
+    result = get_app_graph().invoke({"messages": [human_msg], "current_step": current_step}, config=config)
     
     # Extract the last message content
     last_msg = result["messages"][-1]
@@ -151,4 +432,108 @@ def process_message(user_input: str, thread_id: str, image_url: str = None, orig
     if isinstance(last_msg, AIMessage):
         final_response = last_msg.content
     
-    return final_response
\ No newline at end of file
+    return final_response
+
+class _StreamTranslator:
+    """
+    Turns LangGraph ("messages" | "updates", chunk) stream items into the
+    (event, data) pairs documented on `stream_message`.
+    """
+
+    def __init__(self):
+        self.parser = UITagStreamParser()
+        self.final_response = ""
+
+    def translate(self, mode: str, chunk) -> List[Tuple[str, dict]]:
+        events = []
+        if mode == "messages":
+            message, metadata = chunk
+            if metadata.get("langgraph_node") != "agent" or not isinstance(message, AIMessageChunk):
+                return events
+            if not isinstance(message.content, str) or not message.content:
+                return events
+            text, actions = self.parser.feed(message.content)
+            if text:
+                events.append(("token", {"text": text}))
+            for action in actions:
+                events.append(("ui_action", {"ui_action": action}))
+            return events
+
+        for node, update in (chunk or {}).items():
+            for message in (update or {}).get("messages", []):
+                if node == "greeting" and isinstance(message, AIMessage) and not message.tool_calls:
+                    # A fast-path reply arrives whole; send it as a single token event
+                    self.final_response = message.content
+                    text, actions = self.parser.feed(message.content)
+                    if text:
+                        events.append(("token", {"text": text}))
+                    for action in actions:
+                        events.append(("ui_action", {"ui_action": action}))
+                elif node in ("agent", "greeting") and isinstance(message, AIMessage):
+                    if message.tool_calls:
+                        # Text streamed before a tool call belongs to an intermediate step
+                        self.parser.flush()
+                        for call in message.tool_calls:
+                            events.append(("tool", {
+                                "name": call["name"],
+                                "message": TOOL_PROGRESS_MESSAGES.get(call["name"], "Working on it…"),
+                            }))
+                    else:
+                        self.final_response = message.content
+                elif node in ("tools", "greeting") and isinstance(message, ToolMessage):
+                    events.append(("tool_result", {"name": message.name, "status": message.status}))
+        return events
+
+    def finish(self) -> List[Tuple[str, dict]]:
+        events = []
+        tail = self.parser.flush()
+        if tail:
+            events.append(("token", {"text": tail}))
+        final_response, ui_action = extract_ui_action(self.final_response)
+        events.append(("done", {"response": final_response.strip(), "ui_action": ui_action}))
+        return events
+
+def stream_message(user_input: str, thread_id: str, image_url: str = None, original_image_url: str = None, image_detail: str = None, current_step: str = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Run the graph with LangGraph streaming and yield (event, data) pairs:
+        - ("token", {"text"}): reply text as the model produces it, UI tags removed
+        - ("tool", {"name", "message"}): a tool call has started
+        - ("tool_result", {"name", "status"}): a tool call has finished
+        - ("ui_action", {"ui_action"}): a UI tag was found in the reply
+        - ("done", {"response", "ui_action"}): the full reply, same shape as /api/chat
+    """
+    config = _run_config(thread_id)
+    human_msg = _build_human_message(user_input, image_url, original_image_url, image_detail)
+
+    translator = _StreamTranslator()
+    for mode, chunk in get_app_graph().stream({"messages": [human_msg], "current_step": current_step}, config=config, stream_mode=["messages", "updates"]):
+        yield from translator.translate(mode, chunk)
+    yield from translator.finish()
+
+async def aprocess_message(user_input: str, thread_id: str, image_url: str = None, original_image_url: str = None, image_detail: str = None, current_step: str = None):
+    """
+    Async variant of `process_message` (LangGraph ainvoke).
+    """
+    config = _run_config(thread_id)
+    human_msg = _build_human_message(user_input, image_url, original_image_url, image_detail)
+
+    result = await get_app_graph().ainvoke({"messages": [human_msg], "current_step": current_step}, config=config)
+
+    last_msg = result["messages"][-1]
+    if isinstance(last_msg, AIMessage):
+        return last_msg.content
+    return ""
+
+async def astream_message(user_input: str, thread_id: str, image_url: str = None, original_image_url: str = None, image_detail: str = None, current_step: str = None) -> AsyncIterator[Tuple[str, dict]]:
+    """
+    Async variant of `stream_message` (LangGraph astream); yields the same events.
+    """
+    config = _run_config(thread_id)
+    human_msg = _build_human_message(user_input, image_url, original_image_url, image_detail)
+
+    translator = _StreamTranslator()
+    async for mode, chunk in get_app_graph().astream({"messages": [human_msg], "current_step": current_step}, config=config, stream_mode=["messages", "updates"]):
+        for event in translator.translate(mode, chunk):
+            yield event
+    for event in translator.finish():
+        yield event
@@ -0,0 +1,104 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from app.utils import metrics
+from app.utils import profiler
+
+
+class StageTimingCallback(BaseCallbackHandler):
+    """
+    Times every LLM call and tool run of one graph invocation and records
+    them as `llm` and `tool.<name>` stages of the current request.
+    """
+
+    # Cheap enough to run on the calling thread/event loop
+    run_inline = True
+
+    def __init__(self):
+        # Captured here because tools may run on executor threads
+        self.stages = metrics.current_request_stages()
+        self._started: Dict[UUID, tuple] = {}
+
+    def _start(self, run_id: UUID, stage: str):
+        self._started[run_id] = (stage, time.perf_counter())
+
+    def _end(self, run_id: UUID):
+        started = self._started.pop(run_id, None)
+        if started:
+            stage, start = started
+            metrics.record_stage(stage, time.perf_counter() - start, stages=self.stages)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages, *, run_id: UUID, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts, *, run_id: UUID, **kwargs):
+        self._start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_llm_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs):
+        name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+        self._start(run_id, f"tool.{name}")
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+
+class ProfilingCallback(BaseCallbackHandler):
+    """
+    Brings tool runs under the sampling profiler. When the request is being
+    profiled, the tool's thread joins the request profile (and leaves it
+    when the tool ends, unless it was already in it, like the request
+    thread); otherwise the tool run itself may be picked by the sample rate
+    and gets its own profile.
+    """
+
+    run_inline = True
+
+    def __init__(self, session_id: Optional[str] = None):
+        self.session_id = session_id
+        self.request_profiler = profiler.active_profiler()
+        self._tool_runs: Dict[UUID, tuple] = {}
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs):
+        thread_id = threading.get_ident()
+        if self.request_profiler is not None:
+            # Inline callbacks of async tools fire on the request's own thread (the
+            # event loop), which the request profile already samples and must keep
+            if self.request_profiler.add_thread(thread_id):
+                self._tool_runs[run_id] = (None, thread_id, None)
+        elif profiler.should_profile():
+            name = (serialized or {}).get("name") or kwargs.get("name") or "unknown"
+            tool_profiler = profiler.SamplingProfiler()
+            tool_profiler.add_thread(thread_id)
+            self._tool_runs[run_id] = (tool_profiler.start(), thread_id, f"tool.{name}")
+
+    def _end(self, run_id: UUID):
+        run = self._tool_runs.pop(run_id, None)
+        if run is None:
+            return
+        tool_profiler, thread_id, step = run
+        if tool_profiler is None:
+            self.request_profiler.remove_thread(thread_id)
+            return
+        try:
+            profiler.write_profile(tool_profiler.stop(), self.session_id, step)
+        except Exception as e:
+            print(f"❌ Failed to write profile: {e}")
+
+    def on_tool_end(self, output, *, run_id: UUID, **kwargs):
+        self._end(run_id)
+
+    def on_tool_error(self, error, *, run_id: UUID, **kwargs):
+        self._end(run_id)
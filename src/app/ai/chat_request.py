@@ -0,0 +1,66 @@
+import hmac
+import json
+import uuid
+
+from app.ai.steps import STAFF_FRONTEND_STEP
+from app.ai.vision import prepared_images, choose_vision_detail
+from app.config import Config
+from app.utils.storage_utils import get_storage, upload_key_from_url
+
+# Header that unlocks the staff step (back-office tools) together with current_step=STAFF
+STAFF_HEADER = "X-Staff-Token"
+
+
+def prepare_chat_args(data: dict, host: str, staff_token: str = None) -> dict:
+    """
+    Read a /api/chat request body into `process_message` keyword arguments.
+
+    Our own upload URLs are turned into a cached, LLM-sized Base64 JPEG so
+    OpenAI can access them; the original URL is kept for the tools.
+
+    Args:
+        data (dict): The JSON request body.
+        host (str): The host the request was served on.
+        staff_token (str): Value of the X-Staff-Token header, if any.
+    """
+    user_message = data.get('message', '')
+    current_step = data.get('current_step', None)
+    session_id = data.get('session_id')
+    image_url = data.get('image_url', None) # Optional image from frontend
+
+    # The staff step exposes back-office tools; it needs the configured token.
+    # Compared in constant time (as bytes: header values may not be ASCII)
+    if (current_step or "").upper() == STAFF_FRONTEND_STEP and not (
+            Config.STAFF_TOKEN and hmac.compare_digest((staff_token or "").encode(), Config.STAFF_TOKEN.encode())):
+        current_step = None
+
+    # Generate a session ID if one doesn't exist (for new users)
+    if not session_id:
+        session_id = str(uuid.uuid4())
+
+    original_image_url = image_url
+
+    image_detail = None
+    upload_key = upload_key_from_url(image_url, host)
+    if upload_key:
+        try:
+            image_detail = choose_vision_detail(current_step)
+            prepared = prepared_images.get(upload_key, image_detail, lambda: get_storage().read(upload_key))
+            if prepared is not None:
+                image_url = prepared.data_uri
+        except Exception as e:
+            print(f"Warning: Could not convert uploaded image to Base64: {e}")
+
+    return {
+        "user_input": user_message,
+        "thread_id": session_id,
+        "image_url": image_url,
+        "original_image_url": original_image_url,
+        "image_detail": image_detail,
+        "current_step": current_step,
+    }
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
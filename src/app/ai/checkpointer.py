@@ -0,0 +1,543 @@
+"""
+Conversation checkpointers for the agent graph.
+
+Two backends, picked by CHECKPOINTER_BACKEND:
+
+- 'memory': `BoundedMemorySaver`, an in-process `InMemorySaver` that evicts
+  idle threads after CHECKPOINT_TTL_SECONDS and keeps the whole store under
+  CHECKPOINT_MEMORY_MAX_THREADS / CHECKPOINT_MEMORY_MAX_BYTES (least recently
+  used threads go first). State is per worker.
+- 'sqlite': `SqliteCheckpointSaver`, a SQLite file in WAL mode that every
+  gunicorn worker on the node (or every node sharing the volume) reads and
+  writes, so a session keeps its history whichever worker serves it.
+
+Both keep at most CHECKPOINT_MAX_PER_THREAD checkpoints per thread; the graph
+only ever resumes from the latest one.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Sequence, Set, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+
+from app.config import Config
+
+# How often (seconds) expired threads are swept out of the SQLite store
+SQLITE_SWEEP_INTERVAL = 60.0
+
+
+class BoundedMemorySaver(InMemorySaver):
+    """
+    `InMemorySaver` with TTL eviction of idle threads, a per-thread
+    checkpoint cap and a cap on the number of threads and approximate bytes
+    held. Thread-safe for the threaded Flask/gunicorn workers.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = None,
+        max_per_thread: int = None,
+        max_threads: int = None,
+        max_bytes: int = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.CHECKPOINT_TTL_SECONDS
+        self.max_per_thread = max(1, max_per_thread or Config.CHECKPOINT_MAX_PER_THREAD)
+        self.max_threads = max_threads or Config.CHECKPOINT_MEMORY_MAX_THREADS
+        self.max_bytes = max_bytes or Config.CHECKPOINT_MEMORY_MAX_BYTES
+        self._lock = threading.RLock()
+        # thread ID -> last access (monotonic), least recently used first
+        self._last_access: "OrderedDict[str, float]" = OrderedDict()
+        # Per-thread indexes so pruning/eviction never scans the whole store
+        self._thread_blobs: Dict[str, Set[tuple]] = {}
+        self._thread_writes: Dict[str, Set[tuple]] = {}
+        self._thread_bytes: Dict[str, int] = {}
+        self._total_bytes = 0
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            if thread_id not in self._last_access:
+                return None
+            self._touch(thread_id)
+            return super().get_tuple(config)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        if config and config["configurable"]["thread_id"] not in self._last_access:
+            return iter(())
+        # Materialize under the lock; another request may evict while we iterate
+        with self._lock:
+            return iter(list(super().list(config, filter=filter, before=before, limit=limit)))
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            blobs = self._thread_blobs.setdefault(thread_id, set())
+            for channel, version in new_versions.items():
+                blobs.add((thread_id, checkpoint_ns, channel, version))
+            self._touch(thread_id)
+            self._prune_thread(thread_id, checkpoint_ns)
+            self._recount(thread_id)
+            self._evict(keep=thread_id)
+            return next_config
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+            self._thread_writes.setdefault(thread_id, set()).add(
+                (thread_id, config["configurable"].get("checkpoint_ns", ""), config["configurable"]["checkpoint_id"])
+            )
+            self._touch(thread_id)
+            self._recount(thread_id)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self.storage.pop(thread_id, None)
+            for key in self._thread_writes.pop(thread_id, ()):
+                self.writes.pop(key, None)
+            for key in self._thread_blobs.pop(thread_id, ()):
+                self.blobs.pop(key, None)
+            self._total_bytes -= self._thread_bytes.pop(thread_id, 0)
+            self._last_access.pop(thread_id, None)
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return self.get_tuple(config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        for item in self.list(config, filter=filter, before=before, limit=limit):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return self.put(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        return self.put_writes(config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return self.delete_thread(thread_id)
+
+    # --- bookkeeping (caller holds the lock) ---
+    def _touch(self, thread_id: str) -> None:
+        self._last_access[thread_id] = time.monotonic()
+        self._last_access.move_to_end(thread_id)
+
+    def _prune_thread(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.max_per_thread:
+            return
+        for checkpoint_id in sorted(checkpoints)[:-self.max_per_thread]:
+            del checkpoints[checkpoint_id]
+            write_key = (thread_id, checkpoint_ns, checkpoint_id)
+            self.writes.pop(write_key, None)
+            self._thread_writes.get(thread_id, set()).discard(write_key)
+
+        # Drop channel blobs no remaining checkpoint of this namespace refers to
+        referenced = set()
+        for saved_checkpoint, _, _ in checkpoints.values():
+            for channel, version in self.serde.loads_typed(saved_checkpoint)["channel_versions"].items():
+                referenced.add((thread_id, checkpoint_ns, channel, version))
+        blobs = self._thread_blobs.get(thread_id, set())
+        for key in [k for k in blobs if k[1] == checkpoint_ns and k not in referenced]:
+            self.blobs.pop(key, None)
+            blobs.discard(key)
+
+    def _recount(self, thread_id: str) -> None:
+        size = 0
+        for checkpoints in self.storage.get(thread_id, {}).values():
+            for saved_checkpoint, saved_metadata, _ in checkpoints.values():
+                size += len(saved_checkpoint[1]) + len(saved_metadata[1])
+        for key in self._thread_blobs.get(thread_id, ()):
+            blob = self.blobs.get(key)
+            if blob is not None:
+                size += len(blob[1])
+        for key in self._thread_writes.get(thread_id, ()):
+            for _, _, value, _ in self.writes.get(key, {}).values():
+                size += len(value[1])
+        self._total_bytes += size - self._thread_bytes.get(thread_id, 0)
+        self._thread_bytes[thread_id] = size
+
+    def _evict(self, keep: str = None) -> None:
+        cutoff = time.monotonic() - self.ttl_seconds if self.ttl_seconds > 0 else None
+        while self._last_access:
+            thread_id, last_access = next(iter(self._last_access.items()))
+            if thread_id == keep:
+                break
+            expired = cutoff is not None and last_access < cutoff
+            if not (expired or len(self._last_access) > self.max_threads or self._total_bytes > self.max_bytes):
+                break
+            self.delete_thread(thread_id)
+
+
+class SqliteCheckpointSaver(BaseCheckpointSaver):
+    """
+    Checkpoint saver backed by a SQLite file shared by every worker process.
+
+    Checkpoints are stored whole (channel values included), together with the
+    pending writes of each checkpoint and the last access time of each
+    thread, which drives TTL eviction. The database runs in WAL mode so
+    readers in other workers are not blocked by a writer.
+    """
+
+    def __init__(
+        self,
+        path: str = None,
+        ttl_seconds: float = None,
+        max_per_thread: int = None,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.path = path or Config.CHECKPOINTER_SQLITE_PATH
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else Config.CHECKPOINT_TTL_SECONDS
+        self.max_per_thread = max(1, max_per_thread or Config.CHECKPOINT_MAX_PER_THREAD)
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._last_sweep = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily and reopened after a fork: a connection must not cross processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                conn.executescript(
+                    """
+                    CREATE TABLE IF NOT EXISTS checkpoints (
+                        thread_id TEXT NOT NULL,
+                        checkpoint_ns TEXT NOT NULL DEFAULT '',
+                        checkpoint_id TEXT NOT NULL,
+                        parent_checkpoint_id TEXT,
+                        type TEXT,
+                        checkpoint BLOB,
+                        metadata_type TEXT,
+                        metadata BLOB,
+                        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                    );
+                    CREATE TABLE IF NOT EXISTS writes (
+                        thread_id TEXT NOT NULL,
+                        checkpoint_ns TEXT NOT NULL DEFAULT '',
+                        checkpoint_id TEXT NOT NULL,
+                        task_id TEXT NOT NULL,
+                        idx INTEGER NOT NULL,
+                        channel TEXT NOT NULL,
+                        type TEXT,
+                        value BLOB,
+                        task_path TEXT NOT NULL DEFAULT '',
+                        PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                    );
+                    CREATE TABLE IF NOT EXISTS threads (
+                        thread_id TEXT PRIMARY KEY,
+                        last_access REAL NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS threads_last_access ON threads (last_access);
+                    """
+                )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _row_to_tuple(self, conn, thread_id: str, row) -> CheckpointTuple:
+        checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata_type, metadata = row
+        writes = conn.execute(
+            "SELECT task_id, channel, type, value FROM writes "
+            "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ? "
+            "ORDER BY task_path, task_id, idx",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchall()
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((type_, checkpoint)),
+            metadata=self.serde.loads_typed((metadata_type, metadata)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, channel, value_type, value in writes
+            ],
+        )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        columns = "checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata"
+        with self._lock:
+            conn = self._connection()
+            if checkpoint_id := get_checkpoint_id(config):
+                row = conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                    (thread_id, checkpoint_ns, checkpoint_id),
+                ).fetchone()
+            else:
+                row = conn.execute(
+                    f"SELECT {columns} FROM checkpoints "
+                    "WHERE thread_id = ? AND checkpoint_ns = ? ORDER BY checkpoint_id DESC LIMIT 1",
+                    (thread_id, checkpoint_ns),
+                ).fetchone()
+            if row is None:
+                return None
+            return self._row_to_tuple(conn, thread_id, row)
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        query = (
+            "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, "
+            "metadata_type, metadata FROM checkpoints"
+        )
+        where, params = [], []
+        if config:
+            where.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if (checkpoint_ns := config["configurable"].get("checkpoint_ns")) is not None:
+                where.append("checkpoint_ns = ?")
+                params.append(checkpoint_ns)
+            if checkpoint_id := get_checkpoint_id(config):
+                where.append("checkpoint_id = ?")
+                params.append(checkpoint_id)
+        if before and (before_id := get_checkpoint_id(before)):
+            where.append("checkpoint_id < ?")
+            params.append(before_id)
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        query += " ORDER BY checkpoint_id DESC"
+
+        results = []
+        with self._lock:
+            conn = self._connection()
+            for thread_id, *row in conn.execute(query, params).fetchall():
+                item = self._row_to_tuple(conn, thread_id, row)
+                # Metadata is serialized, so filtering happens here rather than in SQL
+                if filter and not all(item.metadata.get(k) == v for k, v in filter.items()):
+                    continue
+                results.append(item)
+                if limit is not None and len(results) >= limit:
+                    break
+        return iter(results)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        type_, serialized_checkpoint = self.serde.dumps_typed(checkpoint)
+        metadata_type, serialized_metadata = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints "
+                    "(thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        thread_id,
+                        checkpoint_ns,
+                        checkpoint["id"],
+                        config["configurable"].get("checkpoint_id"),
+                        type_,
+                        serialized_checkpoint,
+                        metadata_type,
+                        serialized_metadata,
+                    ),
+                )
+                self._touch(conn, thread_id)
+                self._prune_thread(conn, thread_id, checkpoint_ns)
+            self._maybe_sweep(conn)
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+        # Special channels (errors, interrupts) replace earlier writes; regular ones are written once
+        verb = "INSERT OR REPLACE" if all(channel in WRITES_IDX_MAP for channel, _ in writes) else "INSERT OR IGNORE"
+        rows = []
+        for idx, (channel, value) in enumerate(writes):
+            value_type, serialized = self.serde.dumps_typed(value)
+            rows.append((
+                thread_id, checkpoint_ns, checkpoint_id, task_id, WRITES_IDX_MAP.get(channel, idx),
+                channel, value_type, serialized, task_path,
+            ))
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.executemany(
+                    f"{verb} INTO writes "
+                    "(thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                for table in ("checkpoints", "writes", "threads"):
+                    conn.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, task_path: str = "") -> None:
+        return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # --- bookkeeping (caller holds the lock) ---
+    def _touch(self, conn, thread_id: str) -> None:
+        conn.execute(
+            "INSERT INTO threads (thread_id, last_access) VALUES (?, ?) "
+            "ON CONFLICT(thread_id) DO UPDATE SET last_access = excluded.last_access",
+            (thread_id, time.time()),
+        )
+
+    def _prune_thread(self, conn, thread_id: str, checkpoint_ns: str) -> None:
+        keep = (
+            "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+            "ORDER BY checkpoint_id DESC LIMIT ?"
+        )
+        args = (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_per_thread)
+        for table in ("checkpoints", "writes"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ({keep})",
+                args,
+            )
+
+    def _maybe_sweep(self, conn) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        now = time.monotonic()
+        if now - self._last_sweep < min(SQLITE_SWEEP_INTERVAL, self.ttl_seconds):
+            return
+        self._last_sweep = now
+        expired = "SELECT thread_id FROM threads WHERE last_access < ?"
+        cutoff = time.time() - self.ttl_seconds
+        try:
+            with conn:
+                for table in ("checkpoints", "writes"):
+                    conn.execute(f"DELETE FROM {table} WHERE thread_id IN ({expired})", (cutoff,))
+                conn.execute("DELETE FROM threads WHERE last_access < ?", (cutoff,))
+        except sqlite3.Error as e:
+            print(f"❌ Failed to evict expired checkpoints: {e}")
+
+
+_checkpointer: Optional[BaseCheckpointSaver] = None
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """
+    Return the process-wide checkpointer selected by Config.CHECKPOINTER_BACKEND
+    ('memory' or 'sqlite').
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        if Config.CHECKPOINTER_BACKEND == "sqlite":
+            _checkpointer = SqliteCheckpointSaver()
+        else:
+            _checkpointer = BoundedMemorySaver()
+    return _checkpointer
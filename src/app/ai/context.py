@@ -0,0 +1,128 @@
+"""
+Prompt context for the agent: token-budgeted history and registration facts.
+
+Each LLM call gets the system prompt, the registration facts gathered so far
+and the current turn verbatim. Earlier turns are added newest first while
+they fit in CONTEXT_MAX_TOKENS; tool outputs of earlier turns are shortened
+to CONTEXT_TOOL_RESULT_MAX_CHARS first. What falls out of the window is not
+lost for the flow: the facts (course, registration, card check, payment)
+carry it.
+"""
+from typing import List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately, trim_messages
+
+from app.ai.projection import full_result
+from app.config import Config
+
+
+def merge_facts(current: Optional[dict], update: Optional[dict]) -> dict:
+    """State reducer: later facts overwrite earlier ones, key by key."""
+    merged = dict(current or {})
+    merged.update(update or {})
+    return merged
+
+
+def facts_from_tool_results(call_message: AIMessage, tool_messages: List[BaseMessage]) -> dict:
+    """
+    Pull the registration facts worth remembering out of one round of tool
+    calls (the AI message that made them and the resulting tool messages).
+    """
+    args_by_id = {call["id"]: call["args"] for call in (call_message.tool_calls or [])}
+    facts = {}
+    for message in tool_messages:
+        if not isinstance(message, ToolMessage) or message.status == "error":
+            continue
+        args = args_by_id.get(message.tool_call_id, {})
+        # Facts come from the full result, not the projection the model sees
+        result = full_result(message)
+        status = result.get("status") if isinstance(result, dict) else None
+
+        if message.name == "store_registration_info":
+            user_info = args.get("user_info") or {}
+            legal_name = user_info.get("legalName") or {}
+            facts["course_id"] = args.get("course_id")
+            facts["registration_status"] = status or message.status
+            if status == "success":
+                # A new registration waits for its own payment
+                facts["payment_status"] = "pending"
+            name = " ".join(p for p in (legal_name.get("first"), legal_name.get("last")) if p)
+            if name:
+                facts["name"] = name
+            if user_info.get("email"):
+                facts["email"] = user_info["email"]
+            if user_info.get("areYou"):
+                facts["is_pr"] = "yes" in str(user_info["areYou"]).lower()
+        elif message.name == "validate_pr_card":
+            facts["pr_card_url"] = args.get("image_url")
+            if isinstance(result, dict):
+                facts["pr_card_status"] = status
+                facts["pr_card_valid"] = result.get("is_valid")
+        elif message.name == "check_payment_status":
+            facts["payment_status"] = status or message.status
+        elif message.name == "find_existing_client":
+            facts["existing_client"] = isinstance(result, list) and bool(result)
+    return {k: v for k, v in facts.items() if v is not None}
+
+
+def facts_message(facts: Optional[dict]) -> Optional[SystemMessage]:
+    if not facts:
+        return None
+    lines = "\n".join(f"- {key}: {value}" for key, value in facts.items())
+    return SystemMessage(content=f"Known registration facts (from earlier in this conversation):\n{lines}")
+
+
+def _shorten_tool_result(message: BaseMessage, max_chars: int) -> BaseMessage:
+    if not isinstance(message, ToolMessage) or not isinstance(message.content, str):
+        return message
+    if len(message.content) <= max_chars:
+        return message
+    shortened = message.content[:max_chars] + f"… [{len(message.content) - max_chars} characters omitted]"
+    return message.model_copy(update={"content": shortened})
+
+
+def build_prompt(system_prompt: SystemMessage, messages: List[BaseMessage], facts: Optional[dict] = None,
+                 max_tokens: int = None) -> Tuple[List[BaseMessage], dict]:
+    """
+    Build the message list for one LLM call within the token budget.
+
+    Returns:
+        tuple: (prompt messages, stats dict with 'tokens', 'kept', 'total' and 'budget').
+    """
+    max_tokens = max_tokens or Config.CONTEXT_MAX_TOKENS
+
+    # The current turn starts at the last user message and is always sent whole
+    start = 0
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            start = i
+            break
+    history, current = messages[:start], messages[start:]
+
+    head = [system_prompt]
+    facts_msg = facts_message(facts)
+    if facts_msg is not None:
+        head.append(facts_msg)
+
+    remaining = max_tokens - count_tokens_approximately(head + current)
+    kept = []
+    if history and remaining > 0:
+        history = [_shorten_tool_result(m, Config.CONTEXT_TOOL_RESULT_MAX_CHARS) for m in history]
+        # Starting on a user message keeps tool calls and their results together
+        kept = trim_messages(
+            history,
+            max_tokens=remaining,
+            strategy="last",
+            token_counter=count_tokens_approximately,
+            start_on="human",
+        )
+
+    prompt = head + kept + current
+    stats = {
+        "tokens": count_tokens_approximately(prompt),
+        "kept": len(kept) + len(current),
+        "total": len(messages),
+        "budget": max_tokens,
+    }
+    return prompt, stats
@@ -0,0 +1,104 @@
+"""
+What the LLM sees of a tool result.
+
+Tools return everything they know: OCR token lists, whole CSV rows, the
+full registration record. The model needs a few fields of that, and
+whatever it sees stays in the conversation for every later call. Each tool
+result is therefore projected to a field whitelist (and at most
+TOOL_RESULT_MAX_ROWS rows) before it goes into the tool message. The full
+result is logged and kept as the message's `artifact`, which is stored with
+the conversation but never sent to the model.
+"""
+import json
+from typing import Any, Optional
+
+from langchain_core.messages import ToolMessage
+
+from app.config import Config
+
+REGISTRATION_FIELDS = ("Full_Name", "Email", "Course", "Course_Date", "PR_Status", "Amount_of_Payment", "Payment_Link")
+CLIENT_FIELDS = ("Full_Name", "Email", "Course", "Course_Date", "PR_Status", "Paid")
+REMINDER_FIELDS = ("Full_name", "Email", "Course", "Course Date", "Notified")
+COURSE_FIELDS = ("id", "name", "price", "payment_link")
+CARD_FIELDS = ("status", "message", "is_valid", "doc_type", "confidence", "reasons")
+STATUS_FIELDS = ("status", "message")
+
+
+def _pick(record: Any, fields) -> Any:
+    if not isinstance(record, dict):
+        return record
+    return {field: record[field] for field in fields if field in record}
+
+
+def _rows(rows: list, fields, max_rows: int) -> dict:
+    return {
+        "count": len(rows),
+        "rows": [_pick(row, fields) for row in rows[:max_rows]],
+    }
+
+
+def project_result(tool_name: str, result: Any, max_rows: int = None) -> Any:
+    """
+    The part of `result` worth sending to the LLM.
+
+    Args:
+        tool_name (str): The tool that produced the result.
+        result: The tool's full (JSON-decoded) result.
+        max_rows (int): Maximum rows kept from list results.
+    """
+    max_rows = max_rows or Config.TOOL_RESULT_MAX_ROWS
+
+    if tool_name == "validate_pr_card" and isinstance(result, dict):
+        projected = _pick(result, CARD_FIELDS)
+        if isinstance(projected.get("reasons"), list):
+            projected["reasons"] = projected["reasons"][:max_rows]
+        return projected
+    if tool_name == "store_registration_info" and isinstance(result, dict):
+        projected = _pick(result, STATUS_FIELDS)
+        if isinstance(result.get("data"), dict):
+            projected["data"] = _pick(result["data"], REGISTRATION_FIELDS)
+        return projected
+    if tool_name == "find_existing_client" and isinstance(result, list):
+        return _rows(result, CLIENT_FIELDS, max_rows)
+    if tool_name == "search_nonpaid_email" and isinstance(result, dict):
+        projected = _pick(result, STATUS_FIELDS)
+        if isinstance(result.get("data"), list):
+            projected.update(_rows(result["data"], REMINDER_FIELDS, max_rows))
+        return projected
+    if tool_name == "get_available_courses" and isinstance(result, list):
+        return [_pick(course, COURSE_FIELDS) for course in result]
+    if tool_name == "check_payment_status" and isinstance(result, dict):
+        return _pick(result, STATUS_FIELDS)
+    return result
+
+
+def _decode(content: Any) -> Any:
+    if not isinstance(content, str):
+        return content
+    try:
+        return json.loads(content)
+    except ValueError:
+        return content
+
+
+def project_message(message: ToolMessage) -> ToolMessage:
+    """
+    Replace the content of a tool message with its projection; the full
+    result moves to `artifact`. Error messages are returned unchanged.
+    """
+    if message.status == "error" or message.artifact is not None:
+        return message
+    result = _decode(message.content)
+    projected = project_result(message.name, result)
+    if projected is result:
+        return message
+    content = json.dumps(projected, ensure_ascii=False, default=str)
+    print(f"🔧 Tool {message.name} result ({len(str(message.content))} -> {len(content)} chars for the model): {message.content}")
+    return message.model_copy(update={"content": content, "artifact": result})
+
+
+def full_result(message: ToolMessage) -> Optional[Any]:
+    """The full result of a tool message, whether or not it was projected."""
+    if message.artifact is not None:
+        return message.artifact
+    return _decode(message.content)
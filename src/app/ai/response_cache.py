@@ -0,0 +1,303 @@
+"""
+Response cache for repeated FAQ-style chat turns.
+
+Many turns are the same question in slightly different words ("how much is
+the first aid course?", "what's the PR discount?", "how do I pay?") and get
+the same answer. The entry node looks the user message up here after the
+fast path (app.ai.router) and, on a hit, replies without calling the LLM.
+Turns the agent answered are stored when the turn ends.
+
+A cached answer must be valid for anyone who asks the same thing, so the key
+holds everything the answer may depend on besides the wording: the
+registration step, the course catalog version and the course/PR facts. Only
+turns with no side effects (no tool call other than `get_available_courses`)
+and no personal data (images, email addresses, numbers, names, the user's
+own registration facts) are stored or looked up. Messages that only make
+sense in context ("yes", "how much is it?") are left to the agent. A reply
+may also pick up what the user said in earlier turns ("Jane, we offer
+..."), so a reply is only stored when it repeats none of the words of the
+earlier user messages, beyond common words and those of the question itself.
+
+Lookups are exact on the normalized text first, then by character-trigram
+similarity within the same key, but only against entries with the same
+content words: every word except filler and function words, so negations
+("non", "not") and question words ("when", "where", "how much") count. A
+reworded question may differ in word order and filler, never in a word that
+changes what is asked ("price for non PR holders" is not "price for PR
+holders", "where is" is not "when is"). Entries expire after RESPONSE_CACHE_TTL
+seconds and the least recently used ones go when the cache is full. The
+cache lives in the worker process; each gunicorn worker fills its own.
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from app.ai.tools import get_available_courses
+from app.config import Config
+from app.utils import metrics
+
+# Tools a cached turn may have called: read-only and the same for everyone
+CACHEABLE_TOOLS = {"get_available_courses"}
+
+# Facts that do not identify the user; any other fact makes the turn personal
+SHARED_FACTS = ("course_id", "is_pr")
+
+MIN_WORDS = 2
+MAX_CACHED_LENGTH = 200
+
+PERSONAL_DATA_RE = re.compile(
+    r"[\w.+-]+@[\w-]+\.[\w.-]+"                        # email address
+    r"|\d{3,}"                                          # phone, card, order or registration number
+    r"|\b(my name|i am called|i'm called|call me|my email|my phone|my card|my address|i paid|i have paid)\b",
+    re.IGNORECASE,
+)
+# Replies quote prices, so only addresses and long numbers count there
+REPLY_PERSONAL_DATA_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+|\d{6,}")
+# Function words a reply may share with earlier user messages without quoting them
+COMMON_WORDS = {"i", "you", "we", "me", "is", "are", "am", "be", "to", "for", "of", "in", "on", "at", "and",
+                "or", "with", "can", "do", "does", "want", "would", "like", "have", "has", "what", "how",
+                "which", "your", "our", "not", "if", "will", "about", "there", "here", "from", "by", "as"}
+# Words that may differ between two wordings of the same question; every other
+# word (negations and question words included) must be the same for a fuzzy hit
+NEUTRAL_WORDS = {"i", "you", "we", "me", "is", "are", "am", "be", "to", "of", "in", "on", "at", "can", "could",
+                 "do", "does", "would", "will", "want", "like", "your", "our", "tell", "know", "there", "about"}
+# Words whose meaning comes from earlier turns
+CONTEXT_WORDS = {"it", "that", "this", "these", "those", "them", "one", "same", "above", "yes", "no", "ok", "okay"}
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+CONTRACTIONS = {"what's": "what is", "how's": "how is", "where's": "where is", "when's": "when is",
+                "who's": "who is", "there's": "there is", "it's": "it is", "i'm": "i am", "can't": "cannot",
+                "don't": "do not", "doesn't": "does not", "i'd": "i would", "you're": "you are"}
+# Words that do not change what is asked
+FILLER_WORDS = {"please", "pls", "the", "a", "an", "hi", "hello", "hey", "thanks", "thank", "just", "so", "um"}
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, expand contractions."""
+    words = []
+    for word in _WORD_RE.findall(text.lower()):
+        words.extend(CONTRACTIONS.get(word, word).split())
+    return " ".join(word for word in words if word not in FILLER_WORDS)
+
+
+def trigrams(text: str) -> FrozenSet[str]:
+    padded = f" {text} "
+    return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+def content_words(text: str) -> FrozenSet[str]:
+    """The words of a normalized message that decide what is asked (see NEUTRAL_WORDS)."""
+    return frozenset(word for word in text.split() if word not in NEUTRAL_WORDS)
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """Jaccard similarity of two trigram sets."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def catalog_version() -> str:
+    """Short hash of the course catalog; a changed catalog invalidates every entry."""
+    courses = get_available_courses.func()
+    return hashlib.sha1(json.dumps(courses, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def _message_text(message: BaseMessage) -> Optional[str]:
+    """The text of a user message, or None if it is not plain text."""
+    if isinstance(message.content, str):
+        return message.content.strip()
+    if all(isinstance(part, dict) and part.get("type") == "text" for part in message.content):
+        return " ".join(part.get("text", "") for part in message.content).strip()
+    return None
+
+
+def _words(message: BaseMessage) -> FrozenSet[str]:
+    """The lowercase words of a message's text parts (images ignored)."""
+    if isinstance(message.content, str):
+        text = message.content
+    else:
+        text = " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in message.content)
+    return frozenset(_WORD_RE.findall(text.lower()))
+
+
+def cacheable_text(message: BaseMessage) -> Optional[str]:
+    """
+    The normalized text of a user message that may be answered from the
+    cache, or None if the message carries an image, personal data or
+    depends on earlier turns.
+    """
+    if not isinstance(message, HumanMessage) or message.additional_kwargs.get("upload_url"):
+        return None
+    text = _message_text(message)
+    if not text or len(text) > MAX_CACHED_LENGTH or PERSONAL_DATA_RE.search(text):
+        return None
+    normalized = normalize(text)
+    words = normalized.split()
+    if len(words) < MIN_WORDS or CONTEXT_WORDS.intersection(words):
+        return None
+    return normalized
+
+
+def cache_key(step: str, facts: Optional[dict]) -> Optional[Tuple]:
+    """
+    Everything besides the wording a cached answer depends on, or None if
+    the conversation already holds personal facts.
+    """
+    facts = facts or {}
+    if any(key not in SHARED_FACTS for key in facts):
+        return None
+    return (step, catalog_version()) + tuple(facts.get(key) for key in SHARED_FACTS)
+
+
+def cacheable_turn(turn: List[BaseMessage], history: List[BaseMessage] = ()) -> Optional[str]:
+    """
+    The reply of a finished agent turn (user message first) if it may be
+    stored: no tool with side effects, no failed tool, plain text reply
+    without personal data, and none of the words the user wrote in the
+    earlier turns (`history`) besides common words and the question's own.
+    """
+    for message in turn[1:]:
+        if isinstance(message, AIMessage) and any(call["name"] not in CACHEABLE_TOOLS for call in message.tool_calls):
+            return None
+        if isinstance(message, ToolMessage) and message.status == "error":
+            return None
+    reply = turn[-1]
+    if len(turn) < 2 or not isinstance(reply, AIMessage) or reply.tool_calls or not isinstance(reply.content, str):
+        return None
+    if not reply.content.strip() or REPLY_PERSONAL_DATA_RE.search(reply.content):
+        return None
+    earlier = set()
+    for message in history:
+        if isinstance(message, HumanMessage):
+            earlier |= _words(message)
+    if earlier:
+        earlier -= COMMON_WORDS | FILLER_WORDS | CONTEXT_WORDS | _words(turn[0])
+        if earlier & _words(reply):
+            return None
+    return reply.content
+
+
+class _Entry:
+    __slots__ = ("reply", "grams", "content", "stored_at")
+
+    def __init__(self, reply: str, grams: FrozenSet[str], content: FrozenSet[str], stored_at: float):
+        self.reply = reply
+        self.grams = grams
+        self.content = content
+        self.stored_at = stored_at
+
+
+class ResponseCache:
+    """
+    Thread-safe LRU/TTL cache of agent replies, keyed by (key, normalized text).
+    """
+
+    def __init__(self, max_entries: int = None, ttl: float = None, threshold: float = None):
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = ttl if ttl is not None else Config.RESPONSE_CACHE_TTL
+        self.threshold = threshold if threshold is not None else Config.RESPONSE_CACHE_SIMILARITY
+        self._entries: "OrderedDict[Tuple[Tuple, str], _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return self.ttl > 0 and now - entry.stored_at > self.ttl
+
+    def get(self, key: Tuple, text: str) -> Optional[str]:
+        """
+        The cached reply for `text`, or for a similar enough message with the
+        same content words, under `key`.
+        """
+        now = time.monotonic()
+        with self._lock:
+            found_key, best_score = (key, text), 1.0
+            entry = self._entries.get(found_key)
+            if entry is None or self._expired(entry, now):
+                found_key, best_score = None, self.threshold
+                grams, content = trigrams(text), content_words(text)
+                for candidate_key, candidate in self._entries.items():
+                    if candidate_key[0] != key or candidate.content != content or self._expired(candidate, now):
+                        continue
+                    score = similarity(grams, candidate.grams)
+                    if score >= best_score:
+                        found_key, best_score = candidate_key, score
+                entry = self._entries[found_key] if found_key is not None else None
+            if entry is not None:
+                self._entries.move_to_end(found_key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        metrics.inc("app_response_cache_total", 1, "Response cache lookups by result.",
+                    result="hit" if entry is not None else "miss")
+        if entry is None:
+            return None
+        print(f"💾 Response cache hit (similarity {best_score:.2f})")
+        return entry.reply
+
+    def put(self, key: Tuple, text: str, reply: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._entries[(key, text)] = _Entry(reply, trigrams(text), content_words(text), now)
+            self._entries.move_to_end((key, text))
+            # Expired entries first, then the least recently used
+            for entry_key in [k for k, e in self._entries.items() if self._expired(e, now)]:
+                del self._entries[entry_key]
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        metrics.inc("app_response_cache_stores_total", 1, "Agent replies stored in the response cache.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+response_cache = ResponseCache()
+
+
+def lookup(messages: List[BaseMessage], step: str, facts: Optional[dict]) -> Optional[str]:
+    """
+    The cached reply to the latest user message, or None if there is none or
+    the turn may not be answered from the cache.
+    """
+    if not messages:
+        return None
+    text = cacheable_text(messages[-1])
+    key = cache_key(step, facts) if text else None
+    if key is None:
+        return None
+    return response_cache.get(key, text)
+
+
+def store(messages: List[BaseMessage], step: str, facts: Optional[dict]) -> None:
+    """Store the reply of the turn that just ended, if it may be cached."""
+    start = None
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            start = i
+            break
+    if start is None:
+        return
+    text = cacheable_text(messages[start])
+    key = cache_key(step, facts) if text else None
+    reply = cacheable_turn(messages[start:], messages[:start]) if key is not None else None
+    if reply is not None:
+        response_cache.put(key, text, reply)
@@ -0,0 +1,163 @@
+"""
+Deterministic fast path for routine chat turns.
+
+Greetings, "what courses are there?", picking a course and the yes/no answer
+to the PR question always lead to the same reply, so the entry node answers
+them directly (calling `get_available_courses` itself where needed) instead
+of paying an LLM round trip. Anything else, including every turn with an
+image, goes to the agent.
+
+The router writes its replies to the history like the agent would (tool
+call, tool result, reply with its UI tag), so the LLM sees a normal
+conversation when it takes over.
+"""
+import json
+import re
+import uuid
+from typing import List, Optional
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+
+from app.ai.projection import project_message
+from app.ai.steps import STEP_INTAKE
+from app.ai.tools import get_available_courses
+from app.utils import metrics
+
+GREETING_RE = re.compile(
+    r"^(hi|hello|hey|hiya|bonjour|salut|good (morning|afternoon|evening))( there)?[\s!.,]*$",
+    re.IGNORECASE,
+)
+# Only a plain question about what is on offer; "which course did I register for?"
+# or "do you have a refund policy for courses?" is for the agent
+COURSE_LIST_RE = re.compile(
+    r"^(?:(?:hi|hello|hey)[\s,!.]*)?(?:"
+    r"(?:what|which)\b.*\b(?:courses?|classes|sessions)\b.*\b(?:offer|offered|have|available|there|can i (?:take|register|sign up))\b"
+    r"|(?:what|which) (?:courses?|classes|sessions)"
+    r"|(?:can you |could you |can i |could i |please )?(?:see|show|list|view)(?: me)?(?: the| your| all)?(?: available)? (?:courses?|classes|sessions|course list)\b"
+    r"|(?:do you have|do you offer|are there) (?:any )?(?:courses?|classes|sessions)"
+    r"|(?:available )?(?:courses?|classes|course list)(?: available)?"
+    r")[\s?!.]*$",
+    re.IGNORECASE,
+)
+# Words that show the question is about something else than the catalog
+OTHER_INTENT_RE = re.compile(
+    r"\b(my|mine|i've|do i|have i|am i|paid|pay|payment|registered|did|refund\w*|confirm\w*|cancel\w*|polic(?:y|ies)|status|receipt|invoice)\b",
+    re.IGNORECASE,
+)
+YES_RE = re.compile(r"^(yes|yeah|yep|y|oui|i am|i'm a pr|yes,? i am( a pr)?)[\s!.,]*$", re.IGNORECASE)
+NO_RE = re.compile(r"^(no|nope|n|non|i am not|i'm not|no,? i am not( a pr)?)[\s!.,]*$", re.IGNORECASE)
+
+# Frontend steps in which the message is the course the user picked
+COURSE_SELECTION_STEPS = {"COURSE_SELECTION", "COURSE_SELECTOR", "SHOW_COURSE_SELECTOR", "SELECT_COURSE"}
+
+# Longer messages are left to the LLM; they usually say more than the intent we match
+MAX_ROUTED_LENGTH = 80
+
+# Value of the `awaiting` state key while the router waits for the PR answer
+AWAITING_PR_ANSWER = "pr_answer"
+
+GREETING_REPLY = (
+    "Hello! I'm the registration assistant. I can help you register for a course, "
+    "check your PR card and confirm your payment. Would you like to see the available courses?"
+)
+PR_QUESTION = "Are you a Permanent Resident (PR) of Canada?"
+PR_UPLOAD_REPLY = "Great! Please upload a clear photo of the front of your PR card. [SHOW_UPLOAD]"
+REGISTRATION_FORM_REPLY = "Thanks! Please fill out the registration details. [SHOW_REGISTRATION_FORM]"
+
+
+def _text(message: BaseMessage) -> Optional[str]:
+    """The text of a user message, or None if it carries an image."""
+    if isinstance(message.content, str):
+        return message.content.strip()
+    parts = []
+    for part in message.content:
+        if isinstance(part, dict) and part.get("type") == "image_url":
+            return None
+        if isinstance(part, dict) and part.get("type") == "text":
+            parts.append(part.get("text", ""))
+        elif isinstance(part, str):
+            parts.append(part)
+    return " ".join(parts).strip()
+
+
+def _match_course(text: str, courses: List[dict], exact: bool = True) -> Optional[dict]:
+    normalized = text.lower().strip(" .!?")
+    for course in courses:
+        if normalized in (course["id"].lower(), course["name"].lower()):
+            return course
+    if not exact:
+        # In the course selection step a partial name ("first aid") is enough
+        for course in courses:
+            if len(normalized) >= 4 and normalized in course["name"].lower():
+                return course
+    return None
+
+
+def _course_list_reply(courses: List[dict]) -> str:
+    lines = "\n".join(f"- {course['name']} (${course['price']})" for course in courses)
+    return f"Here are the courses you can register for:\n{lines}\n\nWhich one would you like? [SHOW_COURSE_SELECTOR]"
+
+
+def _tool_round(name: str, args: dict, result) -> List[BaseMessage]:
+    # Record the direct tool call the way ToolNode would, so the history stays well-formed
+    call_id = f"call_fastpath_{uuid.uuid4().hex[:16]}"
+    return [
+        AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": call_id}]),
+        project_message(ToolMessage(content=json.dumps(result), tool_call_id=call_id, name=name)),
+    ]
+
+
+def route_turn(messages: List[BaseMessage], current_step: Optional[str] = None,
+               awaiting: Optional[str] = None, step: str = STEP_INTAKE) -> Optional[dict]:
+    """
+    Answer the latest user message without the LLM if it is a routine turn.
+
+    Args:
+        messages (list): The conversation, ending with the new user message.
+        current_step (str): The frontend step sent with the message.
+        awaiting (str): What the router asked for last turn, if anything.
+        step (str): The registration step (app.ai.steps); the course list is
+            only answered while the user is still choosing (intake).
+
+    Returns:
+        dict | None: The state update (messages, facts, awaiting) for a routed
+        turn, or None to hand the turn to the agent.
+    """
+    if not messages or not isinstance(messages[-1], HumanMessage):
+        return None
+    text = _text(messages[-1])
+    if not text or len(text) > MAX_ROUTED_LENGTH:
+        return None
+    frontend_step = (current_step or "").upper()
+
+    intent, new_messages, facts, next_awaiting = None, [], {}, None
+    if awaiting == AWAITING_PR_ANSWER and YES_RE.match(text):
+        intent, facts = "pr_yes", {"is_pr": True}
+        new_messages.append(AIMessage(content=PR_UPLOAD_REPLY))
+    elif awaiting == AWAITING_PR_ANSWER and NO_RE.match(text):
+        intent, facts = "pr_no", {"is_pr": False}
+        new_messages.append(AIMessage(content=REGISTRATION_FORM_REPLY))
+    elif GREETING_RE.match(text):
+        intent = "greeting"
+        new_messages.append(AIMessage(content=GREETING_REPLY))
+    else:
+        # The plain function: matching must not show up as a tool run
+        courses = get_available_courses.func()
+        course = _match_course(text, courses, exact=frontend_step not in COURSE_SELECTION_STEPS)
+        if course is not None:
+            intent, facts, next_awaiting = "course_selected", {"course_id": course["id"]}, AWAITING_PR_ANSWER
+            new_messages.append(AIMessage(content=f"You picked {course['name']} (${course['price']}). {PR_QUESTION}"))
+        elif step == STEP_INTAKE and COURSE_LIST_RE.match(text) and not OTHER_INTENT_RE.search(text):
+            intent = "course_list"
+            courses = get_available_courses.invoke({})
+            new_messages.extend(_tool_round(get_available_courses.name, {}, courses))
+            new_messages.append(AIMessage(content=_course_list_reply(courses)))
+
+    if intent is None:
+        return None
+    print(f"⚡ Fast path: {intent}")
+    metrics.inc("app_fast_path_total", 1, "Chat turns answered without an LLM call.", intent=intent)
+    update = {"messages": new_messages, "awaiting": next_awaiting}
+    if facts:
+        update["facts"] = facts
+    return update
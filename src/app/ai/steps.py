@@ -0,0 +1,42 @@
+"""
+Registration steps and the tools the agent may use in each of them.
+
+The step is derived from the registration facts (see app.ai.context) and
+kept in the graph state. Each LLM call binds only its step's tools, and the
+tool node only runs those. Back-office tools (`search_nonpaid_email`) are
+only available in the staff step, which needs the staff token (see
+app.ai.chat_request).
+"""
+from typing import Optional
+
+STEP_INTAKE = "intake"        # course choice, PR card, registration form
+STEP_PAYMENT = "payment"      # registration stored, waiting for payment
+STEP_DONE = "done"            # paid; may start another registration
+STEP_STAFF = "staff"          # back office: every tool
+
+# Frontend `current_step` value that selects the staff step
+STAFF_FRONTEND_STEP = "STAFF"
+
+INTAKE_TOOLS = ("get_available_courses", "find_existing_client", "validate_pr_card", "store_registration_info")
+
+STEP_TOOLS = {
+    STEP_INTAKE: INTAKE_TOOLS,
+    # store_registration_info stays so the user can still correct their details
+    STEP_PAYMENT: ("check_payment_status", "store_registration_info", "get_available_courses"),
+    STEP_DONE: INTAKE_TOOLS,
+    STEP_STAFF: INTAKE_TOOLS + ("check_payment_status", "search_nonpaid_email"),
+}
+
+
+def registration_step(facts: Optional[dict], current_step: Optional[str] = None) -> str:
+    """
+    The registration step for the known facts and the frontend step.
+    """
+    if (current_step or "").upper() == STAFF_FRONTEND_STEP:
+        return STEP_STAFF
+    facts = facts or {}
+    if facts.get("payment_status") == "success":
+        return STEP_DONE
+    if facts.get("registration_status") == "success":
+        return STEP_PAYMENT
+    return STEP_INTAKE
@@ -0,0 +1,181 @@
+"""
+Executes the tool calls of one agent step.
+
+Independent calls run at the same time on a bounded, process-wide thread
+pool (TOOL_WORKERS), so a step takes as long as its slowest tool rather than
+the sum of all of them. Tools that read and then write the same store take
+that store's lock, so their steps don't interleave. Each CSV read-modify-write
+is also atomic on its own (`database_utils.csv_lock`), which covers writers
+that hold no store lock, such as `validate_pr_card` saving its verdict. Every
+call has a timeout, counted from the start of the step (waiting for a worker
+or a store lock included). A call that fails or times out becomes an error
+tool message the model can react to, like `ToolNode` does.
+
+A timed-out call is not stopped: Python cannot interrupt a running thread,
+so the tool finishes in the background and keeps its store lock until then.
+Calls waiting for that lock give up at their own deadline instead of
+blocking a worker thread indefinitely.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextvars import copy_context
+from typing import Dict, List, Optional
+
+from langchain_core.messages import ToolMessage
+
+from app.ai.projection import project_message
+from app.config import Config
+from app.utils import profiler
+
+# Tool -> store it reads and then writes; tools on the same store run one at a time.
+# validate_pr_card and search_nonpaid_email are left out on purpose: they would
+# hold the lock during OCR / while the reminders are sent, and their CSV updates
+# are already atomic under database_utils.csv_lock (the reminder run itself is
+# serialized across processes by the reminders lock of reminder_service).
+TOOL_STORES = {
+    "store_registration_info": "registrations",
+    "check_payment_status": "registrations",
+    "find_existing_client": "registrations",
+}
+
+# Seconds; tools not listed use TOOL_TIMEOUT
+TOOL_TIMEOUTS = {
+    "validate_pr_card": 120.0,      # image fetch + OCR / Textract
+    "search_nonpaid_email": 300.0,  # sends one email per unpaid registration
+}
+
+_store_locks: Dict[str, threading.Lock] = {}
+_store_locks_guard = threading.Lock()
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_guard = threading.Lock()
+
+
+def store_lock(tool_name: str):
+    """The lock of the store `tool_name` uses, or None if it uses no store."""
+    store = TOOL_STORES.get(tool_name)
+    if store is None:
+        return None
+    with _store_locks_guard:
+        lock = _store_locks.get(store)
+        if lock is None:
+            lock = _store_locks[store] = threading.Lock()
+        return lock
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # Created on first use, so a process forked after import gets its own threads
+    global _pool
+    with _pool_guard:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=Config.TOOL_WORKERS, thread_name_prefix="tool")
+        return _pool
+
+
+def _error_message(call: dict, error: str) -> ToolMessage:
+    return ToolMessage(
+        content=f"Error: {error}\n Please fix your mistakes.",
+        name=call["name"],
+        tool_call_id=call["id"],
+        status="error",
+    )
+
+
+class ToolExecutor:
+    """
+    Runs tool calls for a fixed set of tools. Built once per step when the
+    graph is compiled; calls to tools outside the set are answered with an
+    error instead of running.
+    """
+
+    def __init__(self, tools: list, default_timeout: float = None):
+        self.tools = {t.name: t for t in tools}
+        self.default_timeout = default_timeout or Config.TOOL_TIMEOUT
+
+    def timeout(self, tool_name: str) -> float:
+        return TOOL_TIMEOUTS.get(tool_name, self.default_timeout)
+
+    def _invoke(self, call: dict, config: Optional[dict], deadline: float = None) -> ToolMessage:
+        lock = store_lock(call["name"])
+        if lock is not None:
+            wait = -1 if deadline is None else max(0.0, deadline - time.monotonic())
+            # A timed-out call may still hold the lock; don't wait past this call's own deadline
+            if not lock.acquire(timeout=wait):
+                print(f"❌ Tool {call['name']} timed out waiting for its store")
+                return _error_message(call, f"{call['name']} timed out")
+        try:
+            # This worker thread is sampled with the request, whichever thread the callbacks fire on
+            with profiler.join_active_profile():
+                message = self.tools[call["name"]].invoke({**call, "type": "tool_call"}, config)
+            # The model gets a compact projection; the full result stays in the artifact
+            return project_message(message)
+        except Exception as e:
+            print(f"❌ Tool {call['name']} failed: {e}")
+            return _error_message(call, repr(e))
+        finally:
+            if lock is not None:
+                lock.release()
+
+    def _unknown(self, call: dict) -> Optional[ToolMessage]:
+        if call["name"] in self.tools:
+            return None
+        return _error_message(call, f"{call['name']} is not a valid tool, try one of [{', '.join(self.tools)}].")
+
+    def run(self, tool_calls: List[dict], config: Optional[dict] = None) -> List[ToolMessage]:
+        """
+        Run `tool_calls` concurrently and return their tool messages in call order.
+        """
+        pool = _get_pool()
+        start = time.monotonic()
+        # Each worker runs in a copy of this context, so request metrics and profiling follow the call
+        pending = [
+            (call, self._unknown(call) or pool.submit(copy_context().run, self._invoke, call, config,
+                                                      start + self.timeout(call["name"])))
+            for call in tool_calls
+        ]
+        results = []
+        for call, future in pending:
+            if isinstance(future, ToolMessage):
+                results.append(future)
+                continue
+            remaining = max(0.0, start + self.timeout(call["name"]) - time.monotonic())
+            try:
+                results.append(future.result(timeout=remaining))
+            except FutureTimeoutError:
+                # Only drops a call still queued for a worker; a running tool finishes in the background
+                future.cancel()
+                print(f"❌ Tool {call['name']} timed out after {self.timeout(call['name'])}s")
+                results.append(_error_message(call, f"{call['name']} timed out"))
+        return results
+
+    async def arun(self, tool_calls: List[dict], config: Optional[dict] = None) -> List[ToolMessage]:
+        """
+        Async variant of `run`. Tools with a coroutine and no store run on the
+        event loop; the rest go to the same thread pool as the sync path.
+        """
+        pool = _get_pool()
+
+        async def one(call: dict) -> ToolMessage:
+            unknown = self._unknown(call)
+            if unknown is not None:
+                return unknown
+            tool = self.tools[call["name"]]
+            try:
+                if tool.coroutine is not None and call["name"] not in TOOL_STORES:
+                    message = await asyncio.wait_for(
+                        tool.ainvoke({**call, "type": "tool_call"}, config), self.timeout(call["name"])
+                    )
+                    return project_message(message)
+                future = pool.submit(copy_context().run, self._invoke, call, config,
+                                     time.monotonic() + self.timeout(call["name"]))
+                return await asyncio.wait_for(asyncio.wrap_future(future), self.timeout(call["name"]))
+            except asyncio.TimeoutError:
+                print(f"❌ Tool {call['name']} timed out after {self.timeout(call['name'])}s")
+                return _error_message(call, f"{call['name']} timed out")
+            except Exception as e:
+                print(f"❌ Tool {call['name']} failed: {e}")
+                return _error_message(call, repr(e))
+
+        return list(await asyncio.gather(*(one(call) for call in tool_calls)))
@@ -1,6 +1,6 @@
 from langchain_core.tools import tool
 
-from app.tools import registration_extraction, identification_service, payment_extraction, reminder_nonpaid_email
+from app.tools import registration_extraction, identification_service, aidentification_service, payment_extraction, reminder_nonpaid_email
 from app.utils.database_utils import get_from_csv
 
 # Database Simulation (Replace with your actual Supabase/SQL logic)
@@ -89,6 +89,15 @@ def validate_pr_card(image_url: str, user_info: dict) -> dict:
         return identification_data.dict()
     return identification_data
 
+async def _avalidate_pr_card(image_url: str, user_info: dict) -> dict:
+    # Async path (ASGI server): non-blocking image fetch, OCR on the OCR executor
+    identification_data = await aidentification_service(image_url, user_info)
+    if hasattr(identification_data, "dict"):
+        return identification_data.dict()
+    return identification_data
+
+validate_pr_card.coroutine = _avalidate_pr_card
+
 # --- TOOL 4: Payment Verification (The "Accountant" Tool) ---
 @tool()
 def check_payment_status(email_id: str, subject: str, body: str) -> dict:
@@ -110,12 +119,13 @@ def check_payment_status(email_id: str, subject: str, body: str) -> dict:
 
 # --- TOOL 5: Send Notification (The "Reminder" Tool) ---
 @tool()
-def search_nonpaid_email() -> list[dict]:
+def search_nonpaid_email() -> dict:
     """
-    Searches for records of users who registered yesterday but have not yet paid.
+    Finds the users who registered yesterday but have not yet paid, and emails each of them a payment reminder
+    (users already reminded are skipped).
     
     Returns:
-        list[dict]: A list of unpaid registration records.
+        dict: 'status', 'message' and under 'data' the unpaid registration records, 'Notified' telling whether the reminder was sent.
     """
     # The underlying function doesn't take arguments based on the previous code
     reminder_result = reminder_nonpaid_email()
@@ -0,0 +1,130 @@
+import base64
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Callable, Optional
+
+from PIL import Image, ImageOps
+
+from app.config import Config
+
+# Vision detail per frontend step. Card uploads only need a glance from the
+# model; the real verification happens in `validate_pr_card` (OCR).
+VISION_DETAIL_BY_STEP = {
+    "UPLOAD": "low",
+    "PR_UPLOAD": "low",
+    "SHOW_UPLOAD": "low",
+}
+
+# Long edge (low) / short edge (high) the model actually looks at; anything larger is wasted bytes
+LOW_DETAIL_EDGE = 512
+HIGH_DETAIL_SHORT_EDGE = 768
+HIGH_DETAIL_LONG_EDGE = 2048
+
+
+@dataclass(frozen=True)
+class PreparedImage:
+    """An image downscaled and encoded once for the chat LLM."""
+    jpeg: bytes
+    b64: str
+    detail: str
+    width: int
+    height: int
+
+    @property
+    def data_uri(self) -> str:
+        return f"data:image/jpeg;base64,{self.b64}"
+
+    @property
+    def size(self) -> int:
+        return len(self.jpeg) + len(self.b64)
+
+
+def choose_vision_detail(current_step: Optional[str]) -> str:
+    """
+    Pick the vision detail level ('low' | 'high' | 'auto') for the current step.
+    """
+    if current_step:
+        detail = VISION_DETAIL_BY_STEP.get(current_step.upper())
+        if detail:
+            return detail
+    return Config.VISION_DEFAULT_DETAIL
+
+
+def prepare_image(image_bytes: bytes, detail: str) -> PreparedImage:
+    """
+    Downscale an image to the size the model uses for `detail` and encode it
+    as a JPEG plus its base64 string.
+    """
+    with Image.open(BytesIO(image_bytes)) as img:
+        img = ImageOps.exif_transpose(img)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        if detail == "low":
+            img.thumbnail((LOW_DETAIL_EDGE, LOW_DETAIL_EDGE), Image.LANCZOS)
+        else:
+            width, height = img.size
+            scale = min(1.0, HIGH_DETAIL_LONG_EDGE / max(width, height), HIGH_DETAIL_SHORT_EDGE / min(width, height))
+            if scale < 1.0:
+                img = img.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+        out = BytesIO()
+        img.save(out, format="JPEG", quality=Config.VISION_JPEG_QUALITY, optimize=True)
+        jpeg = out.getvalue()
+        return PreparedImage(
+            jpeg=jpeg,
+            b64=base64.b64encode(jpeg).decode("ascii"),
+            detail=detail,
+            width=img.size[0],
+            height=img.size[1],
+        )
+
+
+class PreparedImageCache:
+    """
+    Thread-safe LRU cache of prepared images keyed by (upload ID, detail),
+    bounded by entry count and total bytes.
+    """
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = max_entries or Config.VISION_CACHE_MAX_ENTRIES
+        self.max_bytes = max_bytes or Config.VISION_CACHE_MAX_BYTES
+        self._entries: "OrderedDict[tuple, PreparedImage]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, upload_id: str, detail: str, loader: Callable[[], Optional[bytes]]) -> Optional[PreparedImage]:
+        """
+        Return the prepared image for `upload_id`, preparing it from
+        `loader()` (which returns the stored bytes or None) on a miss.
+        """
+        key = (upload_id, detail)
+        with self._lock:
+            prepared = self._entries.get(key)
+            if prepared is not None:
+                self._entries.move_to_end(key)
+                return prepared
+
+        image_bytes = loader()
+        if image_bytes is None:
+            return None
+        prepared = prepare_image(image_bytes, detail)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = prepared
+                self._bytes += prepared.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+        return prepared
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+prepared_images = PreparedImageCache()
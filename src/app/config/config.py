@@ -1,5 +1,6 @@
 import json
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 # Load environment variables from the .env file
@@ -33,6 +34,62 @@ class Config:
     - FLASK_PORT: port to run the Flask app on (default: 5000)
     - FLASK_DEBUG: enable/disable debug mode (default: true)
     - REGION_NAME: AWS region (default: us-east-1)
+    - AWS_ENDPOINT_URL: override S3/Textract endpoint, e.g. a local stand-in (default: AWS)
+    - TEXTRACT_BATCH_CONCURRENCY: max concurrent async Textract jobs (default: 4)
+    - TEXTRACT_POLL_INTERVAL: seconds between Textract job polls (default: 2.0)
+    - TEXTRACT_JOB_TIMEOUT: seconds to wait for one Textract job (default: 300)
+    - OCR_WORKERS: threads for OCR under the async server (default: 4)
+    - STORAGE_BACKEND: where uploads are stored, 'local' or 's3' (default: local)
+    - UPLOADS_DIR: directory for the local storage backend (default: <repo>/uploads)
+    - UPLOAD_MAX_BYTES: maximum upload size in bytes (default: 10 MB)
+    - S3_UPLOAD_PREFIX: S3 key prefix for uploads (default: uploads)
+    - S3_MULTIPART_PART_SIZE: multipart part size in bytes, min 5 MB (default: 8 MB)
+    - UPLOAD_NORMALIZE: normalize uploaded images before storing them (default: true)
+    - UPLOAD_MAX_EDGE: maximum long edge in pixels of normalized uploads (default: 2000)
+    - UPLOAD_JPEG_QUALITY: JPEG quality of normalized uploads (default: 85)
+    - UPLOAD_KEEP_ORIGINAL: also store the untouched original under originals/ (default: false)
+    - VISION_DEFAULT_DETAIL: vision detail for chat images outside card steps (default: auto)
+    - METRICS_ENABLED: per-request stage timing, JSON timing logs and /metrics (default: false)
+    - METRICS_DIR: directory where workers share metrics snapshots (default: unset, per worker only)
+    - PROFILE_ADMIN_TOKEN: requests with header X-Profile-Token=<token> are profiled (default: unset)
+    - PROFILE_SAMPLE_RATE: fraction of requests/tool runs profiled at random (default: 0)
+    - PROFILE_DIR / PROFILE_MAX_FILES / PROFILE_MAX_AGE_HOURS: where profiles go and retention (default: <repo>/profiles, 200, 72)
+    - VISION_CACHE_MAX_ENTRIES / VISION_CACHE_MAX_BYTES: prepared-image cache bounds (default: 256 / 64 MB)
+    - STAFF_TOKEN: chat requests with current_step=STAFF and header X-Staff-Token=<token> get the back-office tools (default: unset)
+    - TOOL_WORKERS: threads running agent tool calls, shared by all requests (default: 8)
+    - TOOL_TIMEOUT: seconds before a tool call is reported as timed out (default: 60)
+    - TOOL_RESULT_MAX_ROWS: rows of a tool result (client lookup, unpaid list) shown to the model (default: 5)
+    - FAST_PATH_ENABLED: answer greetings, course list/pick and the PR question without the LLM (default: true)
+    - RESPONSE_CACHE_ENABLED: answer repeated FAQ-style questions from the response cache (default: true)
+    - RESPONSE_CACHE_MAX_ENTRIES: replies kept in the response cache per worker (default: 512)
+    - RESPONSE_CACHE_TTL: seconds a cached reply stays valid, 0 = until evicted (default: 3600)
+    - RESPONSE_CACHE_SIMILARITY: trigram similarity (0-1) a reworded question with the same content words needs to match (default: 0.8)
+    - CONTEXT_MAX_TOKENS: approximate token budget of each agent LLM call (default: 6000)
+    - CONTEXT_TOOL_RESULT_MAX_CHARS: tool outputs of earlier turns are cut to this length (default: 1500)
+    - IMAP_HOST / IMAP_PORT / IMAP_SSL: IMAP server of the admin mailboxes (default: imap.gmail.com, 993, true)
+    - IMAP_MAILBOX: mailbox the Zeffy emails arrive in (default: INBOX)
+    - IMAP_SENDER_FILTER: only messages from this sender are fetched (default: zeffy.com)
+    - IMAP_FETCH_BATCH: messages per IMAP FETCH and per processing batch (default: 50)
+    - IMAP_POLL_INTERVAL: seconds between mailbox polls of the scheduler (default: 300)
+    - IMAP_BACKFILL_DAYS: days read back on the first poll or after a UIDVALIDITY change (default: 7)
+    - PAYMENT_INGESTION_STATE_PATH: JSON file with mailbox watermarks and retry lists (default: <repo>/data/payment_ingestion.json)
+    - IMAP_RETRY_HOURS: hours a payment email that failed is fetched again on every poll (default: 72)
+    - PAYMENT_LEDGER_PATH: SQLite ledger of processed payment emails and their outcomes (default: <repo>/data/payment_ledger.sqlite)
+    - PAYMENT_LEDGER_CLAIM_TIMEOUT: seconds after which an unfinished claim on a payment email may be taken over (default: 300)
+    - PAYMENT_MATCH_MIN_CONFIDENCE: lowest name-match confidence a payment is applied with (default: 0.8)
+    - PAYMENT_MATCH_AMBIGUITY_MARGIN: registrations scoring within this of the best make a payment ambiguous (default: 0.1)
+    - MAIL_SERVER / MAIL_PORT / MAIL_USE_TLS / MAIL_USE_SSL: SMTP server for outgoing email, e.g. a local sink in tests (default: smtp.gmail.com, 587, true, false)
+    - SMTP_CONNECTIONS: SMTP sessions used at once for bulk sending (default: 2)
+    - SMTP_BATCH_SIZE: emails sent per SMTP session before it is reopened (default: 50)
+    - SMTP_RATE_PER_SECOND: bulk sending rate limit across all sessions, 0 = none (default: 5)
+    - REMINDER_DAYS_AFTER_REGISTRATION: reminders go to unpaid registrations created this many days ago (default: 1)
+    - REMINDER_HOUR: hour of the day (server time) the scheduler sends the reminders (default: 9)
+    - JOTFORM_SCHEMA_CACHE_SIZE: JotForm forms whose resolved answer keys are cached (default: 256)
+    - CHECKPOINTER_BACKEND: conversation state store, 'memory' (per worker) or 'sqlite' (shared) (default: memory)
+    - CHECKPOINTER_SQLITE_PATH: SQLite file for the sqlite backend (default: <repo>/data/checkpoints.sqlite)
+    - CHECKPOINT_TTL_SECONDS: idle conversations are evicted after this many seconds, 0 = never (default: 86400)
+    - CHECKPOINT_MAX_PER_THREAD: checkpoints kept per conversation (default: 20)
+    - CHECKPOINT_MEMORY_MAX_THREADS / CHECKPOINT_MEMORY_MAX_BYTES: memory backend bounds (default: 2000 / 256 MB)
 
     (only required if using JotForm image URLs)
     - JOTFORM_API_KEY: API key for JotForm
@@ -49,6 +106,81 @@ class Config:
   AWS_SECRET_KEY = os.getenv('AWS_SECRET_KEY')
   S3_BUCKET_NAME = os.getenv('S3_BUCKET_NAME')
   REGION_NAME = os.getenv('REGION_NAME', 'us-east-1')
+  # Optional endpoint override, e.g. a local S3/Textract stand-in such as LocalStack
+  AWS_ENDPOINT_URL = os.getenv('AWS_ENDPOINT_URL') or None
+
+  # Textract asynchronous batch mode
+  TEXTRACT_BATCH_CONCURRENCY = int(os.getenv('TEXTRACT_BATCH_CONCURRENCY', 4))
+  TEXTRACT_POLL_INTERVAL = float(os.getenv('TEXTRACT_POLL_INTERVAL', 2.0))
+  TEXTRACT_JOB_TIMEOUT = float(os.getenv('TEXTRACT_JOB_TIMEOUT', 300))
+
+  # Threads used for OCR when called from the async (ASGI) server
+  OCR_WORKERS = int(os.getenv('OCR_WORKERS', 4))
+
+  # Upload storage: 'local' (disk, single node) or 's3' (shared by all nodes)
+  STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local').lower()
+  UPLOADS_DIR = os.getenv('UPLOADS_DIR', str(Path(__file__).resolve().parents[3] / 'uploads'))
+  UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', 10 * 1024 * 1024))
+  UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', 64 * 1024))
+  S3_UPLOAD_PREFIX = os.getenv('S3_UPLOAD_PREFIX', 'uploads')
+  S3_MULTIPART_PART_SIZE = max(int(os.getenv('S3_MULTIPART_PART_SIZE', 8 * 1024 * 1024)), 5 * 1024 * 1024)
+
+  # Upload-time image normalization (EXIF orientation, metadata strip, downscale, JPEG re-encode)
+  UPLOAD_NORMALIZE = os.getenv('UPLOAD_NORMALIZE', 'true').lower() == 'true'
+  UPLOAD_MAX_EDGE = int(os.getenv('UPLOAD_MAX_EDGE', 2000))
+  UPLOAD_JPEG_QUALITY = int(os.getenv('UPLOAD_JPEG_QUALITY', 85))
+  UPLOAD_KEEP_ORIGINAL = os.getenv('UPLOAD_KEEP_ORIGINAL', 'false').lower() == 'true'
+
+  # Images sent to the chat LLM: default vision detail and prepared-image cache bounds
+  # Outside the card steps an image may be a payment screenshot the model has to read
+  VISION_DEFAULT_DETAIL = os.getenv('VISION_DEFAULT_DETAIL', 'auto').lower()
+  VISION_JPEG_QUALITY = int(os.getenv('VISION_JPEG_QUALITY', 80))
+  VISION_CACHE_MAX_ENTRIES = int(os.getenv('VISION_CACHE_MAX_ENTRIES', 256))
+  VISION_CACHE_MAX_BYTES = int(os.getenv('VISION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+
+  # Stage timing and the Prometheus /metrics endpoint
+  METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+  # Shared directory where each worker writes its metrics snapshot for aggregation
+  METRICS_DIR = os.getenv('METRICS_DIR') or None
+  METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+  # On-demand sampling profiler (folded stacks for flamegraphs)
+  PROFILE_ADMIN_TOKEN = os.getenv('PROFILE_ADMIN_TOKEN') or None
+  PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0.0))
+  PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', 0.005))
+  PROFILE_DIR = os.getenv('PROFILE_DIR', str(Path(__file__).resolve().parents[3] / 'profiles'))
+  PROFILE_MAX_FILES = int(os.getenv('PROFILE_MAX_FILES', 200))
+  PROFILE_MAX_AGE_HOURS = float(os.getenv('PROFILE_MAX_AGE_HOURS', 72))
+
+  # Token for the staff chat step (back-office tools such as search_nonpaid_email)
+  STAFF_TOKEN = os.getenv('STAFF_TOKEN') or None
+
+  # Agent tool calls: shared thread pool and default per-call timeout
+  TOOL_WORKERS = int(os.getenv('TOOL_WORKERS', 8))
+  TOOL_TIMEOUT = float(os.getenv('TOOL_TIMEOUT', 60))
+  # Rows of a list-shaped tool result the model gets to see
+  TOOL_RESULT_MAX_ROWS = int(os.getenv('TOOL_RESULT_MAX_ROWS', 5))
+
+  # Deterministic fast path for routine chat turns (app.ai.router)
+  FAST_PATH_ENABLED = os.getenv('FAST_PATH_ENABLED', 'true').lower() == 'true'
+
+  # Response cache for repeated FAQ-style turns (app.ai.response_cache)
+  RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+  RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv('RESPONSE_CACHE_MAX_ENTRIES', 512))
+  RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 3600))
+  RESPONSE_CACHE_SIMILARITY = float(os.getenv('RESPONSE_CACHE_SIMILARITY', 0.8))
+
+  # Agent prompt: token budget per LLM call and size of earlier tool outputs in it
+  CONTEXT_MAX_TOKENS = int(os.getenv('CONTEXT_MAX_TOKENS', 6000))
+  CONTEXT_TOOL_RESULT_MAX_CHARS = int(os.getenv('CONTEXT_TOOL_RESULT_MAX_CHARS', 1500))
+
+  # LangGraph conversation checkpoints: 'memory' (per worker, bounded) or 'sqlite' (shared by all workers)
+  CHECKPOINTER_BACKEND = os.getenv('CHECKPOINTER_BACKEND', 'memory').lower()
+  CHECKPOINTER_SQLITE_PATH = os.getenv('CHECKPOINTER_SQLITE_PATH', str(Path(__file__).resolve().parents[3] / 'data' / 'checkpoints.sqlite'))
+  CHECKPOINT_TTL_SECONDS = float(os.getenv('CHECKPOINT_TTL_SECONDS', 24 * 3600))
+  CHECKPOINT_MAX_PER_THREAD = int(os.getenv('CHECKPOINT_MAX_PER_THREAD', 20))
+  CHECKPOINT_MEMORY_MAX_THREADS = int(os.getenv('CHECKPOINT_MEMORY_MAX_THREADS', 2000))
+  CHECKPOINT_MEMORY_MAX_BYTES = int(os.getenv('CHECKPOINT_MEMORY_MAX_BYTES', 256 * 1024 * 1024))
 
   # Admin email credentials, used for IMAP access and sending out notifications
   CFSO_ADMIN_EMAIL_PASSWORD = os.getenv('CFSO_ADMIN_EMAIL_PASSWORD')
@@ -58,14 +190,40 @@ class Config:
   ADMIN_EMAIL_USER = os.getenv('ADMIN_EMAIL_USER')
   ADMIN_EMAIL_PASSWORD = os.getenv('ADMIN_EMAIL_PASSWORD')
 
+  # IMAP ingestion of Zeffy payment emails (app.tools.ingestion_service, run by app.scheduler)
+  IMAP_HOST = os.getenv('IMAP_HOST', 'imap.gmail.com')
+  IMAP_PORT = int(os.getenv('IMAP_PORT', 993))
+  IMAP_SSL = os.getenv('IMAP_SSL', 'true').lower() == 'true'
+  IMAP_MAILBOX = os.getenv('IMAP_MAILBOX', 'INBOX')
+  IMAP_SENDER_FILTER = os.getenv('IMAP_SENDER_FILTER', 'zeffy.com')
+  IMAP_FETCH_BATCH = int(os.getenv('IMAP_FETCH_BATCH', 50))
+  IMAP_POLL_INTERVAL = float(os.getenv('IMAP_POLL_INTERVAL', 300))
+  IMAP_BACKFILL_DAYS = int(os.getenv('IMAP_BACKFILL_DAYS', 7))
+  IMAP_RETRY_HOURS = float(os.getenv('IMAP_RETRY_HOURS', 72))
+  PAYMENT_INGESTION_STATE_PATH = os.getenv('PAYMENT_INGESTION_STATE_PATH', str(Path(__file__).resolve().parents[3] / 'data' / 'payment_ingestion.json'))
+  # Processed payment emails (app.tools.payment_ledger): duplicates get the recorded outcome back
+  PAYMENT_LEDGER_PATH = os.getenv('PAYMENT_LEDGER_PATH', str(Path(__file__).resolve().parents[3] / 'data' / 'payment_ledger.sqlite'))
+  PAYMENT_LEDGER_CLAIM_TIMEOUT = float(os.getenv('PAYMENT_LEDGER_CLAIM_TIMEOUT', 300))
+  # Matching payments to registrations by participant or payer name (app.tools.registration_index)
+  PAYMENT_MATCH_MIN_CONFIDENCE = float(os.getenv('PAYMENT_MATCH_MIN_CONFIDENCE', 0.8))
+  PAYMENT_MATCH_AMBIGUITY_MARGIN = float(os.getenv('PAYMENT_MATCH_AMBIGUITY_MARGIN', 0.1))
+
   # Flask-Mail configuration (The mail showing as sender)
-  MAIL_SERVER = "smtp.gmail.com"
-  MAIL_PORT = 587
-  MAIL_USE_TLS = True
-  MAIL_USE_SSL = False
+  MAIL_SERVER = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+  MAIL_PORT = int(os.getenv('MAIL_PORT', 587))
+  MAIL_USE_TLS = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
+  MAIL_USE_SSL = os.getenv('MAIL_USE_SSL', 'false').lower() == 'true'
   MAIL_USERNAME =  os.getenv('SENDER_EMAIL_USER',ADMIN_EMAIL_USER)
   MAIL_PASSWORD = os.getenv('SENDER_EMAIL_PASSWORD',ADMIN_EMAIL_PASSWORD)
   MAIL_DEFAULT_SENDER = os.getenv('SENDER_EMAIL_USER',ADMIN_EMAIL_USER)
+  # Bulk sending (app.utils.smtp_utils): parallel SMTP sessions, emails per session, send rate
+  SMTP_CONNECTIONS = int(os.getenv('SMTP_CONNECTIONS', 2))
+  SMTP_BATCH_SIZE = int(os.getenv('SMTP_BATCH_SIZE', 50))
+  SMTP_RATE_PER_SECOND = float(os.getenv('SMTP_RATE_PER_SECOND', 5))
+
+  # Payment reminders (app.tools.reminder_service, run daily by app.scheduler)
+  REMINDER_DAYS_AFTER_REGISTRATION = int(os.getenv('REMINDER_DAYS_AFTER_REGISTRATION', 1))
+  REMINDER_HOUR = int(os.getenv('REMINDER_HOUR', 9))
 
   # Error notification email recipient
   NOTIFICATION_RECIPIENTS = os.getenv('ERROR_NOTIFICATION_EMAIL', ADMIN_EMAIL_USER)
@@ -85,6 +243,8 @@ class Config:
 
   # Jotform
   JOTFORM_API_KEY = os.getenv('JOTFORM_API_KEY')
+  # Forms whose resolved answer keys are kept (app.tools.registration_schema)
+  JOTFORM_SCHEMA_CACHE_SIZE = int(os.getenv('JOTFORM_SCHEMA_CACHE_SIZE', 256))
 
 
   # Google Sheets
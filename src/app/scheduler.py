@@ -0,0 +1,73 @@
+"""
+Background jobs, run in their own process so the web workers (several per
+node) don't each poll the mailboxes:
+
+    cd src && python -m app.scheduler           # run until stopped
+    cd src && python -m app.scheduler --once    # run every job once and exit
+    cd src && python -m app.scheduler --once --job payment_reminders   # just one job
+
+Jobs:
+    - payment_emails: ingest new Zeffy payment emails every IMAP_POLL_INTERVAL seconds
+    - payment_reminders: email yesterday's unpaid registrations daily at REMINDER_HOUR
+"""
+import argparse
+from datetime import datetime
+
+from apscheduler.schedulers.blocking import BlockingScheduler
+
+from app.config.config import Config
+from app.tools.ingestion_service import ingest_payment_emails
+from app.tools.reminder_service import send_payment_reminders
+
+
+def payment_emails_job() -> None:
+    result = ingest_payment_emails()
+    if result["status"] != "success":
+        print(f"❌ Payment email job: {result['message']}")
+
+
+def payment_reminders_job() -> None:
+    result = send_payment_reminders()
+    print(f"{'✉️' if result['status'] == 'success' else '❌'} Payment reminder job: {result['message']}")
+
+
+# job id -> (function, APScheduler trigger arguments)
+JOBS = {
+    "payment_emails": (payment_emails_job, {"trigger": "interval", "seconds": Config.IMAP_POLL_INTERVAL}),
+    "payment_reminders": (payment_reminders_job, {"trigger": "cron", "hour": Config.REMINDER_HOUR}),
+}
+
+
+def build_scheduler(jobs: dict = None) -> BlockingScheduler:
+    """
+    A scheduler with every job. Interval jobs also run once at start; the
+    daily ones wait for their hour.
+    """
+    scheduler = BlockingScheduler()
+    for job_id, (func, trigger) in (jobs or JOBS).items():
+        start = {"next_run_time": datetime.now()} if trigger["trigger"] == "interval" else {}
+        # A run that overruns is not started twice, and missed runs are merged into one
+        scheduler.add_job(func, id=job_id, max_instances=1, coalesce=True, **trigger, **start)
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    parser.add_argument("--job", choices=sorted(JOBS), action="append", help="only this job (repeatable)")
+    args = parser.parse_args()
+
+    jobs = {job_id: JOBS[job_id] for job_id in args.job} if args.job else JOBS
+    if args.once:
+        for func, _ in jobs.values():
+            func()
+        return
+    print(f"⏰ Scheduler started: {', '.join(jobs)}")
+    try:
+        build_scheduler(jobs).start()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+
+
+if __name__ == "__main__":
+    main()
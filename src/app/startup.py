@@ -0,0 +1,58 @@
+"""
+Process start-up: what is loaded once before gunicorn forks its workers and
+what each worker builds for itself.
+
+Heavy libraries (pandas, OpenCV, Tesseract bindings, boto3, the OpenAI SDK)
+are imported lazily by the code paths that use them, so `import main` stays
+fast for scripts, tests and the dev server. Under gunicorn with
+`preload_app` (see gunicorn.conf.py) the master imports the app and then
+`preload()` imports those libraries, once: the forked workers share their
+pages copy-on-write instead of each importing them again.
+
+Anything that holds sockets, threads or open files (the OpenAI HTTP client,
+boto3 clients, the SQLite checkpoint connection, thread pools) must not be
+created before the fork. `warm_up()` builds those in the worker, right after
+the fork, so the first request does not pay for them either.
+"""
+import importlib
+import os
+import time
+
+# Imported in the gunicorn master so every worker shares them
+PRELOAD_MODULES = (
+    "numpy",
+    "pandas",
+    "cv2",
+    "pytesseract",
+    "bs4",
+    "requests",
+    "boto3",
+    "langchain_openai",
+)
+
+
+def preload() -> None:
+    """Import the heavy libraries the request paths import lazily."""
+    start = time.perf_counter()
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    print(f"📦 Preloaded {len(PRELOAD_MODULES)} modules in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+
+def warm_up() -> None:
+    """
+    Per-process initialization: the chat model and compiled graph, and the
+    storage backend. Safe to call more than once.
+    """
+    from app.ai.agent import get_app_graph
+    from app.utils.storage_utils import get_storage
+
+    start = time.perf_counter()
+    try:
+        get_app_graph()
+        get_storage()
+    except Exception as e:
+        # The first request retries and reports the error; a crashing worker would only be respawned
+        print(f"❌ Worker {os.getpid()} warm-up failed: {e}")
+        return
+    print(f"🔥 Worker {os.getpid()} warmed up in {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -1,11 +1,15 @@
 from .payment_service import payment_extraction
 from .registration_service import registration_extraction 
-from .document_service import identification_service
-from .reminder_service import reminder_nonpaid_email
+from .document_service import identification_service, aidentification_service
+from .reminder_service import reminder_nonpaid_email, send_payment_reminders
+from .ingestion_service import ingest_payment_emails
 
 __all__ = [
     "payment_extraction",
     "registration_extraction",
     "identification_service",
-    "reminder_nonpaid_email"
+    "aidentification_service",
+    "reminder_nonpaid_email",
+    "send_payment_reminders",
+    "ingest_payment_emails"
 ]
\ No newline at end of file
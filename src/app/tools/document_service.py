@@ -1,8 +1,11 @@
+import asyncio
 import re
-from typing import Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
 
+from app.config.config import Config
 from app.models import IdentificationResult
-from app.utils.image_utils import  local_image_to_text,get_image
+from app.utils.image_utils import  local_image_to_text,get_image,bytes_to_cv2,afetch_image_bytes
 from app.utils.aws_utils import AWSService
 from app.utils.database_utils import update_to_csv
 # ------------------------------------------------------------
@@ -13,6 +16,9 @@ PR_CARD_KEYWORD_THRESHOLD = 0.77
 PR_CARD_POSITION_THRESHOLD = 0.33
 PR_CARD_DRIVERS_LICENSE_THRESHOLD = 0.5
 
+# Bounded pool for the CPU-bound OCR work when called from async code
+_ocr_executor = ThreadPoolExecutor(max_workers=Config.OCR_WORKERS, thread_name_prefix="ocr")
+
 # ------------------------------------------------------------
 # Keyword sets
 # ------------------------------------------------------------
@@ -144,7 +150,7 @@ def _get_pr_card_verified_info(valid, confidence: float, details: str) -> Dict[s
 # ------------------------------------------------------------
 # Main validator
 # ------------------------------------------------------------
-def identification_service(image_url: str, register_info: dict) -> IdentificationResult:
+def identification_service(image_url: str, register_info: dict, image_bytes: Optional[bytes] = None) -> IdentificationResult:
     
     reasons: List[str] = []
     doc: List[str] = []
@@ -165,7 +171,10 @@ def identification_service(image_url: str, register_info: dict) -> Identificatio
     course_date = register_info.get("Course_Date", "")
 
     try:
-        image = get_image(source='URL', imgURL=image_url)
+        if image_bytes is not None:
+            image = bytes_to_cv2(image_bytes)
+        else:
+            image = get_image(source='URL', imgURL=image_url)
 
         local_ocr = local_image_to_text(image)
         #local_norm = normalize(local_ocr,image.shape[1], image.shape[0])
@@ -251,3 +260,17 @@ def identification_service(image_url: str, register_info: dict) -> Identificatio
         identification_result = IdentificationResult(reasons=reasons, doc_type=doc, is_valid=valid, confidence=keyword_confidence, raw_text=texts)
             
         return {**identification_result.__dict__, "status": "error", "message":"Identification process failed."}
+
+async def aidentification_service(image_url: str, register_info: dict) -> IdentificationResult:
+    """
+    Async variant of `identification_service`: the image is fetched without
+    blocking the event loop and the OCR runs on the bounded OCR executor.
+    """
+    try:
+        image_bytes = await afetch_image_bytes(image_url)
+    except Exception as e:
+        identification_result = IdentificationResult(reasons=[str(e)])
+        return {**identification_result.__dict__, "status": "error", "message":"Identification process failed."}
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_ocr_executor, identification_service, image_url, register_info, image_bytes)
@@ -0,0 +1,261 @@
+"""
+Incremental ingestion of Zeffy payment emails from the admin mailboxes.
+
+Each poll asks the server for the mailbox's UIDVALIDITY and UIDNEXT. If
+nothing arrived since the last poll that is the only command sent; otherwise
+only the UIDs above the stored watermark (and from the Zeffy sender) are
+searched and fetched, IMAP_FETCH_BATCH messages per FETCH command. Every
+batch is processed as a whole and the watermark is saved after it, so a
+crash costs at most one batch of work, and a burst of payment emails is
+worked through in as many batches as it takes, without rescanning anything.
+
+The watermark passes every UID of a batch, but a payment email whose
+processing failed (no registration yet, the database unavailable) would
+then never be delivered again. Those UIDs go on the mailbox's retry list
+and are fetched and processed again on every poll until they succeed or
+IMAP_RETRY_HOURS have passed. Emails that are not payments at all are not
+retried.
+
+A mailbox whose UIDVALIDITY changed (recreated or migrated by the provider)
+is read again from IMAP_BACKFILL_DAYS back, and its retry list dropped. Every email goes through the
+payment ledger (app.tools.payment_ledger) under its Message-ID, so one that
+shows up again under a new UID (copied, moved, or re-read after such a
+reset) gets its recorded outcome instead of being applied twice.
+
+Run by app.scheduler; `ingest_payment_emails()` can also be called directly.
+"""
+import json
+import os
+import threading
+import time
+from datetime import date, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+
+from app.config.config import Config
+from app.tools.payment_service import process_payment_emails
+from app.utils import imap_utils, metrics
+
+
+def configured_mailboxes() -> Dict[str, Tuple[str, str]]:
+    """name -> (user, password) for the admin mailboxes that have credentials set."""
+    mailboxes = {}
+    if Config.CFSO_ADMIN_EMAIL_USER and Config.CFSO_ADMIN_EMAIL_PASSWORD:
+        mailboxes["cfso"] = (Config.CFSO_ADMIN_EMAIL_USER, Config.CFSO_ADMIN_EMAIL_PASSWORD)
+    if Config.UNIC_ADMIN_EMAIL_USER and Config.UNIC_ADMIN_EMAIL_PASSWORD:
+        mailboxes["unic"] = (Config.UNIC_ADMIN_EMAIL_USER, Config.UNIC_ADMIN_EMAIL_PASSWORD)
+    return mailboxes
+
+
+class IngestionState:
+    """
+    Per-mailbox (UIDVALIDITY, last UID) watermarks and the UIDs to retry,
+    kept in a JSON file (PAYMENT_INGESTION_STATE_PATH).
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path or Config.PAYMENT_INGESTION_STATE_PATH
+        self._lock = threading.Lock()
+        self.watermarks: Dict[str, dict] = {}
+        # mailbox key -> {"uidvalidity": int, "uids": {uid (str): {"attempts": int, "first_failed": epoch}}}
+        self.retries: Dict[str, dict] = {}
+        self._load()
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"❌ Failed to read ingestion state {self.path}: {e}")
+            return
+        self.watermarks = data.get("watermarks", {})
+        self.retries = data.get("retries", {})
+
+    def save(self) -> None:
+        with self._lock:
+            data = {"watermarks": self.watermarks, "retries": self.retries}
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def watermark(self, key: str) -> Tuple[Optional[int], int]:
+        """(UIDVALIDITY, last processed UID) of a mailbox; (None, 0) if never read."""
+        mark = self.watermarks.get(key) or {}
+        return mark.get("uidvalidity"), mark.get("last_uid", 0)
+
+    def set_watermark(self, key: str, uidvalidity: int, last_uid: int) -> None:
+        with self._lock:
+            self.watermarks[key] = {"uidvalidity": uidvalidity, "last_uid": last_uid}
+
+    def retry_uids(self, key: str, uidvalidity: int) -> List[int]:
+        """
+        UIDs of the mailbox to process again, oldest first. Entries older
+        than IMAP_RETRY_HOURS, and all of them after a UIDVALIDITY change,
+        are dropped.
+        """
+        with self._lock:
+            pending = self.retries.get(key)
+            if not pending:
+                return []
+            if pending.get("uidvalidity") != uidvalidity:
+                del self.retries[key]
+                return []
+            cutoff = time.time() - Config.IMAP_RETRY_HOURS * 3600
+            for uid, entry in list(pending["uids"].items()):
+                if entry["first_failed"] < cutoff:
+                    print(f"⚠️ {key}: giving up on payment email UID {uid} after {entry['attempts']} attempts")
+                    del pending["uids"][uid]
+            return sorted(int(uid) for uid in pending["uids"])
+
+    def add_retry(self, key: str, uidvalidity: int, uid: int) -> None:
+        with self._lock:
+            pending = self.retries.get(key)
+            if pending is None or pending.get("uidvalidity") != uidvalidity:
+                pending = self.retries[key] = {"uidvalidity": uidvalidity, "uids": {}}
+            entry = pending["uids"].setdefault(str(uid), {"attempts": 0, "first_failed": time.time()})
+            entry["attempts"] += 1
+
+    def drop_retry(self, key: str, uid: int) -> None:
+        with self._lock:
+            pending = self.retries.get(key)
+            if pending is not None:
+                pending["uids"].pop(str(uid), None)
+
+
+def _chunks(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def ingest_mailbox(name: str, user: str, password: str, state: IngestionState,
+                   connect: Callable = None, process_batch: Callable = None) -> dict:
+    """
+    Fetch and process the payment emails that arrived in one mailbox since
+    its watermark, and those on its retry list.
+
+    Args:
+        name (str): Mailbox label used in logs, metrics and the watermark key.
+        user (str): IMAP login.
+        password (str): IMAP password.
+        state (IngestionState): Mailbox watermarks and retry lists.
+        connect (callable): connect(user, password) -> IMAP connection
+            (default: imap_utils.connect with the Config server).
+        process_batch (callable): Processes a list of emails
+            (default: payment_service.process_payment_emails, through the ledger).
+
+    Returns:
+        dict: Counts of fetched, retried, processed and duplicate emails and
+        of outcomes by status.
+    """
+    connect = connect or imap_utils.connect
+    process_batch = process_batch or (lambda emails: process_payment_emails(emails, source=f"imap:{name}"))
+    mailbox = Config.IMAP_MAILBOX
+    key = f"{name}:{user}:{mailbox}"
+    summary = {"fetched": 0, "retried": 0, "processed": 0, "duplicates": 0, "outcomes": {}}
+
+    def process(conn, batch: List[int], uidvalidity: int, retry: bool) -> None:
+        fetched, emails = [], []
+        for uid, message in imap_utils.fetch_messages(conn, batch):
+            fetched.append(uid)
+            emails.append({
+                "id": (message.get("Message-ID") or "").strip() or f"{key}:{uidvalidity}:{uid}",
+                "subject": str(message.get("Subject", "")),
+                "sender": str(message.get("From", "")),
+                # HTML stays HTML: the payment parser normalizes every body once
+                "body": imap_utils.message_text(message, html_to_text=False),
+            })
+        summary["retried" if retry else "fetched"] += len(emails)
+        if retry:
+            # Deleted or moved out of the mailbox since: nothing left to retry
+            for uid in set(batch) - set(fetched):
+                state.drop_retry(key, uid)
+
+        results = process_batch(emails) if emails else []
+        for uid, item, result in zip(fetched, emails, results):
+            status = result.get("status", "error")
+            if status == "error" and result.get("retryable", True):
+                state.add_retry(key, uidvalidity, uid)
+            else:
+                state.drop_retry(key, uid)
+            if result.get("duplicate"):
+                summary["duplicates"] += 1
+                continue
+            summary["outcomes"][status] = summary["outcomes"].get(status, 0) + 1
+            metrics.inc("app_payment_emails_total", 1, "Payment emails ingested, by mailbox and outcome.",
+                        mailbox=name, status=status)
+            if status != "success":
+                print(f"❌ {name}: payment email {item['subject']!r}: {result.get('message')}")
+        summary["processed"] += len(results) - sum(1 for result in results if result.get("duplicate"))
+
+    conn = connect(user, password)
+    try:
+        uidvalidity, uidnext = imap_utils.mailbox_status(conn, mailbox)
+        known_validity, last_uid = state.watermark(key)
+        retry_uids = state.retry_uids(key, uidvalidity)
+        since = None
+        if known_validity != uidvalidity:
+            if known_validity is not None:
+                print(f"⚠️ {name}: UIDVALIDITY changed ({known_validity} -> {uidvalidity}), reading the last {Config.IMAP_BACKFILL_DAYS} days again")
+            last_uid = 0
+            since = date.today() - timedelta(days=Config.IMAP_BACKFILL_DAYS)
+        elif uidnext - 1 <= last_uid and not retry_uids:
+            return summary
+
+        conn.select(imap_utils.quote_mailbox(mailbox), readonly=True)
+        for batch in _chunks(retry_uids, Config.IMAP_FETCH_BATCH):
+            process(conn, batch, uidvalidity, retry=True)
+            state.save()
+
+        uids = []
+        if since is not None or uidnext - 1 > last_uid:
+            uids = imap_utils.search_uids(conn, last_uid, sender=Config.IMAP_SENDER_FILTER, since=since)
+        for batch in _chunks(uids, Config.IMAP_FETCH_BATCH):
+            process(conn, batch, uidvalidity, retry=False)
+            # Everything up to the end of this batch is done, even non-matching UIDs; failures are on the retry list
+            state.set_watermark(key, uidvalidity, max(batch))
+            state.save()
+
+        # Every UID below UIDNEXT has been searched; the ones not from Zeffy need no second look
+        state.set_watermark(key, uidvalidity, max(last_uid, uidnext - 1, *uids))
+        state.save()
+    finally:
+        try:
+            conn.logout()
+        except Exception:
+            pass
+    return summary
+
+
+def ingest_payment_emails(state: IngestionState = None, connect: Callable = None) -> dict:
+    """
+    Poll every configured admin mailbox once (see `ingest_mailbox`).
+
+    Returns:
+        dict: 'status', 'message' and per-mailbox summaries under 'data'.
+    """
+    mailboxes = configured_mailboxes()
+    if not mailboxes:
+        return {"status": "error", "message": "No admin mailbox credentials configured", "data": {}}
+
+    state = state or IngestionState()
+    data, failed = {}, []
+    for name, (user, password) in mailboxes.items():
+        start = time.perf_counter()
+        try:
+            data[name] = ingest_mailbox(name, user, password, state, connect=connect)
+        except Exception as e:
+            print(f"❌ {name}: payment email ingestion failed: {e}")
+            data[name] = {"error": str(e)}
+            failed.append(name)
+            continue
+        summary = data[name]
+        if summary["fetched"] or summary["retried"]:
+            print(f"📬 {name}: {summary['processed']} payment emails processed ({summary['retried']} retried), {summary['duplicates']} duplicates "
+                  f"({summary['outcomes']}) in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    if failed:
+        return {"status": "error", "message": f"Ingestion failed for: {', '.join(failed)}", "data": data}
+    return {"status": "success", "message": "Payment emails ingested", "data": data}
@@ -0,0 +1,210 @@
+"""
+Ledger of processed payment emails.
+
+Every payment email that reaches `process_payment_emails`, whether pasted
+into the chat (`check_payment_status`) or read from a mailbox by the
+ingestion job, gets one row in a SQLite file (PAYMENT_LEDGER_PATH), keyed
+by its email ID and a hash of its normalized body. The row holds the
+outcome and the parsed payment, so the same email delivered again (agent
+retries, re-polls, a UIDVALIDITY reset) gets the recorded outcome back
+from a primary-key lookup, without the registration CSV being read or
+written again. Applying a payment twice would otherwise look like a second
+partial payment. The same body under another email ID (the chat agent
+invents IDs, and an email pasted in the chat may already have been
+ingested from the mailbox under its Message-ID) is found by its content
+hash and gets the outcome of the first one; the alias is kept as a
+'duplicate' row pointing at it.
+
+Only outcomes that changed a registration ('success', 'partial') are
+final. An email that failed (no matching registration yet, database
+unavailable) is tried again the next time it arrives; its row counts the
+attempts. A row is claimed ('processing') before the email is processed,
+inside a write transaction, so two workers receiving the same email at
+once do not both apply it; a claim older than PAYMENT_LEDGER_CLAIM_TIMEOUT
+seconds (a crashed worker) may be taken over.
+
+Rows are never deleted: together with their attempt and duplicate counts
+they are the audit trail of what was done with every payment email.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from app.config import Config
+from app.tools.payment_parsers import normalize_body
+
+# Outcomes that changed a registration; a duplicate gets them back instead of being applied again
+FINAL_STATUSES = ("success", "partial")
+
+_COLUMNS = ("email_id", "content_hash", "subject", "source", "status", "message", "payment_info",
+            "attempts", "duplicates", "first_seen", "updated_at")
+
+
+def content_hash(body: str) -> str:
+    """sha256 of the normalized body: the same email as text or HTML, or re-wrapped, hashes the same."""
+    return hashlib.sha256(normalize_body(body or "").encode("utf-8")).hexdigest()
+
+
+class PaymentLedger:
+    """
+    SQLite ledger of processed payment emails (see the module docstring).
+    Safe to share between threads and, through WAL mode, between the
+    gunicorn workers and the scheduler process.
+    """
+
+    def __init__(self, path: str = None, claim_timeout: float = None):
+        self.path = path or Config.PAYMENT_LEDGER_PATH
+        self.claim_timeout = claim_timeout if claim_timeout is not None else Config.PAYMENT_LEDGER_CLAIM_TIMEOUT
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # Opened lazily and reopened after a fork: a connection must not cross processes
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS processed_emails (
+                    email_id TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    subject TEXT,
+                    source TEXT,
+                    status TEXT NOT NULL,
+                    message TEXT,
+                    payment_info TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 1,
+                    duplicates INTEGER NOT NULL DEFAULT 0,
+                    first_seen REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (email_id, content_hash)
+                );
+                CREATE INDEX IF NOT EXISTS processed_emails_hash ON processed_emails (content_hash);
+                CREATE INDEX IF NOT EXISTS processed_emails_updated ON processed_emails (updated_at);
+                """
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    @staticmethod
+    def _entry(row) -> Optional[dict]:
+        if row is None:
+            return None
+        entry = dict(zip(_COLUMNS, row))
+        entry["payment_info"] = json.loads(entry["payment_info"]) if entry["payment_info"] else None
+        return entry
+
+    def lookup(self, email_id: str, content_hash: str) -> Optional[dict]:
+        """The ledger entry of an email, or None if it was never seen."""
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM processed_emails WHERE email_id = ? AND content_hash = ?",
+                (email_id, content_hash),
+            ).fetchone()
+        return self._entry(row)
+
+    def _settled(self, entry: dict, now: float) -> bool:
+        # A final outcome, or a claim still in progress: the email must not be processed (again)
+        if entry["status"] in FINAL_STATUSES:
+            return True
+        return entry["status"] == "processing" and now - entry["updated_at"] < self.claim_timeout
+
+    def claim(self, email_id: str, content_hash: str, subject: str = None, source: str = None) -> Optional[dict]:
+        """
+        Claim an email for processing.
+
+        Returns:
+            None if the caller should process the email (it was never seen,
+            its last attempt failed, or an earlier claim timed out), otherwise
+            the existing entry: a final outcome, or a claim still in progress
+            (status 'processing'). The entry may be the one of the same body
+            under another email ID; the alias is then recorded as 'duplicate'.
+        """
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    f"SELECT {', '.join(_COLUMNS)} FROM processed_emails WHERE email_id = ? AND content_hash = ?",
+                    (email_id, content_hash),
+                ).fetchone()
+                entry = self._entry(row)
+                if entry is None or not self._settled(entry, now):
+                    # The same email under another ID, applied or being processed
+                    original = self._entry(conn.execute(
+                        f"SELECT {', '.join(_COLUMNS)} FROM processed_emails "
+                        f"WHERE content_hash = ? AND email_id != ? AND status IN ('processing', {', '.join('?' * len(FINAL_STATUSES))}) "
+                        "ORDER BY first_seen LIMIT 1",
+                        (content_hash, email_id, *FINAL_STATUSES),
+                    ).fetchone())
+                    if original is not None and self._settled(original, now):
+                        conn.execute(
+                            "INSERT INTO processed_emails (email_id, content_hash, subject, source, status, message, "
+                            "attempts, duplicates, first_seen, updated_at) VALUES (?, ?, ?, ?, 'duplicate', ?, 0, 1, ?, ?) "
+                            "ON CONFLICT (email_id, content_hash) DO UPDATE SET "
+                            "status = 'duplicate', message = excluded.message, duplicates = duplicates + 1, updated_at = excluded.updated_at",
+                            (email_id, content_hash, subject, source, f"Duplicate of {original['email_id']}", now, now),
+                        )
+                        entry = original
+                if entry is not None and self._settled(entry, now):
+                    conn.execute(
+                        "UPDATE processed_emails SET duplicates = duplicates + 1 WHERE email_id = ? AND content_hash = ?",
+                        (entry["email_id"], content_hash),
+                    )
+                    entry["duplicates"] += 1
+                    conn.execute("COMMIT")
+                    return entry
+                conn.execute(
+                    "INSERT INTO processed_emails (email_id, content_hash, subject, source, status, first_seen, updated_at) "
+                    "VALUES (?, ?, ?, ?, 'processing', ?, ?) "
+                    "ON CONFLICT (email_id, content_hash) DO UPDATE SET "
+                    "status = 'processing', attempts = attempts + 1, source = excluded.source, updated_at = excluded.updated_at",
+                    (email_id, content_hash, subject, source, now, now),
+                )
+                conn.execute("COMMIT")
+                return None
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def finish(self, email_id: str, content_hash: str, outcome: dict, payment_info: Optional[dict] = None) -> None:
+        """Record the outcome of a claimed email."""
+        with self._lock:
+            self._connection().execute(
+                "UPDATE processed_emails SET status = ?, message = ?, payment_info = ?, updated_at = ? "
+                "WHERE email_id = ? AND content_hash = ?",
+                (outcome.get("status", "error"), outcome.get("message"),
+                 json.dumps(payment_info, default=str) if payment_info else None, time.time(),
+                 email_id, content_hash),
+            )
+
+    def history(self, limit: int = 100, status: str = None) -> List[dict]:
+        """Most recently updated entries, optionally only with one status; for audits."""
+        query = f"SELECT {', '.join(_COLUMNS)} FROM processed_emails"
+        args: tuple = ()
+        if status:
+            query += " WHERE status = ?"
+            args = (status,)
+        with self._lock:
+            rows = self._connection().execute(f"{query} ORDER BY updated_at DESC LIMIT ?", args + (limit,)).fetchall()
+        return [self._entry(row) for row in rows]
+
+
+_ledger: Optional[PaymentLedger] = None
+
+
+def get_ledger() -> PaymentLedger:
+    """Return the process-wide ledger at Config.PAYMENT_LEDGER_PATH."""
+    global _ledger
+    if _ledger is None:
+        _ledger = PaymentLedger()
+    return _ledger
@@ -0,0 +1,190 @@
+"""
+Parser registry for payment notification emails.
+
+Each known email layout is a `PaymentTemplate`: the sender it comes from,
+cheap checks that recognize it (sender domain, subject, a few marker
+strings), and its field patterns compiled once into a single alternation,
+so one scan of the body extracts every field. A field the combined scan
+misses (for example because another field's match covered it) is looked up
+again with its own compiled pattern.
+
+Bodies go through `normalize_body` once: HTML is reduced to text, entities
+are decoded and whitespace is collapsed per line, so templates only have to
+describe the text layout. Course dates repeat across many emails and are
+parsed through a cache.
+
+A new layout (another sender, or a Zeffy redesign) is added with
+`register_template`; templates registered later are tried first.
+"""
+import html
+import re
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Pattern, Tuple
+
+from app.utils import metrics
+
+_HTML_RE = re.compile(r"<(html|body|div|p|br|table|td|span|font|a)\b", re.IGNORECASE)
+_BLOCK_END_RE = re.compile(r"<\s*(br|/p|/div|/tr|/h\d|/li|/table)\b[^>]*>", re.IGNORECASE)
+_SKIP_RE = re.compile(r"<(style|script|head)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"[ \t\r\f\v\u00a0\u200b]+")
+
+
+def normalize_body(body: str) -> str:
+    """
+    The text of an email body, HTML or plain: tags removed (block ends
+    become line breaks), entities decoded, runs of spaces collapsed, lines
+    stripped and blank lines dropped.
+    """
+    if not body:
+        return ""
+    if _HTML_RE.search(body):
+        body = _SKIP_RE.sub("", body)
+        body = _BLOCK_END_RE.sub("\n", body)
+        body = html.unescape(_TAG_RE.sub("", body))
+    lines = (_SPACE_RE.sub(" ", line).strip() for line in body.splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+@lru_cache(maxsize=1024)
+def parse_course_date(date_str: str) -> Optional[str]:
+    """
+    "November 9, 2025 at 4:00 PM EST" -> "2025-11-09". The time zone is
+    ignored; it never changes the date.
+    """
+    no_tz = date_str.strip().rsplit(" ", 1)[0]
+    try:
+        return datetime.strptime(no_tz, "%B %d, %Y at %I:%M %p").strftime("%Y-%m-%d")
+    except ValueError:
+        pass
+    try:
+        from dateutil import parser
+        return parser.parse(date_str).strftime("%Y-%m-%d")
+    except (ValueError, OverflowError):
+        return None
+
+
+def _amount(value: str) -> Optional[float]:
+    try:
+        return float(value.replace(",", ""))
+    except ValueError:
+        return None
+
+
+@dataclass
+class PaymentTemplate:
+    """
+    One email layout.
+
+    Attributes:
+        name: Template name, "<sender>-<layout>-v<version>", used in metrics.
+        sender: Domain the emails are sent from.
+        markers: Strings every body of this layout contains.
+        fields: Field -> regex whose named group of the same name is the raw value.
+        converters: Field -> function turning the raw value into the stored one
+            (a None result counts as missing).
+        required: Fields without which the email is not a payment.
+        subject: Optional pattern the subject must match, when it is known.
+    """
+    name: str
+    sender: str
+    markers: Tuple[str, ...]
+    fields: Dict[str, str]
+    converters: Dict[str, Callable[[str], object]] = field(default_factory=dict)
+    required: Tuple[str, ...] = ()
+    subject: Optional[Pattern] = None
+
+    def __post_init__(self):
+        self.combined = re.compile("|".join(f"(?:{pattern})" for pattern in self.fields.values()))
+        self.single = {name: re.compile(pattern) for name, pattern in self.fields.items()}
+
+    def accepts(self, body: str, subject: str = None, sender: str = None) -> bool:
+        """Cheap checks: sender domain, subject, marker strings."""
+        if sender and self.sender not in sender.lower():
+            return False
+        if subject and self.subject is not None and not self.subject.search(subject):
+            return False
+        return all(marker in body for marker in self.markers)
+
+    def extract(self, body: str) -> Optional[dict]:
+        """The converted fields of a normalized body, or None if a required one is missing."""
+        raw = {}
+        for match in self.combined.finditer(body):
+            for name, value in match.groupdict().items():
+                if value is not None and name not in raw:
+                    raw[name] = value
+            if len(raw) == len(self.fields):
+                break
+        for name, pattern in self.single.items():
+            if name not in raw:
+                match = pattern.search(body)
+                if match:
+                    raw[name] = match.group(name)
+
+        values = {}
+        for name, value in raw.items():
+            convert = self.converters.get(name, str.strip)
+            converted = convert(value)
+            if converted is not None:
+                values[name] = converted
+        if any(name not in values for name in self.required):
+            return None
+        return values
+
+
+ZEFFY_UNI_COMMONS_V1 = PaymentTemplate(
+    name="zeffy-uni-commons-v1",
+    sender="zeffy.com",
+    markers=("Participant's Name",),
+    fields={
+        # New CA$125.00 payment received!
+        "Actual_Paid_Amount": r"(?i:New\s*CA\$)(?P<Actual_Paid_Amount>\d[\d,]*\.\d{2})",
+        # Participant's Name (First & Last Name) 參加者的姓名（名字和姓氏） : hiu man suen
+        "Full_Name": r"Participant's Name[^:]*:\s*(?P<Full_Name>(?s:.+?))\s*I have reviewed",
+        # November 9, 2025 at 4:00 PM EST
+        "Course_Date": r"(?P<Course_Date>(?i:[a-z]+\s+\d{1,2},\s+\d{4}\s+at\s+\d{1,2}:\d{2}\s+[ap]m\s+[a-z]{3}))",
+        # Standard First Aid with CPR Level C & AED Certification @ UNI-Commons x CFSO
+        "Course": r"(?m:^)(?!.*New purchase)(?P<Course>.+?)\s*@ UNI-Commons x CFSO",
+    },
+    converters={
+        # Zeffy format is "Last, First" - keep as is
+        "Full_Name": lambda value: value.strip().replace(",", ""),
+        "Actual_Paid_Amount": _amount,
+        "Course_Date": parse_course_date,
+    },
+    required=("Full_Name", "Actual_Paid_Amount"),
+)
+
+# Tried in order; see register_template
+TEMPLATES: List[PaymentTemplate] = [ZEFFY_UNI_COMMONS_V1]
+
+
+def register_template(template: PaymentTemplate) -> None:
+    """Add a layout; it is tried before the ones registered earlier."""
+    TEMPLATES.insert(0, template)
+
+
+def parse_payment_email(body: str, subject: str = None, sender: str = None) -> Tuple[Optional[dict], Optional[str]]:
+    """
+    Extract the payment fields of a notification email.
+
+    Args:
+        body (str): Email body, HTML or text.
+        subject (str): Subject line, if known.
+        sender (str): From address, if known.
+
+    Returns:
+        tuple: (fields dict or None, name of the template that matched or None).
+    """
+    text = normalize_body(body)
+    for template in TEMPLATES:
+        if not template.accepts(text, subject, sender):
+            continue
+        values = template.extract(text)
+        if values is not None:
+            metrics.inc("app_payment_email_parse_total", 1, "Payment emails parsed, by template.", template=template.name)
+            return values, template.name
+    metrics.inc("app_payment_email_parse_total", 1, "Payment emails parsed, by template.", template="none")
+    return None, None
@@ -1,9 +1,14 @@
 
-from app.utils.database_utils import update_to_csv, get_from_csv
+from app.utils import database_utils, metrics
+from app.utils.metrics import timed
 from app.config.config import Config
-import re
+from app.tools.payment_parsers import parse_payment_email
+from app.tools.payment_ledger import FINAL_STATUSES, content_hash, get_ledger
+from app.tools.registration_index import EXACT_CONFIDENCE, RegistrationIndex, resolve
+import json
+import os
+import sqlite3
 from datetime import datetime
-from dateutil import parser
 
 def payment_extraction(id, subject, body) -> dict:
     '''
@@ -14,202 +19,283 @@ def payment_extraction(id, subject, body) -> dict:
         body (str): Body of the email.
     Returns: 
        A dictionary containing payment information extracted from the email.
+       An email that was already applied returns its recorded outcome (see process_payment_emails).
     '''
-    notify_manually_check = False
-    error_messages = []
     try:
+        return process_payment_emails([{"id": id, "subject": subject, "body": body}], source="chat")[0]
+    except Exception as e:
         
-        # Step 1: Extract payment information from email body
-        payment_info = extract_payment_info(body)
+        return {
+            "status": "error",
+            "message": f"Unexpected Error happens during processing payment: {str(e)}"
+        }
 
-        # Scenario 1: Could not extract payment information
-        if not payment_info or not payment_info.get("Actual_Paid_Amount") or not payment_info.get("Full_Name"):
-            
-            return {
-                "status": "error",
-                "message": f"Failed to extract payment details from email with subject: {subject}"
-            }
-        
-        # Step 2: Extract user's info from the database  
-
-        full_name = payment_info.get("Full_Name")
-
-        # Fetch with the payer full name and not yet marked as paid -> Never paid before
-        rows = get_from_csv(
-            match_column=[
-                "Full_Name", 
-                "Course", 
-                "Course_Date",
-                "Paid"
-            ], 
-            match_value=[
-                full_name, 
-                payment_info.get("Course"), 
-                payment_info.get("Course_Date"), 
-                ""
-            ]
-        )
-        
-        if not rows:
-            # Fetch with the payer full name and marked as paid but payment status is False -> Paid before but need to correct the amount and repaid again
-            rows = get_from_csv(
-                match_column=[
-                    "Full_Name", 
-                    "Course", 
-                    "Course_Date", 
-                    "Paid", 
-                    "Payment_Status"
-                ], 
-                match_value=[
-                    full_name, 
-                    payment_info.get("Course"), 
-                    payment_info.get("Course_Date"), 
-                    True,
-                    False
-                ]
-            )
-
-        if not rows or len(rows) != 1:
-
-            return {
-                "status": "error",
-                "message": f"Failed to fetch database from email with subject: {subject}"
-            }
+def _recorded_outcome(entry: dict) -> dict:
+    # What a duplicate delivery gets back: the outcome recorded the first time, or a retry hint
+    if entry["status"] in FINAL_STATUSES:
+        return {"status": entry["status"], "message": entry["message"], "duplicate": True}
+    return {
+        "status": "error",
+        "message": "This payment email is already being processed, check again in a moment.",
+        "duplicate": True,
+    }
 
-        # Step 3: Verify the payment amount
-        actual_amount = payment_info.get("Actual_Paid_Amount")
-        target_amount = rows[0].get("Amount_of_Payment")
+def process_payment_emails(emails: list[dict], source: str = "chat") -> list[dict]:
+    '''
+    Process payment emails idempotently: each one is looked up in the
+    processed-message ledger (app.tools.payment_ledger) by email ID and
+    content hash first. Emails already applied get their recorded outcome
+    back and do not touch the registrations; the others are parsed and
+    reconciled together in one pass (`reconcile_payments`), and their
+    outcomes are recorded.
 
-        if float(target_amount) <= actual_amount:
-            payment_info['Payment_Status'] = True
+    Args:
+        emails (list[dict]): {'id', 'subject', 'body'} per email, optionally 'sender'.
+        source (str): Where the emails come from, kept in the ledger (e.g. 'chat', 'imap:cfso').
+
+    Returns:
+        list[dict]: One {'status', 'message'} per email, in order; a
+        duplicate's result also has 'duplicate': True.
+    '''
+    ledger = get_ledger()
+    results: list = [None] * len(emails)
+    keys = []
+    first_of = {}
+    claimed = []
+    for i, email in enumerate(emails):
+        key = (str(email.get("id") or ""), content_hash(email.get("body")))
+        keys.append(key)
+        if key[1] in first_of:
+            # The same email twice in one batch (under any ID); it gets the first one's result below
+            continue
+        first_of[key[1]] = i
+        try:
+            entry = ledger.claim(*key, subject=email.get("subject"), source=source)
+        except sqlite3.Error as e:
+            # Without the ledger the email is still processed, just not deduplicated
+            print(f"❌ Payment ledger unavailable: {e}")
+            entry = None
+        if entry is None:
+            claimed.append(i)
         else:
-            # Step 4: Notify the staff and the client when the payment amount is not correct
-            payment_info['Payment_Status'] = False
-
-        # Step 5: Update the database record
-        update_success = update_to_csv(
-            payment_info, 
-            match_column=[
-                "Full_Name", 
-                "Course",
-                "Course_Date", 
-                "Paid"
-            ], 
-            match_value=[
-                full_name,
-                rows[0].get("Course"), 
-                rows[0].get("Course_Date"), 
-                ""
+            results[i] = _recorded_outcome(entry)
+        result = "new" if entry is None else "duplicate" if entry["status"] in FINAL_STATUSES else "in_progress"
+        metrics.inc("app_payment_ledger_total", 1, "Payment emails looked up in the ledger, by result.", result=result)
+
+    if claimed:
+        try:
+            payments = [
+                {"subject": emails[i].get("subject"),
+                 "payment_info": extract_payment_info(emails[i].get("body"), emails[i].get("subject"), emails[i].get("sender"))}
+                for i in claimed
             ]
-        ) or update_to_csv(
-                payment_info,
-                match_column=[
-                    "Full_Name", 
-                    "Course", 
-                    "Course_Date", 
-                    "Paid", 
-                    "Payment_Status"
-                ], 
-                match_value=[
-                    full_name, 
-                    rows[0].get("Course"), 
-                    rows[0].get("Course_Date"), 
-                    True,
-                    False
-                ]
-            )
-
-        if not update_success:
-
-           return {
+            outcomes = reconcile_payments(payments)
+        except Exception as e:
+            # Recorded as failed, so the claims do not block the next delivery until they time out
+            message = f"Unexpected Error happens during processing payment: {str(e)}"
+            payments = [{"payment_info": None} for _ in claimed]
+            outcomes = [{"status": "error", "message": message} for _ in claimed]
+        for i, payment, outcome in zip(claimed, payments, outcomes):
+            results[i] = outcome
+            try:
+                ledger.finish(*keys[i], outcome, payment["payment_info"])
+            except sqlite3.Error as e:
+                print(f"❌ Failed to record payment outcome in the ledger: {e}")
+
+    for i, key in enumerate(keys):
+        if results[i] is None:
+            results[i] = {**results[first_of[key[1]]], "duplicate": True}
+    return results
+
+def _normalized(series):
+    # Same comparison as get_from_csv: case-insensitive, surrounding whitespace ignored, missing == empty
+    return series.fillna("").astype(str).str.lower().str.strip()
+
+
+def _open_states(df):
+    # (unpaid, partially paid) row masks: Paid empty, or Paid=True with Payment_Status=False
+    paid = df["Paid"]
+    unpaid = paid.isna() | (paid.astype(str).str.strip() == "")
+    partial = (_normalized(paid) == "true") & (_normalized(df["Payment_Status"]) == "false") & ~unpaid
+    return unpaid, partial
+
+
+@database_utils.with_csv_lock
+def reconcile_payments(payments: list[dict]) -> list[dict]:
+    '''
+    Reconcile a batch of parsed payments against the registrations in one
+    pass: one CSV read, one index of the open registrations, one CSV write,
+    all under the CSV lock so no registration written meanwhile is lost.
+
+    Each payment is looked up by (Course, Course_Date) and name in a
+    RegistrationIndex (app.tools.registration_index), which matches the
+    name against both Full_Name and Payer_Full_Name regardless of word
+    order, commas and accents, and scores every candidate. The unpaid
+    registrations (Paid empty) are tried first and, when none matches
+    confidently, the partially paid ones (Paid=True, Payment_Status=False).
+    A payment that fits several registrations equally well is left for
+    staff. A registration claimed by several payments of the batch goes to
+    the first one; the others are matched again, in order, against the
+    updated records, so the outcome is the same as processing the emails
+    one by one.
+
+    Args:
+        payments (list[dict]): {'subject': str, 'payment_info': dict | None}
+            per email, payment_info as returned by `extract_payment_info`.
+
+    Returns:
+        list[dict]: One {'status': 'success' | 'partial' | 'error', 'message'}
+        per payment, in order; a matched payment also has 'match' (the
+        column that matched and its confidence), and an email that is not a
+        payment has 'retryable': False.
+    '''
+    import pandas as pd
+
+    outcomes: list = [None] * len(payments)
+    pending = []
+    for i, payment in enumerate(payments):
+        info = payment.get("payment_info")
+        # Scenario 1: Could not extract payment information
+        if not info or not info.get("Actual_Paid_Amount") or not info.get("Full_Name"):
+            outcomes[i] = {
                 "status": "error",
-                "message": f"Failed to update database from email with subject: {subject}"
+                "message": f"Failed to extract payment details from email with subject: {payment.get('subject')}",
+                # Parsing again gives the same result; every other error may pass on a later try
+                "retryable": False,
             }
-        
-        if payment_info['Payment_Status'] is False:
-            return {
-                "status": "partial",
-                "message": f"Payment amount {actual_amount} is less than required {target_amount} for email with subject: {subject}"
-            }
-        
-        return {
-            "status": "success",
-            "message": "Payment processed successfully."
-        }
+        else:
+            pending.append(i)
+    if not pending:
+        return outcomes
+
+    def fail_all(indexes, message):
+        for i in indexes:
+            outcomes[i] = {"status": "error", "message": f"{message} from email with subject: {payments[i].get('subject')}"}
+        return outcomes
+
+    csv_path = database_utils.cfg.get("path")
+    if not csv_path or not os.path.exists(os.fspath(csv_path)):
+        print("❌ CSV path missing or file does not exist")
+        return fail_all(pending, "Failed to fetch database")
+    try:
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
     except Exception as e:
-        
-        return {
-            "status": "error",
-            "message": f"Unexpected Error happens during processing payment: {str(e)}"
-        }
+        print(f"❌ Failed to read CSV file: {e}")
+        return fail_all(pending, "Failed to fetch database")
 
-def extract_payment_info(email_body: str) -> dict:
+    unpaid, partial = _open_states(df)
+    with timed("payment.index"):
+        # Rows only move from open to paid during the batch, so the open ones are all that can match
+        index = RegistrationIndex(df, df.index[unpaid | partial])
+    updated = []
+
+    while pending:
+        # Registration state as of this round
+        unpaid, partial = _open_states(df)
+        next_round = []
+        claimed = set()
+        for i in pending:
+            info = payments[i]["payment_info"]
+            found = index.candidates(info.get("Full_Name"), info.get("Course"), info.get("Course_Date"))
+            # Unpaid registrations take precedence over partially paid ones
+            for state in (unpaid, partial):
+                match, tied = resolve([c for c in found if state[c.row]])
+                if match is not None or tied:
+                    break
+            if tied:
+                names = ", ".join(f"{df.at[c.row, 'Full_Name']} ({c.column} {c.confidence:.2f})" for c in tied)
+                outcomes[i] = {
+                    "status": "error",
+                    "message": f"Payment matches {len(tied)} registrations ({names}), needs manual review, from email with subject: {payments[i].get('subject')}"
+                }
+                continue
+            if match is None:
+                outcomes[i] = {
+                    "status": "error",
+                    "message": f"Failed to fetch database from email with subject: {payments[i].get('subject')}"
+                }
+                continue
+            row = match.row
+            if row in claimed:
+                # Another payment of this batch got there first; match again against the updated record
+                next_round.append(i)
+                continue
+            claimed.add(row)
+
+            # Step 3: Verify the payment amount
+            info = dict(info)
+            if match.confidence < EXACT_CONFIDENCE:
+                # The email has the payer's spelling (or name); the registration keeps its own
+                info.pop("Full_Name", None)
+            actual_amount = info.get("Actual_Paid_Amount")
+            target_amount = df.at[row, "Amount_of_Payment"]
+            try:
+                info["Payment_Status"] = float(target_amount) <= actual_amount
+            except (TypeError, ValueError) as e:
+                outcomes[i] = {
+                    "status": "error",
+                    "message": f"Unexpected Error happens during processing payment: {str(e)}"
+                }
+                continue
+
+            # Step 4: Update the record in memory; written once below
+            for k, v in info.items():
+                if isinstance(v, (list, tuple, dict)):
+                    v = json.dumps(v)
+                if k not in df.columns:
+                    df[k] = ""
+                if not pd.api.types.is_object_dtype(df[k].dtype):
+                    df[k] = df[k].astype(object)
+                df.at[row, k] = v
+            if "Updated_At" not in df.columns:
+                df["Updated_At"] = ""
+            if not pd.api.types.is_object_dtype(df["Updated_At"].dtype):
+                df["Updated_At"] = df["Updated_At"].astype(object)
+            df.at[row, "Updated_At"] = datetime.utcnow().isoformat()
+            updated.append(i)
+
+            if info["Payment_Status"] is False:
+                outcomes[i] = {
+                    "status": "partial",
+                    "message": f"Payment amount {actual_amount} is less than required {target_amount} for email with subject: {payments[i].get('subject')}"
+                }
+            else:
+                outcomes[i] = {"status": "success", "message": "Payment processed successfully."}
+            outcomes[i]["match"] = {"column": match.column, "confidence": match.confidence}
+        pending = next_round
+
+    if not updated:
+        return outcomes
+    # Step 5: One write for every payment of the batch
+    try:
+        with timed("csv.write"):
+            df.to_csv(csv_path, index=False)
+    except Exception as e:
+        print(f"❌ Failed to write to CSV file: {e}")
+        return fail_all(updated, "Failed to update database")
+    return outcomes
+
+def extract_payment_info(email_body: str, subject: str = None, sender: str = None) -> dict:
     """
-    Extract payment information from REAL Zeffy email format.
-    
-    Based on actual Zeffy template:
-    - Full_Name: Participant's Name (First & Last Name) 參加者的姓名（名字和姓氏） :
-    - Actual_Paid_Amount: TNew CA$125.00 payment received!
-    - Course: Standard First Aid with CPR Level C & AED Certification
-    - Course_Date: November 9, 2025 at 9:30 AM EST
-    - Payment_Status: False (updated after amount verification)
-    - Paid: True if (indicates if full name and payment amount matched)
-    
+    Extract payment information from a payment notification email, using
+    the parser templates in app.tools.payment_parsers (the Zeffy layout:
+    participant name, "New CA$125.00 payment received!", course name and
+    "November 9, 2025 at 9:30 AM EST").
+
     Args:
-        email_body (str): The email body text
-        
+        email_body (str): The email body, text or HTML
+        subject (str): The subject line, if known; narrows the template choice
+        sender (str): The From address, if known; narrows the template choice
+
     Returns:
         dict: Extracted payment information with keys matching database columns
+        (Full_Name, Actual_Paid_Amount, Course, Course_Date, Payment_Status=False,
+        Paid=True), or None if it is not a payment email
     """
-    payment_info = {}
-    
-    # Extract payer name - Participant's Name (First & Last Name) 參加者的姓名（名字和姓氏） : hiu man suen
-    name_patterns = [
-        r"Participant's Name.*?:\s*(.+?)\s*I have reviewed"
-    ]
-    
-    for pattern in name_patterns:
-        match = re.search(pattern, email_body, re.DOTALL)
-        if match:
-            # Zeffy format is "Last, First" - keep as is
-            payment_info['Full_Name'] = match.group(1).strip().replace(',', '')
-            break
-    # Extract amount - Real Zeffy format: "Total Amount Received" or "Paid amount"
-    amount_patterns = [
-        r"New\s*CA\$(\d+\.\d{2})"
-    ]
-    
-    for pattern in amount_patterns:
-        match = re.search(pattern, email_body, re.IGNORECASE)
-        if match:
-            amount_str = match.group(1).replace(',', '')
-            try:
-                payment_info['Actual_Paid_Amount'] = float(amount_str)
-                break
-            except ValueError:
-                continue
-    # Extract course date - Real Zeffy format: "November 9, 2025 at 4:00 PM EST"
-    date_pattern = r"\s*([A-Za-z]+\s+\d{1,2},\s+\d{4}\s+at\s+\d{1,2}:\d{2}\s+[AP]M\s+[A-Z]{3})"
-    match = re.search(date_pattern, email_body, re.IGNORECASE)
-    if match:
-        date_str = match.group(1).strip()
-        try:
-            # prefer dateutil (handles many TZ formats)
-            parsed_date = parser.parse(date_str)
-        except Exception:
-            # fallback: remove trailing timezone token and parse
-            no_tz = date_str.rsplit(' ', 1)[0]  # "November 16, 2025 at 9:30 AM"
-            parsed_date = datetime.strptime(no_tz, "%B %d, %Y at %I:%M %p")
-        payment_info['Course_Date'] = parsed_date.strftime("%Y-%m-%d")
-    # Extract course name: Standard First Aid with CPR Level C & AED Certification @ UNI-Commons x CFSO
-    course_pattern = r"^((?!.*New purchase).+?)\s*@ UNI-Commons x CFSO"
-    match = re.search(course_pattern, email_body, re.MULTILINE)
-    if match:
-        payment_info['Course'] = match.group(1).strip()
-    # Set payment status to True (paid) if we found key info
-    if 'Full_Name' in payment_info and 'Actual_Paid_Amount' in payment_info:
-        payment_info['Payment_Status'] = False  # Will be set to True after amount verification
-        payment_info['Paid'] = True
-        return payment_info
-    else:
-        return None
\ No newline at end of file
+    payment_info, _ = parse_payment_email(email_body, subject, sender)
+    if payment_info is None:
+        return None
+    payment_info['Payment_Status'] = False  # Will be set to True after amount verification
+    payment_info['Paid'] = True
+    return payment_info
@@ -0,0 +1,168 @@
+"""
+Index of open registrations for matching payments by name.
+
+Zeffy's "Participant's Name" is whatever the payer typed: the participant
+as registered, the same name in another order ("Doe, Jane"), without
+accents or a middle name, or the name of the parent or spouse who paid,
+which the registration form stores as `Payer_Full_Name`. The index keys
+every registration by (Course, Course_Date) and, within that, by a
+canonical form of both names (accents folded, punctuation dropped, words
+sorted). A payment then finds its candidate registrations with one
+dictionary probe, and each candidate gets a confidence:
+
+    1.0   Full_Name equal (case and surrounding spaces ignored), as before
+    0.95  Full_Name with the same words (order, commas, accents)
+    0.9   Payer_Full_Name with the same words
+    0.85  Full_Name words contain the payment's, or the other way round
+          (a missing middle name), at least two words in common
+    0.8   Payer_Full_Name likewise
+
+`resolve` accepts the best candidate at or above PAYMENT_MATCH_MIN_CONFIDENCE
+unless another registration scores within PAYMENT_MATCH_AMBIGUITY_MARGIN of
+it, e.g. a parent who paid for two children in the same session; those are
+left for staff instead of being applied to a guess.
+"""
+import re
+import unicodedata
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.config import Config
+
+# (column, same-words confidence, contained-words confidence)
+NAME_COLUMNS = (("Full_Name", 0.95, 0.85), ("Payer_Full_Name", 0.9, 0.8))
+EXACT_CONFIDENCE = 1.0
+
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def _text(value) -> str:
+    # Missing CSV cells come back as NaN
+    if value is None or value != value:
+        return ""
+    return str(value).strip()
+
+
+def exact_key(value) -> str:
+    """Case-insensitive, surrounding whitespace ignored: the old exact comparison."""
+    return _text(value).lower()
+
+
+@lru_cache(maxsize=8192)
+def name_words(name: str) -> FrozenSet[str]:
+    """The words of a name, accents folded and punctuation dropped: "Doe, Jérôme" -> {"doe", "jerome"}."""
+    folded = unicodedata.normalize("NFKD", name.lower())
+    folded = "".join(ch for ch in folded if not unicodedata.combining(ch))
+    return frozenset(word for word in _NON_WORD_RE.split(folded.replace("_", " ")) if word)
+
+
+def _words_key(words: FrozenSet[str]) -> str:
+    return " ".join(sorted(words))
+
+
+def name_key(name) -> str:
+    """Order-insensitive canonical form of a name: "Doe, Jane" and "jane DOE" -> "doe jane"."""
+    return _words_key(name_words(_text(name)))
+
+
+@dataclass(frozen=True)
+class Candidate:
+    """A registration row a payment may belong to, and why."""
+    row: int
+    column: str
+    confidence: float
+
+
+class _Session:
+    """The registrations of one (Course, Course_Date)."""
+    __slots__ = ("exact", "by_key", "entries")
+
+    def __init__(self):
+        self.exact: Dict[str, List[int]] = {}
+        self.by_key: Dict[str, List[Tuple[int, str, float]]] = {}
+        self.entries: List[Tuple[int, str, FrozenSet[str], float]] = []
+
+
+class RegistrationIndex:
+    """
+    Registrations keyed by (Course, Course_Date) and canonical name, built
+    once from the registration DataFrame (see the module docstring).
+
+    Args:
+        df: The registration DataFrame.
+        rows: Row labels to index (default: all), e.g. only the open ones.
+    """
+
+    def __init__(self, df, rows: Iterable[int] = None):
+        self._sessions: Dict[Tuple[str, str], _Session] = {}
+        columns = [spec for spec in NAME_COLUMNS if spec[0] in df.columns]
+        for row in (df.index if rows is None else rows):
+            key = (exact_key(df.at[row, "Course"]), exact_key(df.at[row, "Course_Date"]))
+            session = self._sessions.get(key)
+            if session is None:
+                session = self._sessions[key] = _Session()
+            for column, same_words, contained in columns:
+                name = _text(df.at[row, column])
+                if not name:
+                    continue
+                if column == "Full_Name":
+                    session.exact.setdefault(name.lower(), []).append(row)
+                words = name_words(name)
+                session.by_key.setdefault(_words_key(words), []).append((row, column, same_words))
+                session.entries.append((row, column, words, contained))
+
+    def candidates(self, name, course, course_date) -> List[Candidate]:
+        """
+        Registrations of that course session whose name or payer name
+        matches `name`, best confidence per row, highest first.
+        """
+        session = self._sessions.get((exact_key(course), exact_key(course_date)))
+        name = _text(name)
+        if session is None or not name:
+            return []
+        best: Dict[int, Candidate] = {}
+
+        def offer(row, column, confidence):
+            if row not in best or confidence > best[row].confidence:
+                best[row] = Candidate(row, column, confidence)
+
+        for row in session.exact.get(name.lower(), ()):
+            offer(row, "Full_Name", EXACT_CONFIDENCE)
+        words = name_words(name)
+        for row, column, confidence in session.by_key.get(_words_key(words), ()):
+            offer(row, column, confidence)
+        for row, column, entry_words, confidence in session.entries:
+            common = words & entry_words
+            if len(common) >= 2 and common in (words, entry_words) and words != entry_words:
+                offer(row, column, confidence)
+        return sorted(best.values(), key=lambda c: (-c.confidence, c.row))
+
+
+def resolve(candidates: List[Candidate], min_confidence: float = None,
+            margin: float = None) -> Tuple[Optional[Candidate], List[Candidate]]:
+    """
+    Pick the registration a payment belongs to.
+
+    Args:
+        candidates (list): From `RegistrationIndex.candidates`, highest first.
+        min_confidence (float): Lowest confidence accepted (default: Config.PAYMENT_MATCH_MIN_CONFIDENCE).
+        margin (float): A rival this close to the best makes it ambiguous
+            (default: Config.PAYMENT_MATCH_AMBIGUITY_MARGIN).
+
+    Returns:
+        tuple: (the match, []) when there is one clear match, (None, the
+        tied candidates) when it is ambiguous, (None, []) when nothing is
+        confident enough.
+    """
+    min_confidence = Config.PAYMENT_MATCH_MIN_CONFIDENCE if min_confidence is None else min_confidence
+    margin = Config.PAYMENT_MATCH_AMBIGUITY_MARGIN if margin is None else margin
+    accepted = [c for c in candidates if c.confidence >= min_confidence]
+    if not accepted:
+        return None, []
+    best = accepted[0]
+    # Rounded so that 1.0 - 0.9 counts as a 0.1 gap
+    tied = [c for c in accepted if round(best.confidence - c.confidence, 6) < margin]
+    if len(tied) > 1:
+        return None, tied
+    return best, []
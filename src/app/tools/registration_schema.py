@@ -0,0 +1,237 @@
+"""
+Schema-compiled extraction of JotForm registration payloads.
+
+JotForm names every answer after its question, e.g. `q3_legalName` or
+`q17_payersName17`, and the numbering differs from form to form. Fields are
+therefore declared by the part of the key that does not change (`FIELDS`),
+and a payload key is matched by substring, the first key in payload order
+winning. Resolving that means scanning every key of the payload, and
+submissions are wide (a hundred or more keys, most of them not needed).
+
+The resolved field map (field -> actual key) only depends on the form, so
+it is computed in one pass over the keys and cached per form ID (taken from
+`slug`), for the last JOTFORM_SCHEMA_CACHE_SIZE forms. A cached map is
+reused only when the payload has exactly the same keys in the same order,
+so an edited form, or a payload built by the chat agent, is resolved again
+instead of being read with a stale map. Every field is then read with one
+dictionary lookup and checked for its type: a malformed payload fails with
+a ValueError naming the field, instead of a TypeError deep inside the
+registration service.
+
+Course titles ("11.09 (Sun) Standard First Aid ...") are split into course
+and date through a cache as well, since every registration of a session
+has the same title.
+"""
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from app.config import Config
+from app.utils.extraction_tools import extract_form_id
+
+
+@dataclass(frozen=True)
+class FormField:
+    """
+    One answer of the registration form.
+
+    Attributes:
+        name: Field name in `RegistrationPayload`.
+        key: The stable part of the JotForm key.
+        exact: Match the whole key instead of a substring (upload fields).
+    """
+    name: str
+    key: str
+    exact: bool = False
+
+
+FIELDS: Tuple[FormField, ...] = (
+    FormField("slug", "slug"),
+    FormField("legal_name", "legalName"),
+    FormField("email", "email"),
+    FormField("phone_number", "phoneNumber"),
+    FormField("payer_name", "payersName"),
+    FormField("status_answer", "areYou"),
+    FormField("pr_card_number", "prCard"),
+    FormField("pr_card_urls", "clearFront", exact=True),
+    FormField("e_transfer_urls", "uploadEtransfer", exact=True),
+    FormField("course", "course"),
+    FormField("payment_link", "paymentlink"),
+)
+
+_COURSE_DATE_RE = re.compile(r'(?:\d{4}\.)?\d{1,2}\.\d{1,2}\s*\([A-Za-z]{3}\)')
+
+
+@dataclass
+class RegistrationPayload:
+    """The typed answers of one registration submission."""
+    form_id: Optional[str]
+    first_name: str
+    last_name: str
+    email: Optional[str] = None
+    phone_number: Optional[str] = None
+    payer_full_name: Optional[str] = None
+    status_answer: str = ""
+    pr_card_number: Optional[str] = None
+    pr_card_urls: List[str] = field(default_factory=list)
+    # None when the form has no e-transfer upload question at all
+    e_transfer_urls: Optional[List[str]] = None
+    course_title: str = ""
+    payment_link: Optional[str] = None
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.first_name} {self.last_name}"
+
+
+def resolve_fields(keys) -> Dict[str, Optional[str]]:
+    """
+    field name -> payload key for every field in FIELDS, in one pass over
+    `keys`: the first key containing the field's key (or equal to it, for
+    exact fields), None if there is none.
+    """
+    resolved: Dict[str, Optional[str]] = {f.name: None for f in FIELDS}
+    open_fields = list(FIELDS)
+    for key in keys:
+        if not open_fields:
+            break
+        for form_field in list(open_fields):
+            if (key == form_field.key) if form_field.exact else (form_field.key in key):
+                resolved[form_field.name] = key
+                open_fields.remove(form_field)
+    return resolved
+
+
+class FieldMapCache:
+    """LRU cache of form ID -> (payload keys, resolved field map). Thread-safe."""
+
+    def __init__(self, max_forms: int = None):
+        self.max_forms = max_forms or Config.JOTFORM_SCHEMA_CACHE_SIZE
+        self._lock = threading.Lock()
+        self._maps: "OrderedDict[str, Tuple[tuple, Dict[str, Optional[str]]]]" = OrderedDict()
+
+    def field_map(self, data: dict) -> Dict[str, Optional[str]]:
+        keys = tuple(data)
+        slug = data.get("slug")
+        form_id = extract_form_id(slug) if isinstance(slug, str) else None
+        if form_id is None:
+            return resolve_fields(keys)
+        with self._lock:
+            cached = self._maps.get(form_id)
+            if cached is not None and cached[0] == keys:
+                self._maps.move_to_end(form_id)
+                return cached[1]
+        resolved = resolve_fields(keys)
+        with self._lock:
+            self._maps[form_id] = (keys, resolved)
+            self._maps.move_to_end(form_id)
+            while len(self._maps) > self.max_forms:
+                self._maps.popitem(last=False)
+        return resolved
+
+    def clear(self) -> None:
+        with self._lock:
+            self._maps.clear()
+
+
+_cache = FieldMapCache()
+
+
+def _name(value, field_name: str, required: bool) -> Optional[Tuple[str, str]]:
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"{field_name} is missing")
+        return None
+    if not isinstance(value, dict):
+        raise ValueError(f"{field_name} must have 'first' and 'last'")
+    first, last = value.get("first"), value.get("last")
+    if not isinstance(first, str) or not isinstance(last, str) or not (first.strip() or last.strip()):
+        if required:
+            raise ValueError(f"{field_name} must have 'first' and 'last'")
+        return None
+    return first, last
+
+
+def _optional_str(value, field_name: str) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (str, int, float)):
+        return str(value)
+    raise ValueError(f"{field_name} must be text")
+
+
+def _urls(value) -> List[str]:
+    return [url for url in value if isinstance(url, str)] if isinstance(value, list) else []
+
+
+def extract_registration(data: dict) -> RegistrationPayload:
+    """
+    Read a registration submission through the cached field map of its form.
+
+    Raises:
+        ValueError: A field is missing or has the wrong shape.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("registration data must be an object")
+    keys = _cache.field_map(data)
+
+    def value(name):
+        key = keys[name]
+        return data.get(key) if key is not None else None
+
+    slug = value("slug")
+    legal_name = _name(value("legal_name"), "legalName", required=True)
+    payer_name = _name(value("payer_name"), "payersName", required=False)
+
+    phone = value("phone_number")
+    if isinstance(phone, dict):
+        phone = phone.get("full")
+
+    course = value("course")
+    course_title = ""
+    if isinstance(course, dict):
+        products = course.get("products")
+        if not isinstance(products, list) or not products or not isinstance(products[0], dict):
+            raise ValueError("course must list the selected product")
+        course_title = str(products[0].get("productName") or "")
+    elif isinstance(course, str):
+        course_title = course
+
+    return RegistrationPayload(
+        form_id=extract_form_id(slug) if isinstance(slug, str) else None,
+        first_name=legal_name[0],
+        last_name=legal_name[1],
+        email=_optional_str(value("email"), "email"),
+        phone_number=_optional_str(phone, "phoneNumber"),
+        payer_full_name=f"{payer_name[0]} {payer_name[1]}" if payer_name else None,
+        status_answer=_optional_str(value("status_answer"), "areYou") or "",
+        pr_card_number=_optional_str(value("pr_card_number"), "prCard"),
+        pr_card_urls=_urls(value("pr_card_urls")),
+        e_transfer_urls=_urls(value("e_transfer_urls")) if keys["e_transfer_urls"] is not None else None,
+        course_title=course_title,
+        payment_link=_optional_str(value("payment_link"), "paymentlink"),
+    )
+
+
+@lru_cache(maxsize=512)
+def _split_course_title(title: str, year: int) -> Tuple[str, str]:
+    match = _COURSE_DATE_RE.search(title)
+    if not match:
+        return title.strip(), ""
+    date_part = match.group(0).split('(')[0].strip()
+    if date_part.count('.') == 2:
+        # format YYYY.MM.DD
+        course_date = datetime.strptime(date_part, '%Y.%m.%d').strftime('%Y-%m-%d')
+    else:
+        # format MM.DD or M.D -> prepend current year
+        course_date = datetime.strptime(f"{year}.{date_part}", '%Y.%m.%d').strftime('%Y-%m-%d')
+    return title[match.end():].strip(), course_date
+
+
+def split_course_title(title: str) -> Tuple[str, str]:
+    """"11.09 (Sun) Standard First Aid" -> ("Standard First Aid", "<this year>-11-09"); ("title", "") without a date."""
+    return _split_course_title(title, datetime.utcnow().year)
@@ -1,36 +1,208 @@
-from app.utils.database_utils import get_from_csv
+"""
+Payment reminders for registrations that are still unpaid.
+
+`send_payment_reminders` reads the registrations once and selects those
+created REMINDER_DAYS_AFTER_REGISTRATION days ago that have no payment and
+no reminder yet (`Notified`). It renders one email per registration from
+the templates in app/templates/email (subject, text and HTML, compiled once
+per process) and sends them all through an SMTPPool: batched sessions,
+bounded concurrency and a rate limit (app.utils.smtp_utils). The rows that
+were sent are then marked `Notified` in one CSV write, so running the job
+again the same day sends nothing twice. The whole run (select, send, mark)
+holds the reminders lock, an flock on a file next to the CSV: the scheduler
+and a staff request in a web worker starting a run at the same time would
+otherwise both select the same rows and send each reminder twice.
+
+Run daily by app.scheduler (job `payment_reminders`), and on demand by
+staff through the `search_nonpaid_email` tool.
+"""
+from app.utils import database_utils, metrics
+from app.utils.metrics import timed
+from app.utils.smtp_utils import SMTPPool
 from app.config.config import Config
 
+import os
 from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import make_msgid
+from functools import lru_cache
+from pathlib import Path
+
+TEMPLATE_DIR = Path(__file__).resolve().parents[1] / "templates" / "email"
+
+# Separate from the CSV lock, which is only held for the final write: a run
+# holds this one while the emails go out
+_reminders_lock = database_utils.FileLock(lambda: database_utils.sidecar_path(".reminders.lock"))
+
+
+def _text(value) -> str:
+    # Missing CSV cells come back as NaN
+    if value is None or value != value:
+        return ""
+    return str(value).strip()
+
+
+def _support_contact(row: dict) -> str:
+    return Config.CFSO_ADMIN_EMAIL_USER if _text(row.get("PR_Status")).lower() == "true" else Config.UNIC_ADMIN_EMAIL_USER
+
+
+@lru_cache(maxsize=None)
+def _templates():
+    # (subject, text, html) templates of the payment reminder, compiled once
+    from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+    env = Environment(loader=FileSystemLoader(str(TEMPLATE_DIR)), autoescape=select_autoescape(["html"]))
+    return tuple(env.get_template(f"payment_reminder{suffix}") for suffix in (".subject.txt", ".txt", ".html"))
+
+
+def select_unpaid(df, day: str):
+    """Rows of `df` created on `day` (YYYY-MM-DD) with no payment, an email address and no reminder sent yet."""
+    paid = df["Paid"]
+    unpaid = paid.isna() | (paid.astype(str).str.strip() == "")
+    created = df["Created_At"].fillna("").astype(str).str.strip().str[:10] == day
+    has_email = df["Email"].fillna("").astype(str).str.strip() != ""
+    mask = unpaid & created & has_email
+    if "Notified" in df.columns:
+        mask &= df["Notified"].fillna("").astype(str).str.strip().str.lower() != "true"
+    return df[mask]
+
+
+def render_reminder(row: dict) -> EmailMessage:
+    """The reminder email for one registration row."""
+    subject, text, html = _templates()
+    context = {
+        "full_name": _text(row.get("Full_Name")),
+        "course": _text(row.get("Course")),
+        "course_date": _text(row.get("Course_Date")),
+        "payment_link": _text(row.get("Payment_Link")),
+        "support_contact": _support_contact(row),
+    }
+    message = EmailMessage()
+    message["Subject"] = subject.render(context).strip()
+    message["From"] = Config.MAIL_DEFAULT_SENDER
+    message["To"] = _text(row.get("Email"))
+    message["Message-ID"] = make_msgid()
+    message.set_content(text.render(context))
+    message.add_alternative(html.render(context), subtype="html")
+    return message
+
 
-def reminder_nonpaid_email() -> list[dict]:
-    yesterday = (datetime.utcnow() - timedelta(days=1)).strftime('%Y-%m-%d')
-    rows = get_from_csv(match_column=["Paid", "Created_At"], match_value=["",yesterday])
-    detail = []
+@database_utils.with_csv_lock
+def _mark_notified(sent: dict) -> bool:
+    """
+    Set Notified=True on the sent rows (index -> email address) in one CSV
+    write, under the CSV lock. The CSV is read again first, since web
+    workers may have written to it while the emails were going out.
+    """
+    import pandas as pd
+
+    csv_path = database_utils.cfg.get("path")
+    try:
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
+    except Exception as e:
+        print(f"❌ Failed to read CSV file: {e}")
+        return False
+    for col in ("Notified", "Updated_At"):
+        if col not in df.columns:
+            df[col] = ""
+        if not pd.api.types.is_object_dtype(df[col].dtype):
+            df[col] = df[col].astype(object)
+    # Rows are only ever appended, so the index still points at the same registration; the email checks it
+    rows = [i for i, email in sent.items() if i in df.index and _text(df.at[i, "Email"]) == email]
+    now = datetime.utcnow().isoformat()
+    df.loc[rows, "Notified"] = True
+    df.loc[rows, "Updated_At"] = now
     try:
-        for row in rows:
-            email = row.get("Email")
-            full_name = row.get("Full_Name")
-            course = row.get("Course")
-            course_date = row.get("Course_Date")
-            payment_link = row.get("Payment_Link")
-            support_contact = Config.CFSO_ADMIN_EMAIL_USER if row.get("PR_Status") else Config.UNIC_ADMIN_EMAIL_USER
-            info = {
-                "Course": course,
-                "Course Date": course_date,
-                "Full_name": full_name,
-                "Payment Link": payment_link,
-                "Support Contact": support_contact,
-                "Notified": False,
-                "Email": email
-            }
-
-            detail.append(info)
+        with timed("csv.write"):
+            df.to_csv(csv_path, index=False)
+    except Exception as e:
+        print(f"❌ Failed to write to CSV file: {e}")
+        return False
+    return True
+
+
+def send_payment_reminders(day: str = None, pool: SMTPPool = None) -> dict:
+    """
+    Email a payment reminder to every unpaid registration of `day`.
+
+    Args:
+        day (str): Registration date, YYYY-MM-DD (default: REMINDER_DAYS_AFTER_REGISTRATION days ago).
+        pool (SMTPPool): Where to send from (default: an SMTPPool on the Config mail server).
+
+    Returns:
+        dict: 'status' ('success', 'partial' or 'error'), 'message', and
+        under 'data' one entry per selected registration, with 'Notified'
+        telling whether its reminder went out.
+    """
+    day = day or (datetime.utcnow() - timedelta(days=Config.REMINDER_DAYS_AFTER_REGISTRATION)).strftime('%Y-%m-%d')
+    with _reminders_lock.hold():
+        return _send_payment_reminders(day, pool)
 
+
+def _send_payment_reminders(day: str, pool: SMTPPool) -> dict:
+    import pandas as pd
+
+    csv_path = database_utils.cfg.get("path")
+    if not csv_path or not os.path.exists(os.fspath(csv_path)):
+        print("❌ CSV path missing or file does not exist")
+        return {"status": "error", "message": "Failed to fetch database", "data": []}
+    try:
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
+        rows = select_unpaid(df, day)
     except Exception as e:
         return {
             "status": "error",
-            "message": f"Unexpected Error happens during sending reminder email: {str(e)}"
+            "message": f"Unexpected Error happens during sending reminder email: {str(e)}",
+            "data": []
+        }
+
+    detail, messages, indexes = [], [], []
+    for index, row in rows.to_dict(orient="index").items():
+        info = {
+            "Course": _text(row.get("Course")),
+            "Course Date": _text(row.get("Course_Date")),
+            "Full_name": _text(row.get("Full_Name")),
+            "Payment Link": _text(row.get("Payment_Link")),
+            "Support Contact": _support_contact(row),
+            "Notified": False,
+            "Email": _text(row.get("Email")),
         }
+        try:
+            messages.append(render_reminder(row))
+            indexes.append(index)
+        except Exception as e:
+            info["Error"] = f"Failed to render reminder: {e}"
+        detail.append(info)
+    if not detail:
+        return {"status": "success", "message": f"No unpaid registrations from {day} to remind", "data": []}
+
+    pool = pool or SMTPPool()
+    with timed("smtp.send"):
+        errors = pool.send(messages) if messages else []
+    sent = {}
+    by_index = dict(zip(rows.index, detail))
+    for index, error in zip(indexes, errors):
+        if error:
+            by_index[index]["Error"] = error
+        else:
+            by_index[index]["Notified"] = True
+            sent[index] = by_index[index]["Email"]
+    failed = len(detail) - len(sent)
+    metrics.inc("app_payment_reminders_total", len(sent), "Payment reminder emails, by outcome.", status="sent")
+    metrics.inc("app_payment_reminders_total", failed, "Payment reminder emails, by outcome.", status="failed")
+
+    if sent and not _mark_notified(sent):
+        # Sent but not recorded: the next run would send them again
+        return {"status": "error", "message": f"{len(sent)} reminder emails sent but failed to update database", "data": detail}
+    message = f"{len(sent)} reminder emails sent, {failed} failed"
+    status = "success" if not failed else "partial" if sent else "error"
+    if failed:
+        print(f"❌ Payment reminders for {day}: {message}")
+    return {"status": status, "message": message, "data": detail}
+
 
-    return {"status":"success","message":"Reminder emails sent successfully","data":detail}
\ No newline at end of file
+def reminder_nonpaid_email() -> dict:
+    """Send the payment reminders of the registrations from REMINDER_DAYS_AFTER_REGISTRATION days ago (yesterday)."""
+    return send_payment_reminders()
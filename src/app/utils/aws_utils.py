@@ -1,28 +1,39 @@
 from io import BytesIO
-import boto3
-import cv2
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import time
+import uuid
 from PIL import Image
 from app.config.config import Config
 from app.utils.image_utils import image_preprocess
+from app.utils.metrics import timed
 class AWSService:
     """
     AWS Service class to handle interactions with AWS services like S3 and AWS Textract.
     """
 
-    def __init__(self):
-        self.s3 = boto3.client(
+    def __init__(self, s3_client=None, textract_client=None):
+        """
+        Args:
+            s3_client: Optional pre-built S3 client (e.g. a local S3 stand-in).
+            textract_client: Optional pre-built Textract client.
+        """
+        # boto3 takes a while to import; only code that talks to AWS needs it
+        import boto3
+
+        self.s3 = s3_client or boto3.client(
             's3',
             aws_access_key_id=Config.AWS_ACCESS_KEY,
             aws_secret_access_key=Config.AWS_SECRET_KEY,
-            region_name=Config.REGION_NAME
+            region_name=Config.REGION_NAME,
+            endpoint_url=Config.AWS_ENDPOINT_URL
         )
         self.bucket_name = Config.S3_BUCKET_NAME
-        self.textract = boto3.client(
+        self.textract = textract_client or boto3.client(
             'textract',
             aws_access_key_id=Config.AWS_ACCESS_KEY,
             aws_secret_access_key=Config.AWS_SECRET_KEY,
-            region_name=Config.REGION_NAME
+            region_name=Config.REGION_NAME,
+            endpoint_url=Config.AWS_ENDPOINT_URL
         )
 
     def upload_file(self, local_path, s3_key):
@@ -67,6 +78,56 @@ class AWSService:
             return False
         return True
 
+    def upload_parts(self, parts, s3_key, mime_type):
+        """
+        Upload an iterable of byte chunks to S3 as a multipart upload, without
+        holding the whole object in memory. Every part except the last must be
+        at least 5 MB (an S3 requirement).
+
+        Args:
+            parts (Iterable[bytes]): The object body, one part per item.
+            s3_key (str): The destination key (path) inside the S3 bucket.
+            mime_type (str): MIME type (Content-Type) of the uploaded object.
+
+        Returns:
+            int | None: Number of bytes uploaded, or None if the upload failed.
+        """
+        upload_id = None
+        try:
+            upload = self.s3.create_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                ContentType=mime_type
+            )
+            upload_id = upload['UploadId']
+            completed = []
+            total = 0
+            for number, body in enumerate(parts, start=1):
+                response = self.s3.upload_part(
+                    Bucket=self.bucket_name,
+                    Key=s3_key,
+                    UploadId=upload_id,
+                    PartNumber=number,
+                    Body=body
+                )
+                completed.append({'ETag': response['ETag'], 'PartNumber': number})
+                total += len(body)
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket_name,
+                Key=s3_key,
+                UploadId=upload_id,
+                MultipartUpload={'Parts': completed}
+            )
+        except Exception as e:
+            print(f"Error in multipart upload to S3: {e}")
+            if upload_id:
+                try:
+                    self.s3.abort_multipart_upload(Bucket=self.bucket_name, Key=s3_key, UploadId=upload_id)
+                except Exception as abort_error:
+                    print(f"Error aborting multipart upload: {abort_error}")
+            return None
+        return total
+
     def download_file(self, s3_url):
         """
         Downloads a file from S3.
@@ -130,6 +191,43 @@ class AWSService:
                     })
         return items
 
+    @staticmethod
+    def _image_to_bytes(image) -> bytes:
+        """
+        Encode a cv2 image, PIL image or raw bytes to JPEG bytes for Textract.
+        """
+        import cv2
+        import numpy as np
+
+        if isinstance(image, np.ndarray):
+            image = np.ascontiguousarray(image)
+            ok, buf = cv2.imencode('.jpg', image)
+            if not ok:
+                raise RuntimeError("Failed to encode image for OCR API")
+            return buf.tobytes()
+        elif isinstance(image, bytes):
+            return image
+        elif isinstance(image, Image.Image):
+            bio = BytesIO()
+            image.save(bio, format='JPEG')
+            return bio.getvalue()
+        # fallback: try reading imgPath if provided
+        raise RuntimeError("No image bytes available for OCR API call")
+
+    @staticmethod
+    def _image_size(image, image_bytes: bytes) -> tuple:
+        """
+        Return (width, height) of the image in pixels.
+        """
+        import numpy as np
+
+        if isinstance(image, np.ndarray):
+            return image.shape[1], image.shape[0]
+        if isinstance(image, Image.Image):
+            return image.size
+        with Image.open(BytesIO(image_bytes)) as pil:
+            return pil.size
+
     def extract_text_from_image(self, image):
         """
         Converts the image at image to text using aws textract.
@@ -143,26 +241,96 @@ class AWSService:
         image_width = image.shape[1]
         image_height = image.shape[0]
 
-        if isinstance(image, np.ndarray):
-            image = np.ascontiguousarray(image)
-            ok, buf = cv2.imencode('.jpg', image)
-            if not ok:
-                raise RuntimeError("Failed to encode image for OCR API")
-            image_bytes = buf.tobytes()
-        elif isinstance(image, bytes):
-            image_bytes = image
-        elif isinstance(image, Image.Image):
-            bio = BytesIO()
-            image.save(bio, format='JPEG')
-            image_bytes = bio.getvalue()
-        else:
-            # fallback: try reading imgPath if provided
-            raise RuntimeError("No image bytes available for OCR API call")
+        image_bytes = self._image_to_bytes(image)
 
-        response = self.textract.detect_document_text(
-            Document={'Bytes': image_bytes}
-        )
+        with timed("textract"):
+            response = self.textract.detect_document_text(
+                Document={'Bytes': image_bytes}
+            )
         
         result = self.textract_to_items(response, image_width, image_height)
     
-        return result
\ No newline at end of file
+        return result
+
+    def _run_text_detection_job(self, image, key_prefix: str, poll_interval: float, timeout: float) -> list:
+        """
+        Stage one image to S3, run an asynchronous Textract text detection job
+        on it and collect every result page.
+        """
+        image_bytes = self._image_to_bytes(image)
+        image_width, image_height = self._image_size(image, image_bytes)
+        s3_key = f"{key_prefix.rstrip('/')}/{uuid.uuid4().hex}.jpg"
+
+        if not self.upload_object(BytesIO(image_bytes), s3_key, 'image/jpeg'):
+            raise RuntimeError(f"Failed to stage image to S3 key {s3_key}")
+
+        try:
+            job = self.textract.start_document_text_detection(
+                DocumentLocation={'S3Object': {'Bucket': self.bucket_name, 'Name': s3_key}}
+            )
+            job_id = job['JobId']
+
+            deadline = time.monotonic() + timeout
+            blocks = []
+            next_token = None
+            while True:
+                params = {'JobId': job_id, 'MaxResults': 1000}
+                if next_token:
+                    params['NextToken'] = next_token
+                response = self.textract.get_document_text_detection(**params)
+                status = response.get('JobStatus')
+
+                if status == 'IN_PROGRESS':
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Textract job {job_id} did not finish within {timeout}s")
+                    time.sleep(poll_interval)
+                    continue
+                if status not in ('SUCCEEDED', 'PARTIAL_SUCCESS'):
+                    raise RuntimeError(f"Textract job {job_id} ended with status {status}: {response.get('StatusMessage', '')}")
+
+                blocks.extend(response.get('Blocks', []))
+                next_token = response.get('NextToken')
+                if not next_token:
+                    break
+        finally:
+            try:
+                self.s3.delete_object(Bucket=self.bucket_name, Key=s3_key)
+            except Exception as e:
+                print(f"Error deleting staged Textract object {s3_key}: {e}")
+
+        return self.textract_to_items({'Blocks': blocks}, image_width, image_height)
+
+    def extract_text_from_images_batch(self, images, key_prefix: str = "textract-batch", max_concurrency: int = None,
+                                       poll_interval: float = None, timeout: float = None) -> list:
+        """
+        Converts many images to text using asynchronous aws textract jobs.
+
+        Every image is staged to S3 with `upload_object`, submitted with
+        `start_document_text_detection` and its (paginated) results are collected
+        with `get_document_text_detection`. At most `max_concurrency` jobs are in
+        flight at any time.
+
+        Args:
+            images (list): cv2 images, PIL images or raw image bytes.
+            key_prefix (str): S3 key prefix used to stage the images.
+            max_concurrency (int): Maximum number of Textract jobs running at once.
+            poll_interval (float): Seconds to wait between job status polls.
+            timeout (float): Maximum seconds to wait for a single job.
+        Returns:
+            list: One entry per input image, in input order. Each entry is the
+                  same item list `textract_to_items` returns, or None if the job failed.
+        """
+        max_concurrency = max_concurrency or Config.TEXTRACT_BATCH_CONCURRENCY
+        poll_interval = Config.TEXTRACT_POLL_INTERVAL if poll_interval is None else poll_interval
+        timeout = timeout or Config.TEXTRACT_JOB_TIMEOUT
+
+        def run(image):
+            try:
+                with timed("textract.batch_job"):
+                    return self._run_text_detection_job(image, key_prefix, poll_interval, timeout)
+            except Exception as e:
+                print(f"Error running Textract batch job: {e}")
+                return None
+
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            return list(executor.map(run, images))
@@ -1,41 +1,98 @@
-from flask import current_app
-from datetime import datetime
-import pandas as pd
 from datetime import datetime
+import functools
 import os
 import json
+import threading
+from contextlib import contextmanager
 from pathlib import Path
-import numpy as np
 
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+from app.utils.metrics import timed
+
+# pandas (and NumPy) are imported by the functions that read the CSV: importing
+# them takes longer than the rest of the app's startup together
 
 project_root = Path(__file__).resolve().parents[2]
 
 path = project_root / "data" / "registration_data.csv"
 
-# ensure parent directory exists
-path.parent.mkdir(parents=True, exist_ok=True)
+# The data directory is created by the first write, not on import
 cfg = {"path": path}
 
-def save_to_db(collection_name: str, data: dict) -> dict:
+
+class FileLock:
     """
-    Save a record to the specified MongoDB collection.
+    Lock held against other threads and other processes: a thread lock plus
+    an flock on a sidecar file. Reentrant within a thread. The file is
+    resolved on every outermost acquire, so it follows a changed CSV path.
 
     Args:
-        collection_name (str): The name of the MongoDB collection.
-        data (dict): The document to be saved.
+        lock_path: Callable returning the path of the lock file.
+    """
 
-    Returns:
-        dict: The inserted document (with _id).
+    def __init__(self, lock_path):
+        self._lock_path = lock_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    @contextmanager
+    def hold(self):
+        with self._lock:
+            if self._depth == 0 and fcntl is not None:
+                path = self._lock_path()
+                lock_dir = os.path.dirname(path)
+                if lock_dir:
+                    os.makedirs(lock_dir, exist_ok=True)
+                self._file = open(path, "a")
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0 and self._file is not None:
+                    fcntl.flock(self._file, fcntl.LOCK_UN)
+                    self._file.close()
+                    self._file = None
+
+
+def sidecar_path(suffix: str) -> str:
+    """A file next to the registrations CSV, e.g. sidecar_path(".lock")."""
+    return os.fspath(cfg["path"]) + suffix
+
+
+# Every write to the CSV reads the whole file, changes it and writes it back;
+# two of those running at once would lose one of the changes. The writers are
+# the web workers (add_to_csv / update_to_csv) and the batch jobs of the
+# scheduler process (payment reconciliation, reminders), so the lock is an
+# flock on a file next to the CSV, plus a thread lock within the process.
+_csv_lock = FileLock(lambda: sidecar_path(".lock"))
+
+
+def csv_lock():
     """
-    db = current_app.db  # uses app.db from your init_db()
-    data["created_at"] = datetime.utcnow().strftime('%Y-%m-%d')
+    Hold the registrations CSV for a read-modify-write, against other
+    threads and other processes. Reentrant within a thread, so a writer
+    holding it can call add_to_csv / update_to_csv.
+    """
+    return _csv_lock.hold()
+
 
-    result = db[collection_name].insert_one(data)
-    data["_id"] = str(result.inserted_id)
+def with_csv_lock(func):
+    """Run `func` under `csv_lock`."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with csv_lock():
+            return func(*args, **kwargs)
+    return wrapper
 
-    print(f"✅ Saved record to '{collection_name}' with ID {data['_id']}")
-    return data
 
+@with_csv_lock
 def add_to_csv(data: dict):
     """
     Append a single record to the CSV file defined in current_app.db['path'].
@@ -46,6 +103,8 @@ def add_to_csv(data: dict):
     Returns:
        A pandas DataFrame containing the new row or False.
     """
+    import pandas as pd
+
     csv_path = cfg.get("path")
 
     if not csv_path or not os.path.exists(os.fspath(csv_path)):
@@ -53,7 +112,8 @@ def add_to_csv(data: dict):
         return False 
 
     try:
-        df = pd.read_csv(csv_path)
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
     except Exception as e:
         print(f"❌ Failed to read CSV file: {e}")
         return False
@@ -77,13 +137,15 @@ def add_to_csv(data: dict):
         csv_dir = os.path.dirname(os.fspath(csv_path))
         if csv_dir:
             os.makedirs(csv_dir, exist_ok=True)
-        df.to_csv(csv_path, index=False)
+        with timed("csv.write"):
+            df.to_csv(csv_path, index=False)
     except Exception:
         print("❌ Failed to write to CSV file")
         return False
     
     return new_row
 
+@with_csv_lock
 def update_to_csv(data: dict, match_column: list[str], match_value: list) -> bool:
     """
     Update or append a record in the CSV backing store.
@@ -96,6 +158,9 @@ def update_to_csv(data: dict, match_column: list[str], match_value: list) -> boo
     Returns:
         bool: True on success, False on missing CSV path or I/O errors.
     """
+    import numpy as np
+    import pandas as pd
+
     csv_path = cfg.get("path")
     if not csv_path or not os.path.exists(os.fspath(csv_path)):
         print("❌ CSV path missing or file does not exist")
@@ -103,7 +168,8 @@ def update_to_csv(data: dict, match_column: list[str], match_value: list) -> boo
 
     # Load the latest dataframe from disk
     try:
-        df = pd.read_csv(csv_path)
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
     except Exception as e:
         print(f"❌ Failed to read CSV file: {e}")
         return False
@@ -155,7 +221,8 @@ def update_to_csv(data: dict, match_column: list[str], match_value: list) -> boo
         csv_dir = os.path.dirname(os.fspath(csv_path))
         if csv_dir:
             os.makedirs(csv_dir, exist_ok=True)
-        df.to_csv(csv_path, index=False)
+        with timed("csv.write"):
+            df.to_csv(csv_path, index=False)
     except Exception as e:
         print(f"❌ Failed to write to CSV file: {e}")
         return False
@@ -173,13 +240,16 @@ def get_from_csv(match_column: list[str], match_value:list):
     Returns:
         dict | None: The matching record as a dictionary, or None if not found.
     """
+    import pandas as pd
+
     csv_path = cfg.get("path")
     if not csv_path or not os.path.exists(os.fspath(csv_path)):
         print("❌ CSV path missing or file does not exist")
         return None
 
     try:
-        df = pd.read_csv(csv_path)
+        with timed("csv.read"):
+            df = pd.read_csv(csv_path)
     except Exception as e:
         print(f"❌ Failed to read CSV file: {e}")
         return None
@@ -1,14 +1,16 @@
 from io import BytesIO
-from typing import Union, Optional
-import requests
-from bs4 import BeautifulSoup
-from PIL import Image
-import cv2
-import pytesseract
-from io import BytesIO
-import numpy as np
+import math
+from typing import TYPE_CHECKING, Union, Optional
+from PIL import Image, ImageOps
+
+# OpenCV, NumPy, Tesseract, requests and BeautifulSoup are imported by the
+# functions that use them, so importing this module (every tool does) stays cheap
+if TYPE_CHECKING:
+    import cv2
+    import numpy as np
 
 from app.config.config import Config
+from app.utils.metrics import timed
 
 def normalize(ocr_results, img_width: int, img_height: int) -> list:
     normalized_results = []
@@ -25,11 +27,68 @@ def normalize(ocr_results, img_width: int, img_height: int) -> list:
         normalized_results.append(normalize_item)
     return normalized_results
 
-def bytes_to_cv2(image_bytes: bytes) -> np.ndarray:
+def normalize_image(image_file, max_edge: int = None, quality: int = None) -> bytes:
+    """
+    Normalize an uploaded image for storage, OCR and the LLM.
+
+    Applies the EXIF orientation, drops all metadata, downscales so the long
+    edge is at most `max_edge` pixels and re-encodes as a JPEG of bounded quality.
+
+    Args:
+        image_file: Binary file-like object (or path) holding the uploaded image.
+        max_edge (int): Maximum length of the long edge in pixels.
+        quality (int): JPEG quality (1-95).
+
+    Returns:
+        bytes: The normalized JPEG image.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the file is not a readable image.
+    """
+    max_edge = max_edge or Config.UPLOAD_MAX_EDGE
+    quality = quality or Config.UPLOAD_JPEG_QUALITY
+
+    with Image.open(image_file) as img:
+        # draft() lets the JPEG decoder skip straight to a smaller scale for big photos
+        if img.format == "JPEG":
+            img.draft("RGB", (max_edge, max_edge))
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+
+        out = BytesIO()
+        # No exif/icc arguments: the re-encoded file carries no metadata
+        img.save(out, format="JPEG", quality=quality, optimize=True, progressive=True)
+        return out.getvalue()
+
+def estimate_image_tokens(width: int, height: int, detail: str = "high") -> int:
+    """
+    Estimate the OpenAI vision token cost of an image of the given size.
+    """
+    if detail == "low":
+        return 85
+    # The API fits the image in 2048x2048, then scales the short side to 768
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / 512) * math.ceil(height / 512)
+    return 85 + 170 * tiles
+
+def bytes_to_cv2(image_bytes: bytes) -> "np.ndarray":
     """
     Decode image bytes to an OpenCV BGR ndarray.
     Falls back to PIL if cv2.imdecode fails.
     """
+    import cv2
+    import numpy as np
+
     arr = np.frombuffer(image_bytes, np.uint8)
     img = cv2.imdecode(arr, cv2.IMREAD_COLOR)
     if img is None:
@@ -50,6 +109,8 @@ def get_image(source = 'URL', imgURL = None, imgPath = None):
     Returns:
         The image as a NumPy array.
     """
+    import cv2
+
     if source == 'URL':
         image_bytes = fetch_image_bytes(imgURL)
         image = bytes_to_cv2(image_bytes)
@@ -67,9 +128,12 @@ def local_image_to_text(image):
         list:  OCR results with text and bounding boxes.
     """
 
+    import pytesseract
+
     #image = image_preprocess(image)
 
-    boxes = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
+    with timed("tesseract"):
+        boxes = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
 
     ocr_result = []
     for i, word in enumerate(boxes["text"]):
@@ -101,6 +165,10 @@ def ninja_image_to_text(image):
         list: OCR results with text and bounding boxes. 
     """
 
+    import cv2
+    import numpy as np
+    import requests
+
     #image = image_preprocess(image)
 
     if isinstance(image, np.ndarray):
@@ -143,12 +211,29 @@ def extract_image_url(html_content: Union[str, bytes]) ->  Optional[str]:
     Raises:
         ValueError: If no <img> tag with a `src` attribute is found.
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, 'html.parser')
     img_tag = soup.find('img')
     if img_tag and img_tag.get('src'):
         return img_tag['src']
     raise ValueError("No image URL found in the provided HTML.")
 
+IMAGE_REQUEST_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/58.0.3029.110 Safari/537.3"
+    )
+}
+
+def _with_api_key(image_url: str) -> str:
+    # Safely append API key if it's configured.
+    if Config.JOTFORM_API_KEY:
+        sep = '&' if '?' in image_url else '?'
+        return f"{image_url}{sep}apiKey={Config.JOTFORM_API_KEY}"
+    return image_url
+
 def fetch_image_bytes(image_url: str) -> bytes:
     """
     Download an image from `image_url` and return its bytes.
@@ -169,21 +254,12 @@ def fetch_image_bytes(image_url: str) -> bytes:
         ValueError: If the response cannot be handled as an image.
         requests.HTTPError: On non-success HTTP responses.
     """
-    # Safely append API key if it's configured.
-    if Config.JOTFORM_API_KEY:
-        sep = '&' if '?' in image_url else '?'
-        full_url = f"{image_url}{sep}apiKey={Config.JOTFORM_API_KEY}"
-    else:
-        full_url = image_url
-    headers = {
-        "User-Agent": (
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-            "AppleWebKit/537.36 (KHTML, like Gecko) "
-            "Chrome/58.0.3029.110 Safari/537.3"
-        )
-    }
+    import requests
+
+    full_url = _with_api_key(image_url)
     try:
-        response = requests.get(full_url, headers=headers, timeout=15)
+        with timed("image_fetch"):
+            response = requests.get(full_url, headers=IMAGE_REQUEST_HEADERS, timeout=15)
     except requests.RequestException as e:
         raise
     try:
@@ -214,7 +290,50 @@ def fetch_image_bytes(image_url: str) -> bytes:
 
     raise ValueError(f"Unable to handle content type: {content_type}")
 
-def image_preprocess(img: cv2.Mat) -> cv2.Mat:
+_async_client = None
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        import httpx
+        _async_client = httpx.AsyncClient(headers=IMAGE_REQUEST_HEADERS, timeout=15, follow_redirects=True)
+    return _async_client
+
+async def afetch_image_bytes(image_url: str) -> bytes:
+    """
+    Async variant of `fetch_image_bytes` using a shared httpx client, so
+    image downloads do not block the event loop.
+
+    Raises:
+        ValueError: If the response cannot be handled as an image.
+        httpx.HTTPStatusError: On non-success HTTP responses.
+    """
+    with timed("image_fetch"):
+        response = await _get_async_client().get(_with_api_key(image_url))
+    response.raise_for_status()
+    content_type = response.headers.get('Content-Type', '')
+    if 'image' in content_type:
+        return response.content
+
+    if 'text/html' in content_type:
+        image_page_url = extract_image_url(response.content)
+        if not image_page_url.startswith('http'):
+            from urllib.parse import urljoin
+
+            image_page_url = urljoin(image_url, image_page_url)
+        return await afetch_image_bytes(image_page_url)
+
+    if response.status_code == 200:
+        image = Image.open(BytesIO(response.content))
+        buf = BytesIO()
+        image.save(buf, format='JPEG')
+        return buf.getvalue()
+
+    raise ValueError(f"Unable to handle content type: {content_type}")
+
+def image_preprocess(img: "cv2.Mat") -> "cv2.Mat":
+    import cv2
+
     cropped = None
     
     # Convert to grayscale
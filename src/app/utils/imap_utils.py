@@ -0,0 +1,105 @@
+"""
+Small IMAP helpers for reading notification mailboxes incrementally.
+
+Messages are addressed by UID, which the server never reuses for a mailbox
+as long as its UIDVALIDITY stays the same. A reader that remembers
+(UIDVALIDITY, highest UID seen) can ask for exactly the messages that
+arrived since, instead of searching and downloading the whole mailbox.
+"""
+import email
+import imaplib
+import re
+from datetime import date
+from email.message import Message
+from email.policy import default as default_policy
+from typing import Iterator, List, Optional, Tuple
+
+from app.config.config import Config
+
+_STATUS_RE = re.compile(rb"\((?P<items>[^)]*)\)")
+_FETCH_UID_RE = re.compile(rb"UID (\d+)")
+
+
+def connect(user: str, password: str, host: str = None, port: int = None, ssl: bool = None) -> imaplib.IMAP4:
+    """
+    Log in to the IMAP server from Config (IMAP_HOST, IMAP_PORT, IMAP_SSL),
+    or the given one, e.g. a local IMAP stand-in without TLS.
+    """
+    host = host or Config.IMAP_HOST
+    port = port or Config.IMAP_PORT
+    ssl = Config.IMAP_SSL if ssl is None else ssl
+    conn = imaplib.IMAP4_SSL(host, port) if ssl else imaplib.IMAP4(host, port)
+    conn.login(user, password)
+    return conn
+
+
+def mailbox_status(conn: imaplib.IMAP4, mailbox: str) -> Tuple[int, int]:
+    """
+    (UIDVALIDITY, UIDNEXT) of `mailbox`, in one round trip and without
+    selecting it.
+    """
+    typ, data = conn.status(quote_mailbox(mailbox), "(UIDVALIDITY UIDNEXT)")
+    if typ != "OK" or not data or not data[0]:
+        raise imaplib.IMAP4.error(f"STATUS {mailbox} failed: {data}")
+    match = _STATUS_RE.search(data[0])
+    items = match.group("items").split() if match else []
+    values = {items[i].upper(): int(items[i + 1]) for i in range(0, len(items) - 1, 2)}
+    return values[b"UIDVALIDITY"], values[b"UIDNEXT"]
+
+
+def search_uids(conn: imaplib.IMAP4, after_uid: int, sender: Optional[str] = None,
+                since: Optional[date] = None) -> List[int]:
+    """
+    UIDs above `after_uid` in the selected mailbox, optionally only from
+    `sender` and on or after `since`, in ascending order.
+    """
+    criteria = [f"UID {after_uid + 1}:*"]
+    if sender:
+        criteria.append(f'FROM "{sender}"')
+    if since:
+        criteria.append(f"SINCE {since.strftime('%d-%b-%Y')}")
+    typ, data = conn.uid("SEARCH", None, *criteria)
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID SEARCH failed: {data}")
+    # "n:*" always matches the newest message, even when its UID is below n
+    return sorted(uid for uid in (int(u) for u in (data[0] or b"").split()) if uid > after_uid)
+
+
+def fetch_messages(conn: imaplib.IMAP4, uids: List[int]) -> Iterator[Tuple[int, Message]]:
+    """
+    Fetch the full messages for `uids` in one command. BODY.PEEK leaves the
+    \\Seen flag alone, so staff still see the emails as unread.
+    """
+    if not uids:
+        return
+    typ, data = conn.uid("FETCH", ",".join(str(uid) for uid in uids), "(UID BODY.PEEK[])")
+    if typ != "OK":
+        raise imaplib.IMAP4.error(f"UID FETCH failed: {data}")
+    for item in data:
+        if not isinstance(item, tuple):
+            continue
+        match = _FETCH_UID_RE.search(item[0])
+        if match:
+            yield int(match.group(1)), email.message_from_bytes(item[1], policy=default_policy)
+
+
+def message_text(message: Message, html_to_text: bool = True) -> str:
+    """
+    The text of a message: its text/plain part, or its HTML part (turned
+    into text unless `html_to_text` is False) when there is no plain part.
+    """
+    part = message.get_body(preferencelist=("plain",))
+    if part is not None:
+        return part.get_content()
+    part = message.get_body(preferencelist=("html",))
+    if part is None:
+        return ""
+    if not html_to_text:
+        return part.get_content()
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(part.get_content(), "html.parser").get_text("\n")
+
+
+def quote_mailbox(mailbox: str) -> str:
+    """Mailbox names with spaces ("[Gmail]/All Mail") must be quoted."""
+    return mailbox if mailbox.startswith('"') else f'"{mailbox}"'
@@ -0,0 +1,297 @@
+"""
+Lightweight per-request stage timing and Prometheus-format metrics.
+
+Stages (LLM calls, tools, image fetch, Tesseract, Textract, CSV I/O) are timed
+with `timed(stage)`. Inside a `request_metrics(...)` block the timings are
+also collected into a per-request breakdown that is written as one JSON log
+line when the request ends. Every observation feeds a histogram that
+`render_metrics()` exposes in the Prometheus text format.
+
+With METRICS_ENABLED off, `timed` returns a shared no-op context manager, so
+instrumented code pays one attribute lookup and one call per stage.
+
+Gunicorn runs several worker processes, each with its own registry. When
+METRICS_DIR is set, every worker periodically writes a snapshot there and
+`render_metrics()` sums the snapshots of all workers. A worker's snapshot
+goes away with it (on exit, from gunicorn's `child_exit`, or at the next
+render if the process is gone), so restarted workers don't pile up in the
+sum; Prometheus sees the drop as a counter reset.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from app.config.config import Config
+
+logger = logging.getLogger("app.metrics")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+# Seconds; covers fast CSV reads up to slow OCR/LLM runs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HISTOGRAM_HELP = {
+    "app_stage_duration_seconds": "Time spent in one instrumented stage (LLM call, tool, OCR, CSV I/O, ...).",
+    "app_request_duration_seconds": "End-to-end duration of an API request.",
+}
+
+_lock = threading.Lock()
+# (metric name, sorted label items) -> [bucket counts..., sum, count]
+_histograms: Dict[Tuple[str, Tuple], list] = {}
+# (metric name, sorted label items) -> value
+_counters: Dict[Tuple[str, Tuple], float] = {}
+_counter_help: Dict[str, str] = {}
+_last_flush = 0.0
+
+# Per-request stage breakdown: stage -> [total seconds, calls]
+_current_request: ContextVar[Optional[dict]] = ContextVar("current_request_stages", default=None)
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    """Record one observation in the histogram `name`."""
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        values = _histograms.get(key)
+        if values is None:
+            values = _histograms[key] = [0] * (len(DEFAULT_BUCKETS) + 2)
+        for i, bound in enumerate(DEFAULT_BUCKETS):
+            if seconds <= bound:
+                values[i] += 1
+        values[-2] += seconds
+        values[-1] += 1
+
+
+def inc(name: str, amount: float = 1.0, help_text: str = None, **labels) -> None:
+    """Increment the counter `name`."""
+    if not Config.METRICS_ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + amount
+        if help_text:
+            _counter_help[name] = help_text
+
+
+def current_request_stages() -> Optional[dict]:
+    """The stage breakdown of the request running in this context, if any."""
+    return _current_request.get()
+
+
+def record_stage(stage: str, seconds: float, stages: Optional[dict] = None) -> None:
+    """
+    Record a finished stage in the histogram and in the request breakdown
+    (`stages`, defaulting to the request running in this context).
+    """
+    observe("app_stage_duration_seconds", seconds, stage=stage)
+    if stages is None:
+        stages = _current_request.get()
+    if stages is not None:
+        entry = stages.get(stage)
+        if entry is None:
+            stages[stage] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _NoopTimer()
+
+
+class _StageTimer:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+def timed(stage: str):
+    """
+    Context manager timing one stage, e.g. `with timed("csv.read"): ...`.
+    """
+    if not Config.METRICS_ENABLED:
+        return _NOOP
+    return _StageTimer(stage)
+
+
+@contextmanager
+def request_metrics(endpoint: str, session_id: str = None):
+    """
+    Collect the stage breakdown of one API request; on exit it is logged as a
+    JSON line and the request duration is recorded.
+    """
+    if not Config.METRICS_ENABLED:
+        yield
+        return
+    stages = {}
+    token = _current_request.set(stages)
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_request.reset(token)
+        observe("app_request_duration_seconds", elapsed, endpoint=endpoint)
+        logger.info(json.dumps({
+            "event": "request_timing",
+            "endpoint": endpoint,
+            "session_id": session_id,
+            "status": status,
+            "duration_ms": round(elapsed * 1000, 1),
+            "stages": {k: {"ms": round(v[0] * 1000, 1), "calls": v[1]} for k, v in stages.items()},
+        }))
+        _maybe_flush()
+
+
+# ------------------------------------------------------------
+# Per-worker snapshots
+# ------------------------------------------------------------
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            "histograms": [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()],
+            "counters": [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            "counter_help": dict(_counter_help),
+        }
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(Config.METRICS_DIR, f"metrics-{pid}.json")
+
+
+def _maybe_flush(force: bool = False) -> None:
+    global _last_flush
+    if not Config.METRICS_DIR:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < Config.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    try:
+        os.makedirs(Config.METRICS_DIR, exist_ok=True)
+        path = _snapshot_path(os.getpid())
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(_snapshot(), f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"❌ Failed to write metrics snapshot: {e}")
+
+
+def remove_snapshot(pid: int = None) -> None:
+    """Delete the snapshot of worker `pid` (default: this process), e.g. when it exits."""
+    if not Config.METRICS_DIR:
+        return
+    try:
+        os.remove(_snapshot_path(pid or os.getpid()))
+    except OSError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to another user
+        return True
+    return True
+
+
+atexit.register(remove_snapshot)
+
+
+def _merge(snapshots) -> Tuple[dict, dict, dict]:
+    histograms, counters, counter_help = {}, {}, {}
+    for snap in snapshots:
+        for name, labels, values in snap.get("histograms", []):
+            key = (name, tuple(tuple(l) for l in labels))
+            merged = histograms.setdefault(key, [0] * len(values))
+            for i, v in enumerate(values):
+                merged[i] += v
+        for name, labels, value in snap.get("counters", []):
+            key = (name, tuple(tuple(l) for l in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        counter_help.update(snap.get("counter_help", {}))
+    return histograms, counters, counter_help
+
+
+def _format_labels(labels, extra: Tuple = ()) -> str:
+    items = [f'{k}="{v}"' for k, v in tuple(labels) + extra]
+    return "{" + ",".join(items) + "}" if items else ""
+
+
+def render_metrics() -> str:
+    """
+    Render all metrics in the Prometheus text exposition format, summed over
+    every worker that has written a snapshot to METRICS_DIR.
+    """
+    snapshots = [_snapshot()]
+    if Config.METRICS_DIR:
+        own = _snapshot_path(os.getpid())
+        for path in glob.glob(os.path.join(Config.METRICS_DIR, "metrics-*.json")):
+            if path == own:
+                continue
+            pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+            if pid.isdigit() and not _pid_alive(int(pid)):
+                # A worker that died without cleaning up (killed, crashed)
+                remove_snapshot(int(pid))
+                continue
+            try:
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except Exception:
+                continue
+    histograms, counters, counter_help = _merge(snapshots)
+
+    lines = []
+    for name in sorted({k[0] for k in histograms}):
+        lines.append(f"# HELP {name} {HISTOGRAM_HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            # Buckets are stored cumulatively: an observation counts in every bound it fits under
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {values[i]}")
+            lines.append(f"{name}_bucket{_format_labels(labels, (('le', '+Inf'),))} {values[-1]}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]}")
+            lines.append(f"{name}_count{_format_labels(labels)} {values[-1]}")
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# HELP {name} {counter_help.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
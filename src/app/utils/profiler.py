@@ -0,0 +1,204 @@
+"""
+Opt-in sampling profiler for live requests.
+
+A request is profiled when it carries the admin header
+(`X-Profile-Token: <PROFILE_ADMIN_TOKEN>`) or is picked at random with
+probability PROFILE_SAMPLE_RATE. While it runs, a background thread samples
+the stacks of the request thread (and of any tool threads working for it)
+every PROFILE_INTERVAL seconds. The result is written to PROFILE_DIR in the
+"folded stacks" format understood by flamegraph.pl and speedscope, one file
+per request, tagged with the session ID and step.
+
+Only the sampled requests pay anything; the sampler never touches the
+profiled threads, it just reads their current frames.
+"""
+import hmac
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+
+from app.config.config import Config
+
+PROFILE_HEADER = "X-Profile-Token"
+
+_active: ContextVar[Optional["SamplingProfiler"]] = ContextVar("active_profiler", default=None)
+
+
+class SamplingProfiler:
+    """Samples the stacks of a set of threads until stopped."""
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or Config.PROFILE_INTERVAL
+        self.samples: Counter = Counter()
+        self._threads = set()
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def add_thread(self, thread_id: int) -> bool:
+        """Sample `thread_id` too. False if it already was, so the caller must not remove it."""
+        with self._threads_lock:
+            if thread_id in self._threads:
+                return False
+            self._threads.add(thread_id)
+            return True
+
+    def remove_thread(self, thread_id: int) -> None:
+        with self._threads_lock:
+            self._threads.discard(thread_id)
+
+    def start(self) -> "SamplingProfiler":
+        self._sampler.start()
+        return self
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._sampler.join()
+        return self.samples
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            with self._threads_lock:
+                threads = tuple(self._threads)
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[_fold(frame)] += 1
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+        return False
+
+
+def _fold(frame) -> str:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def should_profile(token: Optional[str] = None) -> bool:
+    """
+    True when the admin token matches or the request is picked by the sample rate.
+    """
+    # Constant-time comparison, as bytes since header values may not be ASCII
+    if token and Config.PROFILE_ADMIN_TOKEN and hmac.compare_digest(token.encode(), Config.PROFILE_ADMIN_TOKEN.encode()):
+        return True
+    return Config.PROFILE_SAMPLE_RATE > 0 and random.random() < Config.PROFILE_SAMPLE_RATE
+
+
+def _safe(value: Optional[str]) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", value or "none")[:64]
+
+
+def write_profile(samples: Counter, session_id: Optional[str], step: Optional[str]) -> Optional[str]:
+    """
+    Write folded stacks to PROFILE_DIR and apply the retention limits.
+
+    Returns:
+        str | None: Path of the written file, or None if there was nothing to write.
+    """
+    if not samples:
+        return None
+    os.makedirs(Config.PROFILE_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    path = os.path.join(Config.PROFILE_DIR, f"{stamp}-{_safe(step)}-{_safe(session_id)}.folded")
+    with open(path, "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    _apply_retention()
+    return path
+
+
+def _apply_retention() -> None:
+    try:
+        files = sorted(
+            (os.path.join(Config.PROFILE_DIR, name) for name in os.listdir(Config.PROFILE_DIR) if name.endswith(".folded")),
+            key=os.path.getmtime,
+        )
+    except OSError:
+        return
+    cutoff = time.time() - Config.PROFILE_MAX_AGE_HOURS * 3600
+    keep = []
+    for path in files:
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+            else:
+                keep.append(path)
+        except OSError:
+            continue
+    for path in keep[:max(0, len(keep) - Config.PROFILE_MAX_FILES)]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+@contextmanager
+def profile_request(session_id: Optional[str] = None, step: Optional[str] = None, token: Optional[str] = None):
+    """
+    Profile the enclosed block if `should_profile(token)` picks it. Tool
+    threads working for the request join the profile through
+    `join_active_profile` (app.ai.tool_executor) and
+    `app.ai.callbacks.ProfilingCallback`.
+    """
+    if not should_profile(token):
+        yield None
+        return
+    profiler = SamplingProfiler()
+    profiler.add_thread(threading.get_ident())
+    ctx_token = _active.set(profiler)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        _active.reset(ctx_token)
+        samples = profiler.stop()
+        try:
+            path = write_profile(samples, session_id, step)
+            if path:
+                print(f"🔥 Profile written to {path}")
+        except Exception as e:
+            print(f"❌ Failed to write profile: {e}")
+
+
+@contextmanager
+def join_active_profile():
+    """
+    Sample the calling thread as part of the active request profile (if
+    any) while the block runs. For worker threads doing a request's work;
+    the thread is left in the profile if it was already in it.
+    """
+    profiler = _active.get()
+    thread_id = threading.get_ident()
+    added = profiler is not None and profiler.add_thread(thread_id)
+    try:
+        yield
+    finally:
+        if added:
+            profiler.remove_thread(thread_id)
+
+
+def profiling_configured() -> bool:
+    """True when any request could be profiled (admin token set or sample rate > 0)."""
+    return bool(Config.PROFILE_ADMIN_TOKEN) or Config.PROFILE_SAMPLE_RATE > 0
+
+
+def active_profiler() -> Optional[SamplingProfiler]:
+    """The profiler of the request running in this context, if it is being profiled."""
+    return _active.get()
@@ -0,0 +1,137 @@
+"""
+Sending many emails over few SMTP connections.
+
+`SMTPPool.send` splits the messages into batches of `batch_size`. Each batch
+is sent over one SMTP session, so the server handshake (EHLO, STARTTLS,
+AUTH) happens once per batch instead of once per email, and a session never
+exceeds the per-connection message limit that most providers enforce. At
+most `connections` batches are in flight at once, and a shared token bucket
+keeps the send rate at or under `rate_per_second` across all of them.
+
+The server comes from Config (MAIL_SERVER, MAIL_PORT, MAIL_USE_TLS,
+MAIL_USE_SSL, MAIL_USERNAME, MAIL_PASSWORD). Any of these can be
+overridden, e.g. to point at a local SMTP sink while testing:
+
+    python -m aiosmtpd -n -l localhost:1025
+    MAIL_SERVER=localhost MAIL_PORT=1025 MAIL_USE_TLS=false ...
+
+Login is skipped when the server does not offer AUTH, as local sinks don't.
+"""
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from typing import List, Optional
+
+from app.config.config import Config
+
+
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` acquisitions per second, bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SMTPPool:
+    """
+    Batched, rate-limited sending over a bounded number of SMTP connections
+    (see the module docstring). Settings default to Config.
+    """
+
+    def __init__(self, host: str = None, port: int = None, username: str = None, password: str = None,
+                 use_tls: bool = None, use_ssl: bool = None, connections: int = None,
+                 batch_size: int = None, rate_per_second: float = None, timeout: float = 30):
+        self.host = host or Config.MAIL_SERVER
+        self.port = port or Config.MAIL_PORT
+        self.username = username if username is not None else Config.MAIL_USERNAME
+        self.password = password if password is not None else Config.MAIL_PASSWORD
+        self.use_tls = Config.MAIL_USE_TLS if use_tls is None else use_tls
+        self.use_ssl = Config.MAIL_USE_SSL if use_ssl is None else use_ssl
+        self.connections = max(1, connections or Config.SMTP_CONNECTIONS)
+        self.batch_size = max(1, batch_size or Config.SMTP_BATCH_SIZE)
+        rate = Config.SMTP_RATE_PER_SECOND if rate_per_second is None else rate_per_second
+        self.limiter = RateLimiter(rate, burst=self.connections)
+        self.timeout = timeout
+
+    def connect(self) -> smtplib.SMTP:
+        """Open and authenticate one SMTP session."""
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.use_tls:
+                conn.starttls()
+        conn.ehlo()
+        if self.username and self.password and conn.has_extn("auth"):
+            conn.login(self.username, self.password)
+        return conn
+
+    def send(self, messages: List[EmailMessage]) -> List[Optional[str]]:
+        """
+        Send every message.
+
+        Returns:
+            list: Per message, in order, None if it was accepted by the
+            server or the error otherwise. One refused recipient does not
+            stop the rest of its batch.
+        """
+        errors: List[Optional[str]] = [None] * len(messages)
+        batches = [list(range(i, min(i + self.batch_size, len(messages))))
+                   for i in range(0, len(messages), self.batch_size)]
+        if not batches:
+            return errors
+        with ThreadPoolExecutor(max_workers=min(self.connections, len(batches)),
+                                thread_name_prefix="smtp") as pool:
+            list(pool.map(lambda batch: self._send_batch(messages, batch, errors), batches))
+        return errors
+
+    def _send_batch(self, messages: List[EmailMessage], batch: List[int], errors: List[Optional[str]]) -> None:
+        conn = None
+        done = 0
+        try:
+            for i in batch:
+                self.limiter.acquire()
+                try:
+                    try:
+                        if conn is None:
+                            conn = self.connect()
+                        conn.send_message(messages[i])
+                    except smtplib.SMTPServerDisconnected:
+                        # The server dropped the session (idle timeout, message limit); reconnect once
+                        conn = None
+                        conn = self.connect()
+                        conn.send_message(messages[i])
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError) as e:
+                    # Refused on the first try or after the reconnect: only this message fails
+                    errors[i] = f"{type(e).__name__}: {e}"
+                done += 1
+        except (smtplib.SMTPException, OSError) as e:
+            # Could not connect, log in or reconnect: the rest of the batch fails the same way
+            for i in batch[done:]:
+                errors[i] = f"{type(e).__name__}: {e}"
+        finally:
+            if conn is not None:
+                try:
+                    conn.quit()
+                except (smtplib.SMTPException, OSError):
+                    pass
@@ -0,0 +1,245 @@
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from io import BytesIO
+from typing import Iterator, Optional
+from urllib.parse import urlparse
+
+from app.config.config import Config
+
+UPLOAD_URL_PREFIX = "/uploads/"
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload body exceeds the configured size cap."""
+
+
+def read_chunks(stream, chunk_size: int = None, max_bytes: int = None) -> Iterator[bytes]:
+    """
+    Read a file-like object in fixed-size chunks, enforcing a size cap.
+
+    Args:
+        stream: Readable binary file-like object (e.g. request.stream).
+        chunk_size (int): Bytes per chunk.
+        max_bytes (int): Maximum total bytes allowed.
+
+    Yields:
+        bytes: The next chunk of the body.
+
+    Raises:
+        UploadTooLargeError: If the body is larger than max_bytes.
+    """
+    chunk_size = chunk_size or Config.UPLOAD_CHUNK_SIZE
+    max_bytes = max_bytes or Config.UPLOAD_MAX_BYTES
+    total = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        total += len(chunk)
+        if total > max_bytes:
+            raise UploadTooLargeError(f"Upload exceeds the {max_bytes} byte limit")
+        yield chunk
+
+
+def spool_upload(stream, max_bytes: int = None):
+    """
+    Copy an upload body into a temporary file (kept in memory while small),
+    enforcing the size cap, and return it rewound to the start.
+
+    Raises:
+        UploadTooLargeError: If the body is larger than max_bytes.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    try:
+        for chunk in read_chunks(stream, max_bytes=max_bytes):
+            spooled.write(chunk)
+    except Exception:
+        spooled.close()
+        raise
+    spooled.seek(0)
+    return spooled
+
+
+def upload_key_from_url(url: str, host: str = None) -> Optional[str]:
+    """
+    Return the storage key for a URL produced by `/api/upload`, or None if the
+    URL points somewhere else (e.g. a JotForm upload).
+
+    Args:
+        url (str): The image URL sent by the frontend.
+        host (str): The host the current request was served on.
+    """
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if not parsed.path.startswith(UPLOAD_URL_PREFIX):
+        return None
+    if parsed.hostname not in ("localhost", "127.0.0.1") and parsed.netloc != host:
+        return None
+    key = parsed.path[len(UPLOAD_URL_PREFIX):]
+    if not key or ".." in key.split("/"):
+        return None
+    return key
+
+
+class StorageBackend(ABC):
+    """
+    Where uploaded files live. Keys are relative names such as `ab12cd.jpg`;
+    every node resolves them through `/uploads/<key>`, whichever backend is used.
+    """
+
+    @abstractmethod
+    def save(self, stream, key: str, mime_type: str, max_bytes: int = None) -> int:
+        """
+        Stream `stream` into storage under `key`.
+
+        Returns:
+            int: Number of bytes written.
+
+        Raises:
+            UploadTooLargeError: If the body is larger than max_bytes.
+        """
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[bytes]:
+        """Return the stored bytes for `key`, or None if it does not exist."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove `key`; a missing key is not an error."""
+
+    def url_path(self, key: str) -> str:
+        return f"{UPLOAD_URL_PREFIX}{key}"
+
+
+class LocalStorage(StorageBackend):
+    """Stores uploads on the local disk (single node / development)."""
+
+    def __init__(self, root: str = None):
+        self.root = os.path.abspath(root or Config.UPLOADS_DIR)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def save(self, stream, key: str, mime_type: str, max_bytes: int = None) -> int:
+        os.makedirs(os.path.dirname(self.path(key)), exist_ok=True)
+        # Write to a temp file first so a rejected upload never leaves a partial file behind
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".part")
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in read_chunks(stream, max_bytes=max_bytes):
+                    out.write(chunk)
+                    written += len(chunk)
+            shutil.move(tmp_path, self.path(key))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return written
+
+    def read(self, key: str) -> Optional[bytes]:
+        file_path = self.path(key)
+        if not os.path.exists(file_path):
+            return None
+        with open(file_path, "rb") as f:
+            return f.read()
+
+    def delete(self, key: str) -> None:
+        file_path = self.path(key)
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+
+class S3Storage(StorageBackend):
+    """
+    Stores uploads in S3 so every node behind the load balancer can serve them.
+    Small bodies go through `AWSService.upload_object`; bodies larger than one
+    part are sent as a multipart upload while they are still being read.
+    """
+
+    def __init__(self, aws=None, prefix: str = None, part_size: int = None):
+        if aws is None:
+            from app.utils.aws_utils import AWSService
+            aws = AWSService()
+        self.aws = aws
+        self.prefix = (prefix if prefix is not None else Config.S3_UPLOAD_PREFIX).strip("/")
+        self.part_size = part_size or Config.S3_MULTIPART_PART_SIZE
+
+    def s3_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def save(self, stream, key: str, mime_type: str, max_bytes: int = None) -> int:
+        chunks = read_chunks(stream, max_bytes=max_bytes)
+
+        # Buffer up to one part; if the body fits, a single PUT is cheaper than multipart
+        first_part = bytearray()
+        for chunk in chunks:
+            first_part += chunk
+            if len(first_part) >= self.part_size:
+                break
+        else:
+            if not self.aws.upload_object(BytesIO(bytes(first_part)), self.s3_key(key), mime_type):
+                raise IOError(f"Failed to upload {key} to S3")
+            return len(first_part)
+
+        errors = []
+
+        def parts():
+            buf = first_part
+            try:
+                for chunk in chunks:
+                    buf += chunk
+                    if len(buf) >= self.part_size:
+                        yield bytes(buf)
+                        buf = bytearray()
+            except UploadTooLargeError as e:
+                # upload_parts aborts the multipart upload; surface the real cause afterwards
+                errors.append(e)
+                raise
+            if buf:
+                yield bytes(buf)
+
+        written = self.aws.upload_parts(parts(), self.s3_key(key), mime_type)
+        if errors:
+            raise errors[0]
+        if written is None:
+            raise IOError(f"Failed to upload {key} to S3")
+        return written
+
+    def read(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.aws.s3.get_object(Bucket=self.aws.bucket_name, Key=self.s3_key(key))
+        except Exception as e:
+            print(f"Error reading {key} from S3: {e}")
+            return None
+        return response["Body"].read()
+
+    def delete(self, key: str) -> None:
+        self.aws.s3.delete_object(Bucket=self.aws.bucket_name, Key=self.s3_key(key))
+
+    def presigned_url(self, key: str, expiration: int = 3600) -> str:
+        return self.aws.s3.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.aws.bucket_name, "Key": self.s3_key(key)},
+            ExpiresIn=expiration
+        )
+
+
+_storage: Optional[StorageBackend] = None
+
+
+def get_storage() -> StorageBackend:
+    """
+    Return the process-wide storage backend selected by Config.STORAGE_BACKEND
+    ('local' or 's3').
+    """
+    global _storage
+    if _storage is None:
+        if Config.STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        else:
+            _storage = LocalStorage()
+    return _storage
@@ -0,0 +1,74 @@
+import os
+import uuid
+from io import BytesIO
+
+from werkzeug.utils import secure_filename
+
+from app.config.config import Config
+from app.utils.storage_utils import get_storage, spool_upload, UploadTooLargeError
+
+# Restrict to common image extensions
+ALLOWED_EXT = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+
+
+class UploadRejectedError(ValueError):
+    """Raised when an upload cannot be accepted; carries the HTTP status to return."""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def store_upload(stream, original_name: str, mime_type: str = None) -> str:
+    """
+    Validate, normalize and store an uploaded image in the configured backend.
+
+    Args:
+        stream: Readable binary file-like object with the upload body.
+        original_name (str): The client-side file name (used for the extension check).
+        mime_type (str): The Content-Type sent by the client.
+
+    Returns:
+        str: The backend-neutral URL path (`/uploads/<key>`) of the stored file.
+
+    Raises:
+        UploadRejectedError: Unsupported type (400), invalid image (400), too large (413)
+            or a storage failure (500).
+    """
+    filename = secure_filename(original_name or '')
+    name, ext = os.path.splitext(filename)
+    if ext.lower() not in ALLOWED_EXT:
+        raise UploadRejectedError("Unsupported file type")
+
+    mime_type = mime_type or 'application/octet-stream'
+    # Generate unique filename to avoid collisions
+    unique_id = uuid.uuid4().hex
+    storage = get_storage()
+    try:
+        if Config.UPLOAD_NORMALIZE:
+            from app.utils.image_utils import normalize_image
+
+            # Orient, strip metadata and downscale once here so storage, OCR and the LLM all get the small image
+            with spool_upload(stream) as original:
+                try:
+                    normalized = normalize_image(original)
+                except Exception as e:
+                    print(f"Error normalizing upload: {e}")
+                    raise UploadRejectedError("Invalid image file")
+                if Config.UPLOAD_KEEP_ORIGINAL:
+                    original.seek(0)
+                    storage.save(original, f"originals/{unique_id}{ext.lower()}", mime_type)
+            unique_name = f"{unique_id}.jpg"
+            storage.save(BytesIO(normalized), unique_name, 'image/jpeg')
+        else:
+            unique_name = f"{unique_id}{ext.lower()}"
+            storage.save(stream, unique_name, mime_type)
+    except UploadRejectedError:
+        raise
+    except UploadTooLargeError as e:
+        raise UploadRejectedError(str(e), 413)
+    except Exception as e:
+        print(f"Error saving upload: {e}")
+        raise UploadRejectedError("Failed to store file", 500)
+
+    return storage.url_path(unique_name)
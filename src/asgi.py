@@ -0,0 +1,171 @@
+"""
+Async (ASGI) serving mode for the chat API.
+
+Serves the same routes as `main.py`, but every request is an async handler:
+the LangGraph run uses ainvoke/astream, images are fetched with async httpx and
+OCR runs on a bounded executor, so one worker can hold hundreds of open
+conversations while they wait on OpenAI and Textract.
+
+Run with:
+    uvicorn asgi:app --app-dir src --host 0.0.0.0 --port 5050 --workers 3
+"""
+import os
+import tempfile
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse, FileResponse, RedirectResponse, Response
+from starlette.routing import Route
+
+from app.ai.agent import aprocess_message, astream_message, extract_ui_action
+from app.ai.chat_request import prepare_chat_args, format_sse, STAFF_HEADER
+from app.config import Config
+from app.utils.storage_utils import get_storage, LocalStorage
+from app.utils.upload_utils import store_upload, UploadRejectedError
+from app.utils.metrics import request_metrics, render_metrics
+from app.utils.profiler import profile_request, PROFILE_HEADER
+from app.startup import warm_up
+
+
+async def chat_endpoint(request: Request):
+    data = await request.json()
+    # Reading and downscaling an uploaded image is blocking work
+    chat_args = await run_in_threadpool(prepare_chat_args, data, request.headers.get("host"), request.headers.get(STAFF_HEADER))
+    session_id = chat_args["thread_id"]
+
+    try:
+        step = data.get("current_step") or "chat"
+        with request_metrics("chat", session_id), \
+                profile_request(session_id, step, request.headers.get(PROFILE_HEADER)):
+            ai_response = await aprocess_message(**chat_args)
+        ai_response, ui_action = extract_ui_action(ai_response)
+        return JSONResponse({
+            "response": ai_response.strip(),
+            "session_id": session_id,
+            "ui_action": ui_action
+        })
+    except Exception as e:
+        print(f"Error: {e}")
+        return JSONResponse({"error": "Something went wrong"}, status_code=500)
+
+
+async def chat_stream_endpoint(request: Request):
+    data = await request.json()
+    chat_args = await run_in_threadpool(prepare_chat_args, data, request.headers.get("host"), request.headers.get(STAFF_HEADER))
+    session_id = chat_args["thread_id"]
+    step = data.get("current_step") or "chat_stream"
+    profile_token = request.headers.get(PROFILE_HEADER)
+
+    async def generate():
+        yield format_sse("session", {"session_id": session_id})
+        try:
+            with request_metrics("chat_stream", session_id), \
+                    profile_request(session_id, step, profile_token):
+                async for event, event_data in astream_message(**chat_args):
+                    if event == "done":
+                        event_data = {**event_data, "session_id": session_id}
+                    yield format_sse(event, event_data)
+        except Exception as e:
+            print(f"Error: {e}")
+            yield format_sse("error", {"error": "Something went wrong"})
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def _spool_request_body(request: Request):
+    # Read the raw body off the socket in chunks, with the same cap as the sync server
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    total = 0
+    async for chunk in request.stream():
+        total += len(chunk)
+        if total > Config.UPLOAD_MAX_BYTES:
+            spooled.close()
+            raise UploadRejectedError(f"Upload exceeds the {Config.UPLOAD_MAX_BYTES} byte limit", 413)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def _store_upload_profiled(stream, original_name, mime_type, profile_token):
+    # Profile on the worker thread, where the upload work actually runs
+    with profile_request(step="upload", token=profile_token):
+        return store_upload(stream, original_name, mime_type)
+
+
+async def upload_file(request: Request):
+    content_type = request.headers.get("content-type", "")
+    try:
+        if content_type.startswith("image/"):
+            original_name = request.query_params.get("filename", "")
+            mime_type = content_type.split(";")[0]
+            stream = await _spool_request_body(request)
+        else:
+            form = await request.form()
+            file = form.get("file")
+            if file is None or isinstance(file, str):
+                return JSONResponse({"error": "No file part"}, status_code=400)
+            if not file.filename:
+                return JSONResponse({"error": "No selected file"}, status_code=400)
+            original_name = file.filename
+            mime_type = file.content_type
+            stream = file.file
+
+        try:
+            with request_metrics("upload"):
+                url_path = await run_in_threadpool(
+                    _store_upload_profiled, stream, original_name, mime_type, request.headers.get(PROFILE_HEADER)
+                )
+        finally:
+            stream.close()
+    except UploadRejectedError as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+
+    file_url = str(request.base_url).rstrip("/") + url_path
+    return JSONResponse({"url": file_url})
+
+
+async def uploaded_file(request: Request):
+    filename = request.path_params["filename"]
+    if ".." in filename.split("/"):
+        return Response(status_code=404)
+    storage = get_storage()
+    if isinstance(storage, LocalStorage):
+        file_path = storage.path(filename)
+        if not os.path.isfile(file_path):
+            return Response(status_code=404)
+        return FileResponse(file_path)
+    return RedirectResponse(storage.presigned_url(filename))
+
+
+async def metrics_endpoint(request: Request):
+    if not Config.METRICS_ENABLED:
+        return Response(status_code=404)
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Each uvicorn worker is its own process: build the model client and graph before serving
+    await run_in_threadpool(warm_up)
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", chat_endpoint, methods=["POST"]),
+        Route("/api/chat/stream", chat_stream_endpoint, methods=["POST"]),
+        Route("/api/upload", upload_file, methods=["POST"]),
+        Route("/uploads/{filename:path}", uploaded_file, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,83 @@
+"""
+Concurrency load test for the async (ASGI) server with a stubbed LLM.
+
+Usage (from src/):
+    python -m benchmarks.asgi_load [--sessions 300] [--turns 2] [--latency 1.0]
+
+Runs `--sessions` simulated conversations at once against `asgi:app` in-process
+(httpx ASGITransport); every LLM call takes `--latency` seconds. With the sync
+server a node serves at most workers x threads (3 x 4 = 12) chats at a time, so
+300 sessions would take ~25 latency rounds per turn; the async server should
+finish each turn in about one.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+
+# The real client is never called, but it is constructed at import time
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-load-test")
+
+from benchmarks.fake_llm import FakeChatModel, install_fake_llm
+
+
+async def _session(client: httpx.AsyncClient, turns: int, latencies: list, errors: list):
+    session_id = str(uuid.uuid4())
+    for turn in range(turns):
+        start = time.perf_counter()
+        try:
+            r = await client.post("/api/chat", json={"message": f"hi {turn}", "session_id": session_id})
+            r.raise_for_status()
+        except Exception as e:
+            errors.append(str(e))
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(sessions: int, turns: int, latency: float) -> dict:
+    install_fake_llm(FakeChatModel(latency=latency))
+    from asgi import app
+
+    latencies, errors = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://localhost", timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(_session(client, turns, latencies, errors) for _ in range(sessions)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else None
+
+    return {
+        "sessions": sessions,
+        "turns": turns,
+        "llm_latency_s": latency,
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "latency_p50_s": pct(50),
+        "latency_p95_s": pct(95),
+        "latency_p99_s": pct(99),
+        "latency_mean_s": statistics.mean(latencies) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=1.0)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.sessions, args.turns, args.latency)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
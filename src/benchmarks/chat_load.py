@@ -0,0 +1,248 @@
+"""
+Offline load test for /api/chat with a deterministic fake LLM.
+
+Usage (from src/):
+    python -m benchmarks.chat_load [--sessions 50] [--concurrency 12] [--latency 0.5]
+                                   [--url http://localhost:5050] [--out results.json]
+
+Every simulated session walks the full flow through the real Flask app, tools
+and CSV store: greeting -> course list (get_available_courses) -> PR card
+upload (/api/upload + a card tool) -> registration (store_registration_info)
+-> payment email (check_payment_status). The LLM is replaced by
+`ScriptedChatModel`, which emits the same tool calls after `--latency` seconds.
+
+By default the app runs in-process (Flask test client, one thread per
+concurrent session; match --concurrency to workers x threads to model a
+gunicorn node) against a temporary copy of the CSV, a fresh payment ledger
+and a scratch uploads directory. With --url the sessions
+are sent over HTTP to a running server instead, which must have been started
+with the fake model installed (see `benchmarks.fake_llm.install_fake_llm`).
+
+Throughput, latency percentiles (overall and per step) and the error rate
+are printed and written as JSON to --out for regression tracking.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+
+# The real client is never called, but it is constructed at import time
+os.environ.setdefault("OPENAI_API_KEY", "sk-offline-load-test")
+
+from benchmarks.fake_llm import ScriptedChatModel, install_fake_llm, REGISTER_PREFIX, PAID_PREFIX
+
+COURSE_ID = "sfa"
+COURSE_NAME = "Standard First Aid"
+COURSE_EMAIL_DATE = "December 5, 2025 at 9:30 AM EST"
+PR_PRICE = 125.00
+
+
+def _card_image() -> bytes:
+    from PIL import Image, ImageDraw
+    img = Image.new("RGB", (856, 540), (235, 235, 245))
+    draw = ImageDraw.Draw(img)
+    draw.text((40, 40), "Government of Canada  Permanent Resident Card", fill=(0, 0, 0))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=85)
+    return buf.getvalue()
+
+
+def _zeffy_email(full_name: str) -> str:
+    return (
+        f"New CA${PR_PRICE:.2f} payment received!\n"
+        f"{COURSE_NAME} @ UNI-Commons x CFSO\n"
+        f"{COURSE_EMAIL_DATE}\n"
+        f"Participant's Name (First & Last Name) : {full_name}\n"
+        "I have reviewed the terms and conditions.\n"
+    )
+
+
+class _InProcessClient:
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def chat(self, payload: dict) -> dict:
+        r = self.client.post("/api/chat", json=payload)
+        if r.status_code != 200:
+            raise RuntimeError(f"/api/chat returned {r.status_code}")
+        return r.get_json()
+
+    def upload(self, name: str, data: bytes) -> str:
+        r = self.client.post("/api/upload", data={"file": (BytesIO(data), name)}, content_type="multipart/form-data")
+        if r.status_code != 200:
+            raise RuntimeError(f"/api/upload returned {r.status_code}")
+        return r.get_json()["url"]
+
+
+class _HttpClient:
+    def __init__(self, base_url: str):
+        import requests
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def chat(self, payload: dict) -> dict:
+        r = self.session.post(f"{self.base_url}/api/chat", json=payload, timeout=120)
+        r.raise_for_status()
+        return r.json()
+
+    def upload(self, name: str, data: bytes) -> str:
+        r = self.session.post(f"{self.base_url}/api/upload", files={"file": (name, data, "image/jpeg")}, timeout=60)
+        r.raise_for_status()
+        return r.json()["url"]
+
+
+def _run_session(make_client, card: bytes, index: int, record) -> None:
+    client = make_client()
+    session_id = str(uuid.uuid4())
+    first, last = "Load", f"Tester{index:05d}{uuid.uuid4().hex[:4]}"
+
+    def step(name, fn, expect=None):
+        start = time.perf_counter()
+        try:
+            result = fn()
+            if expect and result.get("ui_action") != expect:
+                raise RuntimeError(f"expected ui_action {expect}, got {result.get('ui_action')}")
+            record(name, time.perf_counter() - start, None)
+            return result
+        except Exception as e:
+            record(name, time.perf_counter() - start, str(e))
+            return None
+
+    step("greeting", lambda: client.chat({"message": "Hi", "session_id": session_id}))
+    step("courses", lambda: client.chat({"message": "What courses are there?", "session_id": session_id}),
+         expect="show_course_selector")
+
+    card_url = step("upload", lambda: {"url": client.upload("card.jpg", card)})
+    if card_url:
+        step("pr_card", lambda: client.chat({
+            "message": "I am a PR, here is my card",
+            "session_id": session_id,
+            "image_url": card_url["url"],
+            "current_step": "UPLOAD",
+        }), expect="show_registration_form")
+
+    user_info = {
+        "legalName": {"first": first, "last": last},
+        "payersName": {"first": first, "last": last},
+        "email": f"{last.lower()}@example.com",
+        "phoneNumber": {"full": "555-0100"},
+        "areYou": "Yes I am a PR",
+        "prCard": f"{index:04d}-{index:04d}",
+        "clearFront": [card_url["url"] if card_url else "https://example.com/uploads/1/2/card.jpg"],
+    }
+    step("registration", lambda: client.chat({
+        "message": REGISTER_PREFIX + json.dumps({"user_info": user_info, "course_id": COURSE_ID}),
+        "session_id": session_id,
+    }), expect="show_payment")
+    step("payment", lambda: client.chat({
+        "message": PAID_PREFIX + _zeffy_email(f"{first} {last}"),
+        "session_id": session_id,
+    }), expect="success_completion")
+
+
+def _percentiles(values) -> dict:
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def pct(p):
+        return round(values[min(len(values) - 1, int(p / 100 * len(values)))] * 1000, 1)
+
+    return {"p50_ms": pct(50), "p90_ms": pct(90), "p95_ms": pct(95), "p99_ms": pct(99),
+            "mean_ms": round(statistics.mean(values) * 1000, 1), "max_ms": round(values[-1] * 1000, 1)}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except Exception:
+        return ""
+
+
+def run(sessions: int, concurrency: int, latency: float, url: str = None, ocr: bool = False) -> dict:
+    tmp_dir = None
+    if url:
+        make_client = lambda: _HttpClient(url)
+    else:
+        install_fake_llm(ScriptedChatModel(latency=latency, ocr=ocr))
+        from app.config import Config
+        from app.utils import database_utils, storage_utils
+        from main import app as flask_app
+
+        # Run against a copy of the CSV store, a fresh payment ledger and a scratch
+        # uploads directory so the real data is untouched
+        tmp_dir = tempfile.mkdtemp(prefix="chat-load-")
+        csv_copy = os.path.join(tmp_dir, "registration_data.csv")
+        shutil.copy(database_utils.cfg["path"], csv_copy)
+        database_utils.cfg["path"] = csv_copy
+        Config.PAYMENT_LEDGER_PATH = os.path.join(tmp_dir, "payment_ledger.sqlite")
+        Config.STORAGE_BACKEND = "local"
+        Config.UPLOADS_DIR = os.path.join(tmp_dir, "uploads")
+        storage_utils._storage = storage_utils.LocalStorage(Config.UPLOADS_DIR)
+        make_client = lambda: _InProcessClient(flask_app)
+
+    card = _card_image()
+    lock = threading.Lock()
+    by_step, errors = {}, []
+
+    def record(step_name, seconds, error):
+        with lock:
+            by_step.setdefault(step_name, []).append(seconds)
+            if error:
+                errors.append({"step": step_name, "error": error})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(lambda i: _run_session(make_client, card, i, record), range(sessions)))
+    elapsed = time.perf_counter() - start
+
+    if tmp_dir:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    all_latencies = [v for values in by_step.values() for v in values]
+    requests_total = len(all_latencies)
+    return {
+        "benchmark": "chat_load",
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "config": {"sessions": sessions, "concurrency": concurrency, "llm_latency_s": latency,
+                   "target": url or "in-process", "ocr": ocr},
+        "elapsed_s": round(elapsed, 3),
+        "requests": requests_total,
+        "throughput_rps": round(requests_total / elapsed, 2) if elapsed else 0,
+        "sessions_per_s": round(sessions / elapsed, 3) if elapsed else 0,
+        "error_rate": round(len(errors) / requests_total, 4) if requests_total else 0,
+        "errors": errors[:20],
+        "latency": _percentiles(all_latencies),
+        "latency_by_step": {name: _percentiles(values) for name, values in by_step.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=12, help="simultaneous sessions (gunicorn: workers x threads)")
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per fake LLM call")
+    parser.add_argument("--url", default=None, help="send requests to a running server instead of in-process")
+    parser.add_argument("--ocr", action="store_true", help="call validate_pr_card on uploads (runs OCR; needs --url so the image URL resolves)")
+    parser.add_argument("--out", default=None, help="write the JSON result here")
+    args = parser.parse_args()
+
+    result = run(args.sessions, args.concurrency, args.latency, args.url, args.ocr)
+    print(json.dumps(result, indent=2))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Stand-ins for the `ChatOpenAI` model used by `app.ai.agent`, for load tests
+that must not spend OpenAI credits.
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+
+class FakeChatModel:
+    """
+    Answers every call with a fixed reply after `latency` seconds, blocking
+    in `invoke` and yielding the event loop in `ainvoke`, like the real client.
+    """
+
+    def __init__(self, latency: float = 1.0, reply: str = "Here are our courses. [SHOW_COURSE_SELECTOR]"):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def respond(self, messages) -> AIMessage:
+        return AIMessage(content=self.reply)
+
+    def invoke(self, messages, config=None, **kwargs) -> AIMessage:
+        self.calls += 1
+        time.sleep(self.latency)
+        return self.respond(messages)
+
+    async def ainvoke(self, messages, config=None, **kwargs) -> AIMessage:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return self.respond(messages)
+
+
+# Scripted commands understood by ScriptedChatModel (sent as the user message)
+REGISTER_PREFIX = "REGISTER "
+PAID_PREFIX = "PAID "
+
+TOOL_REPLIES = {
+    "get_available_courses": "Here are the courses you can register for. [SHOW_COURSE_SELECTOR]",
+    "validate_pr_card": "Thanks, I've checked your PR card. Please fill out the registration details. [SHOW_REGISTRATION_FORM]",
+    "find_existing_client": "Thanks for your card. Please fill out the registration details. [SHOW_REGISTRATION_FORM]",
+    "store_registration_info": "You're registered! Please complete the payment. [SHOW_PAYMENT]",
+    "check_payment_status": "Your payment is confirmed, congratulations! [SUCCESS_COMPLETION]",
+}
+
+
+def _text(message) -> str:
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+
+
+class ScriptedChatModel(FakeChatModel):
+    """
+    Deterministic model that walks the registration flow with the same tool
+    calls the real agent makes:
+
+        "...courses..."            -> get_available_courses
+        image upload               -> validate_pr_card (with ocr=True) or find_existing_client
+        "REGISTER {user_info, course_id}" -> store_registration_info
+        "PAID <Zeffy email body>"  -> check_payment_status
+        tool result                -> the reply (with UI tag) for that tool
+        anything else              -> a greeting
+    """
+
+    def __init__(self, latency: float = 0.5, ocr: bool = False):
+        super().__init__(latency=latency)
+        self.ocr = ocr
+
+    @staticmethod
+    def _call(name: str, args: dict) -> AIMessage:
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": f"call_{uuid.uuid4().hex[:12]}"}])
+
+    def respond(self, messages) -> AIMessage:
+        last = messages[-1]
+        if isinstance(last, ToolMessage):
+            return AIMessage(content=TOOL_REPLIES.get(last.name, "Done."))
+
+        text = _text(last)
+        if text.startswith(REGISTER_PREFIX):
+            payload = json.loads(text[len(REGISTER_PREFIX):])
+            return self._call("store_registration_info", payload)
+        if text.startswith(PAID_PREFIX):
+            return self._call("check_payment_status", {
+                "email_id": uuid.uuid4().hex,
+                "subject": "New payment received",
+                "body": text[len(PAID_PREFIX):],
+            })
+        if "uploaded an image" in text:
+            match = re.search(r"The URL for this image is: (\S+?)\.? Use this URL", text)
+            if self.ocr and match:
+                return self._call("validate_pr_card", {"image_url": match.group(1), "user_info": {}})
+            return self._call("find_existing_client", {"client_name": "Load Test"})
+        if "course" in text.lower():
+            return self._call("get_available_courses", {})
+        return AIMessage(content="Hello! I can help you register for a course. [SHOW_COURSE_SELECTOR]")
+
+
+def install_fake_llm(model) -> None:
+    """Swap the agent's bound models (one per step) for `model`."""
+    import app.ai.agent as agent
+    agent.step_models = agent.bind_step_models(model)
@@ -0,0 +1,98 @@
+"""
+Measure the effect of upload-time image normalization on a sample image set.
+
+Usage (from src/):
+    python -m benchmarks.image_normalization <image_dir> [--ocr] [--max-edge 2000] [--quality 85]
+
+Reports, per image and in total: stored bytes, base64 payload bytes, estimated
+LLM image tokens and (with --ocr) Tesseract time, before and after normalization.
+"""
+import argparse
+import base64
+import os
+import time
+from io import BytesIO
+
+from PIL import Image
+
+from app.utils.image_utils import normalize_image, estimate_image_tokens, bytes_to_cv2, local_image_to_text
+
+IMAGE_EXT = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
+
+
+def _measure(data: bytes, run_ocr: bool) -> dict:
+    with Image.open(BytesIO(data)) as img:
+        width, height = img.size
+    result = {
+        "bytes": len(data),
+        "b64_bytes": len(base64.b64encode(data)),
+        "size": f"{width}x{height}",
+        "llm_tokens": estimate_image_tokens(width, height),
+        "ocr_ms": None,
+    }
+    if run_ocr:
+        image = bytes_to_cv2(data)
+        start = time.perf_counter()
+        local_image_to_text(image)
+        result["ocr_ms"] = (time.perf_counter() - start) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("image_dir")
+    parser.add_argument("--ocr", action="store_true", help="also time Tesseract on both versions")
+    parser.add_argument("--max-edge", type=int, default=None)
+    parser.add_argument("--quality", type=int, default=None)
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.image_dir, f) for f in os.listdir(args.image_dir)
+        if os.path.splitext(f)[1].lower() in IMAGE_EXT
+    )
+    if not files:
+        raise SystemExit(f"No images found in {args.image_dir}")
+
+    totals = {"before": {"bytes": 0, "b64_bytes": 0, "llm_tokens": 0, "ocr_ms": 0.0},
+              "after": {"bytes": 0, "b64_bytes": 0, "llm_tokens": 0, "ocr_ms": 0.0}}
+    normalize_ms = 0.0
+
+    print(f"{'image':30} {'before':>22} {'after':>22} {'norm ms':>8} {'tokens':>12} {'ocr ms':>16}")
+    for path in files:
+        with open(path, "rb") as f:
+            original = f.read()
+
+        start = time.perf_counter()
+        normalized = normalize_image(BytesIO(original), max_edge=args.max_edge, quality=args.quality)
+        elapsed = (time.perf_counter() - start) * 1000
+        normalize_ms += elapsed
+
+        before = _measure(original, args.ocr)
+        after = _measure(normalized, args.ocr)
+        for label, m in (("before", before), ("after", after)):
+            for k in ("bytes", "b64_bytes", "llm_tokens"):
+                totals[label][k] += m[k]
+            if m["ocr_ms"] is not None:
+                totals[label]["ocr_ms"] += m["ocr_ms"]
+
+        ocr = f"{before['ocr_ms']:.0f}->{after['ocr_ms']:.0f}" if args.ocr else "-"
+        print(f"{os.path.basename(path)[:30]:30} "
+              f"{before['size']:>11} {before['bytes'] / 1024:>8.0f}KB "
+              f"{after['size']:>11} {after['bytes'] / 1024:>8.0f}KB "
+              f"{elapsed:>8.1f} "
+              f"{before['llm_tokens']:>5}->{after['llm_tokens']:<5} "
+              f"{ocr:>16}")
+
+    b, a = totals["before"], totals["after"]
+    print()
+    print(f"images:            {len(files)}")
+    print(f"stored bytes:      {b['bytes']:,} -> {a['bytes']:,} ({a['bytes'] / b['bytes']:.1%})")
+    print(f"base64 payload:    {b['b64_bytes']:,} -> {a['b64_bytes']:,}")
+    print(f"LLM image tokens:  {b['llm_tokens']:,} -> {a['llm_tokens']:,}")
+    print(f"normalize time:    {normalize_ms / len(files):.1f} ms/image")
+    if args.ocr:
+        print(f"Tesseract time:    {b['ocr_ms'] / len(files):.0f} -> {a['ocr_ms'] / len(files):.0f} ms/image")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Measure cold-start time: importing the app in a fresh interpreter, and the
+per-worker warm-up that follows.
+
+Usage (from src/):
+    python -m benchmarks.import_time [--module main] [--runs 5] [--top 15] [--warm-up]
+
+Each run starts a new Python process (no module cache shared between runs)
+and reports the wall time of `import <module>`. With --warm-up the process
+also runs app.startup.warm_up() (chat model, graph, storage backend) and
+reports it separately. The slowest modules of the last run, by cumulative
+import time, come from `python -X importtime`.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+warm_up_ms = None
+if {warm_up}:
+    from app.startup import warm_up
+    warm_up()
+    warm_up_ms = (time.perf_counter() - imported) * 1000
+print("RESULT " + json.dumps({{"import_ms": (imported - start) * 1000, "warm_up_ms": warm_up_ms}}))
+"""
+
+
+def _run(module: str, warm_up: bool) -> tuple:
+    env = {**os.environ, "PYTHONPATH": os.getcwd(), "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sk-benchmark")}
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, warm_up=warm_up)],
+        capture_output=True, text=True, env=env,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(proc.stderr[-2000:])
+    line = next(l for l in proc.stdout.splitlines() if l.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):]), proc.stderr
+
+
+def _slowest(importtime_log: str, top: int) -> list:
+    rows = []
+    for line in importtime_log.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|").split("|"))
+        # Top-level packages only; their cumulative time includes the submodules
+        if "." not in name.strip():
+            rows.append((int(cumulative_us) / 1000, name.strip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="module to import, e.g. main or asgi")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest top-level imports to list")
+    parser.add_argument("--warm-up", action="store_true", help="also time app.startup.warm_up()")
+    args = parser.parse_args()
+
+    results, log = [], ""
+    for _ in range(args.runs):
+        result, log = _run(args.module, args.warm_up)
+        results.append(result)
+
+    import_ms = [r["import_ms"] for r in results]
+    summary = {
+        "module": args.module,
+        "runs": args.runs,
+        "import_ms": {
+            "median": round(statistics.median(import_ms), 1),
+            "min": round(min(import_ms), 1),
+            "max": round(max(import_ms), 1),
+        },
+    }
+    if args.warm_up:
+        summary["warm_up_ms"] = {"median": round(statistics.median(r["warm_up_ms"] for r in results), 1)}
+    summary["slowest_imports_ms"] = {name: round(ms, 1) for ms, name in _slowest(log, args.top)}
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Measure payment email parsing: per-email time and template hit rate.
+
+Usage (from src/):
+    python -m benchmarks.payment_parsing [--corpus DIR] [--count 2000] [--repeat 3]
+
+The corpus is a directory of .eml files (raw emails, e.g. saved from the
+admin mailbox) or, without --corpus, `--count` generated emails: Zeffy
+payment notifications as text and as HTML, with varying names, amounts,
+courses and dates, plus unrelated emails that must not match.
+
+Every email is parsed with the template registry (app.tools.payment_parsers)
+and with the single-layout regex extractor it replaced, kept here as the
+baseline. Reports the time per email of both, the template hit rate and how
+many emails the two disagree on.
+"""
+import argparse
+import email
+import json
+import os
+import random
+import re
+import statistics
+import time
+import warnings
+from datetime import datetime, timedelta
+from email.policy import default as default_policy
+
+from app.tools.payment_parsers import TEMPLATES, parse_payment_email
+
+COURSES = [
+    "Standard First Aid with CPR Level C & AED Certification",
+    "Mask Fit Testing",
+    "Food Handler Certification",
+    "Brazilian Jiu-Jitsu Training",
+]
+FIRST = ["Hiu Man", "Jane", "Wei", "Amir", "Sofia", "Olivier", "Priya", "Mateo"]
+LAST = ["Suen", "Doe", "Chen", "Haddad", "Rossi", "Tremblay", "Patel", "Garcia"]
+
+TEXT_TEMPLATE = """New CA${amount} payment received!
+New purchase
+{course} @ UNI-Commons x CFSO
+{date}
+Participant's Name (First & Last Name) 參加者的姓名（名字和姓氏） : {name}
+I have reviewed the terms and conditions.
+Thank you for using Zeffy.
+"""
+
+HTML_TEMPLATE = """<html><head><style>p {{ margin: 0 }}</style></head><body>
+<div style="font-family: Arial"><h1>New CA${amount} payment received!</h1>
+<table><tr><td>New purchase</td></tr><tr><td><b>{course}</b> @ UNI-Commons x CFSO</td></tr>
+<tr><td>{date}</td></tr></table>
+<p>Participant&#39;s Name (First &amp; Last Name) 參加者的姓名（名字和姓氏） :&nbsp;{name}</p>
+<p>I have reviewed the terms and conditions.</p>
+<p>Thank you for using Zeffy.</p></div></body></html>
+"""
+
+OTHER_TEMPLATE = """Hi team,
+
+Your monthly newsletter is here. {course} sessions were full in {month}.
+See you soon!
+"""
+
+
+def generate(count: int, seed: int = 7) -> list:
+    """(sender, subject, body) tuples: 45% text, 45% HTML, 10% unrelated."""
+    rng = random.Random(seed)
+    start = datetime(2025, 9, 1, 9, 30)
+    corpus = []
+    for _ in range(count):
+        course = rng.choice(COURSES)
+        when = start + timedelta(days=rng.randrange(0, 90), hours=rng.choice([0, 3, 6]))
+        fields = {
+            "amount": f"{rng.choice([80, 90, 100, 125]):.2f}",
+            "course": course,
+            "date": when.strftime("%B %-d, %Y at %-I:%M %p EST"),
+            "name": f"{rng.choice(LAST)}, {rng.choice(FIRST)}" if rng.random() < 0.3 else f"{rng.choice(FIRST)} {rng.choice(LAST)}",
+        }
+        kind = rng.random()
+        if kind < 0.45:
+            corpus.append(("noreply@zeffy.com", "New payment received", TEXT_TEMPLATE.format(**fields)))
+        elif kind < 0.9:
+            corpus.append(("noreply@zeffy.com", "New payment received", HTML_TEMPLATE.format(**fields)))
+        else:
+            corpus.append(("news@example.org", "Newsletter", OTHER_TEMPLATE.format(course=course, month=when.strftime("%B"))))
+    return corpus
+
+
+def load_corpus(directory: str) -> list:
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".eml"):
+            continue
+        with open(os.path.join(directory, name), "rb") as f:
+            message = email.message_from_bytes(f.read(), policy=default_policy)
+        part = message.get_body(preferencelist=("plain", "html"))
+        body = part.get_content() if part is not None else ""
+        corpus.append((str(message.get("From", "")), str(message.get("Subject", "")), body))
+    if not corpus:
+        raise SystemExit(f"No .eml files found in {directory}")
+    return corpus
+
+
+def legacy_extract(email_body: str):
+    """The single-layout extractor the registry replaced (uncompiled searches, dateutil per email)."""
+    from dateutil import parser
+
+    # "EST" is not a zone dateutil knows; it warns on every call
+    warnings.filterwarnings("ignore", module="dateutil")
+    payment_info = {}
+    match = re.search(r"Participant's Name.*?:\s*(.+?)\s*I have reviewed", email_body, re.DOTALL)
+    if match:
+        payment_info['Full_Name'] = match.group(1).strip().replace(',', '')
+    match = re.search(r"New\s*CA\$(\d+\.\d{2})", email_body, re.IGNORECASE)
+    if match:
+        payment_info['Actual_Paid_Amount'] = float(match.group(1).replace(',', ''))
+    match = re.search(r"\s*([A-Za-z]+\s+\d{1,2},\s+\d{4}\s+at\s+\d{1,2}:\d{2}\s+[AP]M\s+[A-Z]{3})", email_body, re.IGNORECASE)
+    if match:
+        date_str = match.group(1).strip()
+        try:
+            parsed_date = parser.parse(date_str)
+        except Exception:
+            parsed_date = datetime.strptime(date_str.rsplit(' ', 1)[0], "%B %d, %Y at %I:%M %p")
+        payment_info['Course_Date'] = parsed_date.strftime("%Y-%m-%d")
+    match = re.search(r"^((?!.*New purchase).+?)\s*@ UNI-Commons x CFSO", email_body, re.MULTILINE)
+    if match:
+        payment_info['Course'] = match.group(1).strip()
+    if 'Full_Name' in payment_info and 'Actual_Paid_Amount' in payment_info:
+        return payment_info
+    return None
+
+
+def _time_per_email(func, corpus: list, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for sender, subject, body in corpus:
+            func(sender, subject, body)
+        runs.append((time.perf_counter() - start) / len(corpus) * 1e6)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of .eml files (default: generated emails)")
+    parser.add_argument("--count", type=int, default=2000, help="generated emails when no --corpus is given")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else generate(args.count)
+
+    hits, disagreements = {}, 0
+    for sender, subject, body in corpus:
+        fields, template = parse_payment_email(body, subject, sender)
+        hits[template or "none"] = hits.get(template or "none", 0) + 1
+        legacy = legacy_extract(body)
+        if legacy is not None and legacy != fields:
+            disagreements += 1
+
+    legacy_us = _time_per_email(lambda sender, subject, body: legacy_extract(body), corpus, args.repeat)
+    registry_us = _time_per_email(parse_payment_email, corpus, args.repeat)
+    matched = len(corpus) - hits.get("none", 0)
+    print(json.dumps({
+        "emails": len(corpus),
+        "templates": [t.name for t in TEMPLATES],
+        "template_hits": hits,
+        "hit_rate": round(matched / len(corpus), 3),
+        "legacy_us_per_email": round(legacy_us, 1),
+        "registry_us_per_email": round(registry_us, 1),
+        "speedup": round(legacy_us / registry_us, 2) if registry_us else None,
+        # Emails the legacy extractor parsed but with different fields (it misses HTML bodies entirely)
+        "legacy_disagreements": disagreements,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
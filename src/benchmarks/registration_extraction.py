@@ -0,0 +1,177 @@
+"""
+Measure registration payload extraction on wide JotForm submissions.
+
+Usage (from src/):
+    python -m benchmarks.registration_extraction [--forms 5] [--payloads 5000] [--width 150] [--repeat 3]
+
+Generates submissions of `--forms` different forms, each with its own
+question numbering (`q7_legalName`, `q23_payersName23`, ...) and `--width`
+keys in total, most of them answers and JotForm metadata the registration
+does not use. Every payload is turned into its registration record twice:
+with the partial-key scans the service used before (kept here as the
+baseline) and with `build_registration_data`, which reads the field map
+cached per form (app.tools.registration_schema). Reports the time per
+payload of both and how many records differ.
+"""
+import argparse
+import json
+import random
+import re
+import statistics
+import time
+from datetime import datetime
+
+from app.tools.registration_schema import _cache
+from app.tools.registration_service import build_registration_data
+from app.utils.extraction_tools import extract_form_id, extract_submission_id
+from app.utils.file_utils import process_file_uploads
+
+COURSES = [
+    "11.09 (Sun) Standard First Aid with CPR Level C & AED Certification",
+    "2025.11.16 (Sun) Mask Fit Testing",
+    "12.6 (Sat) Food Handler Certification",
+]
+METADATA_KEYS = [
+    "formID", "website", "simple_spc", "event_id", "timeToSubmit", "submitSource", "buildDate",
+    "uploadServerUrl", "eventObserver", "path", "jsExecutionTracker", "validatedNewRequiredFieldIDs",
+    "submitDate", "ip", "type", "preview", "embedUrl",
+]
+
+
+def _form_keys(form_id: int, width: int, rng: random.Random) -> dict:
+    """field -> payload key of one form, plus the form's filler keys, in payload order."""
+    numbers = rng.sample(range(1, width * 2), width)
+    fields = {
+        "legalName": f"q{numbers[0]}_legalName",
+        "email": f"q{numbers[1]}_email{numbers[1]}",
+        "phoneNumber": f"q{numbers[2]}_phoneNumber{numbers[2]}",
+        "payersName": f"q{numbers[3]}_payersName{numbers[3]}",
+        "areYou": f"q{numbers[4]}_areYou{numbers[4]}",
+        "prCard": f"q{numbers[5]}_prCard{numbers[5]}",
+        "course": f"q{numbers[6]}_course",
+        "paymentlink": f"q{numbers[7]}_paymentlink",
+    }
+    fillers = METADATA_KEYS + [f"q{n}_{rng.choice(['input', 'typeA', 'textbox', 'dropdown', 'signature'])}{n}"
+                               for n in numbers[8:width - len(METADATA_KEYS) - 2]]
+    order = list(fields.values()) + fillers + ["clearFront"]
+    rng.shuffle(order)
+    return {"fields": fields, "order": ["slug"] + order, "slug": f"submit/{240000000000 + form_id}/"}
+
+
+def generate(forms: int, payloads: int, width: int, seed: int = 3) -> list:
+    rng = random.Random(seed)
+    layouts = [_form_keys(i, width, rng) for i in range(forms)]
+    submissions = []
+    for i in range(payloads):
+        layout = rng.choice(layouts)
+        fields = layout["fields"]
+        is_pr = rng.random() < 0.6
+        answers = {
+            fields["legalName"]: {"first": f"First{i}", "last": f"Last{i}"},
+            fields["email"]: f"user{i}@example.com",
+            fields["phoneNumber"]: {"full": f"(416) 555-{i % 10000:04d}", "area": "416"},
+            fields["payersName"]: {"first": f"Payer{i}", "last": f"Last{i}"},
+            fields["areYou"]: "Yes I am a PR" if is_pr else "No",
+            fields["prCard"]: f"{i:04d}-{i:04d}" if is_pr else "",
+            fields["course"]: {"products": [{"productName": rng.choice(COURSES), "quantity": 1}], "paymentArray": "{}"},
+            fields["paymentlink"]: "https://www.zeffy.com/en-CA/ticketing/first-aid",
+            "clearFront": [f"https://www.jotform.com/uploads/cfso/{layout['slug'].split('/')[1]}/{6000000000 + i}/card.jpg"] if is_pr else [],
+            "slug": layout["slug"],
+        }
+        submissions.append({key: answers.get(key, f"answer {i}") for key in layout["order"]})
+    return submissions
+
+
+def _get_value_by_partial_key(data_dict, partial_key):
+    for full_key, value in data_dict.items():
+        if partial_key in full_key:
+            return value
+    return None
+
+
+def legacy_build(data, pr_amount, normal_amount) -> dict:
+    """The extraction registration_extraction did before the schema cache (one key scan per lookup)."""
+    form_id = extract_form_id(_get_value_by_partial_key(data, "slug"))
+    first_name = _get_value_by_partial_key(data, "legalName")["first"]
+    last_name = _get_value_by_partial_key(data, "legalName")["last"]
+    full_name = f"{first_name} {last_name}"
+    email = _get_value_by_partial_key(data, "email")
+    phone_number = _get_value_by_partial_key(data, "phoneNumber").get("full")
+    if _get_value_by_partial_key(data, "payersName"):
+        payer_full_name = f"{_get_value_by_partial_key(data, 'payersName')['first']} {_get_value_by_partial_key(data, 'payersName')['last']}"
+    type_of_status = _get_value_by_partial_key(data, "areYou")
+    if _get_value_by_partial_key(data, "course"):
+        full_course = _get_value_by_partial_key(data, "course")["products"][0]["productName"]
+    payment_link = _get_value_by_partial_key(data, "paymentlink")
+    match = re.search(r'(?:\d{4}\.)?\d{1,2}\.\d{1,2}\s*\([A-Za-z]{3}\)', full_course)
+    if match:
+        date_part = match.group(0).split('(')[0].strip()
+        if date_part.count('.') == 2:
+            course_date = datetime.strptime(date_part, '%Y.%m.%d').strftime('%Y-%m-%d')
+        else:
+            course_date = datetime.strptime(f"{datetime.utcnow().year}.{date_part}", '%Y.%m.%d').strftime('%Y-%m-%d')
+        course = full_course[match.end():].strip()
+    else:
+        course_date = ""
+        course = full_course.strip()
+    if "Yes I am" in type_of_status:
+        pr_file_upload_urls = data.get("clearFront") if isinstance(data.get("clearFront"), list) else []
+        pr_status = True
+        pr_card_number = _get_value_by_partial_key(data, "prCard")
+        amount_of_payment = pr_amount
+    else:
+        pr_status = False
+        amount_of_payment = normal_amount
+    registration_data = {
+        'Form_ID': form_id, 'Full_Name': full_name, 'First_Name': first_name, 'Last_Name': last_name,
+        'Email': email, 'Phone_Number': phone_number, 'PR_Status': pr_status,
+        'PR_Card_Number': pr_card_number if pr_status else None, 'Amount_of_Payment': amount_of_payment,
+        'PR_File_Upload_URLs': pr_file_upload_urls if pr_status else None, 'Payer_Full_Name': payer_full_name,
+        'Course': course, 'Course_Date': course_date, 'Payment_Link': payment_link,
+    }
+    if "uploadEtransfer" in data:
+        urls = process_file_uploads(data, "uploadEtransfer")
+        registration_data['E_Transfer_File_Upload_URLs'] = urls
+        registration_data['Submission_ID'] = extract_submission_id(urls)
+    elif pr_status:
+        registration_data['Submission_ID'] = extract_submission_id(pr_file_upload_urls)
+    return registration_data
+
+
+def _time_per_payload(func, payloads: list, repeat: int) -> float:
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for data in payloads:
+            func(data, 100.0, 113.0)
+        runs.append((time.perf_counter() - start) / len(payloads) * 1e6)
+    return statistics.median(runs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--forms", type=int, default=5)
+    parser.add_argument("--payloads", type=int, default=5000)
+    parser.add_argument("--width", type=int, default=150, help="keys per submission")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    payloads = generate(args.forms, args.payloads, args.width)
+    mismatches = sum(1 for data in payloads if legacy_build(data, 100.0, 113.0) != build_registration_data(data, 100.0, 113.0))
+
+    legacy_us = _time_per_payload(legacy_build, payloads, args.repeat)
+    _cache.clear()
+    schema_us = _time_per_payload(build_registration_data, payloads, args.repeat)
+    print(json.dumps({
+        "forms": args.forms,
+        "payloads": len(payloads),
+        "keys_per_payload": len(payloads[0]),
+        "legacy_us_per_payload": round(legacy_us, 1),
+        "schema_us_per_payload": round(schema_us, 1),
+        "speedup": round(legacy_us / schema_us, 2) if schema_us else None,
+        "mismatches": mismatches,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Check the response cache's fuzzy matching on paraphrases and near misses.
+
+Usage (from src/):
+    python -m benchmarks.response_cache [--threshold 0.8]
+
+Each case stores the agent's reply to a question, then looks up a second
+question under the same key. Paraphrases (filler, contractions, word order)
+should be answered from the cache; near misses (a negation, another
+question word, another course) ask something else and must not be. Prints
+the paraphrase hit rate and every near miss that was answered with the
+wrong reply, and exits non-zero if there is one.
+"""
+import argparse
+import json
+import sys
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from app.ai import response_cache
+from app.ai.response_cache import ResponseCache
+
+STEP = "intake"
+
+# (stored question, lookup that asks the same thing)
+PARAPHRASES = [
+    ("What is the price of standard first aid for PR holders?", "what's the price of standard first aid for PR holders"),
+    ("When is the standard first aid course?", "When is the standard first aid course please?"),
+    ("How do I pay for the course?", "how do i pay for the course??"),
+    ("Is there a discount for permanent residents?", "Hi, is there a discount for permanent residents"),
+    ("What is the PR discount?", "what's the PR discount"),
+    ("How much is mask fit testing?", "How much is the mask fit testing?"),
+    ("Where is the food handler course held?", "where is the food handler course held please"),
+    ("Can I pay by e-transfer?", "could I pay by e-transfer?"),
+]
+
+# (stored question, lookup that asks something else)
+NEAR_MISSES = [
+    ("What is the price of standard first aid for PR holders?", "What is the price of standard first aid for non PR holders?"),
+    ("When is the standard first aid course?", "Where is the standard first aid course?"),
+    ("How much is mask fit testing?", "How long is mask fit testing?"),
+    ("Is there a discount for permanent residents?", "Is there no discount for permanent residents?"),
+    ("When is the food handler course?", "When is the first aid course?"),
+    ("Can I pay by e-transfer?", "Can I pay by credit card?"),
+    ("How do I register for the course?", "How do I cancel the course?"),
+    ("Is the course refundable?", "Is the course not refundable?"),
+]
+
+
+def _ask(cache: ResponseCache, stored: str, asked: str) -> bool:
+    """Store a reply to `stored`, then look up `asked`; True if it was answered from the cache."""
+    cache.clear()
+    response_cache.response_cache = cache
+    response_cache.store([HumanMessage(stored), AIMessage(f"reply to: {stored}")], STEP, {})
+    return response_cache.lookup([HumanMessage(asked)], STEP, {}) is not None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threshold", type=float, default=None, help="similarity threshold (default: RESPONSE_CACHE_SIMILARITY)")
+    args = parser.parse_args()
+
+    cache = ResponseCache(threshold=args.threshold)
+    missed = [pair for pair in PARAPHRASES if not _ask(cache, *pair)]
+    wrong = [pair for pair in NEAR_MISSES if _ask(cache, *pair)]
+    print(json.dumps({
+        "threshold": cache.threshold,
+        "paraphrases": len(PARAPHRASES),
+        "paraphrase_hit_rate": round(1 - len(missed) / len(PARAPHRASES), 3),
+        "paraphrases_missed": [asked for _, asked in missed],
+        "near_misses": len(NEAR_MISSES),
+        "wrong_answers": [{"stored": stored, "asked": asked} for stored, asked in wrong],
+    }, indent=2))
+    sys.exit(1 if wrong else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings for the Flask app (main.py).
+
+    gunicorn main:app --chdir src -c src/gunicorn.conf.py --workers 3 --worker-class gthread --threads 4
+
+The app is imported once in the master (`preload_app`), the heavy libraries
+right after (`on_starting`), and each worker builds its own clients and graph
+after the fork (`post_fork`). See app/startup.py. A worker's metrics snapshot
+is removed when it exits (`child_exit`), see app/utils/metrics.py.
+"""
+preload_app = True
+
+
+def on_starting(server):
+    from app.startup import preload
+    preload()
+
+
+def post_fork(server, worker):
+    from app.startup import warm_up
+    warm_up()
+
+
+def child_exit(server, worker):
+    from app.utils.metrics import remove_snapshot
+    remove_snapshot(worker.pid)
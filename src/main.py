@@ -1,73 +1,34 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, redirect, abort, stream_with_context
 from flask_cors import CORS
-import uuid
-import os
-import base64
-from werkzeug.utils import secure_filename
 
 # Import the agent logic we just wrote
-from app.ai.agent import process_message
+from app.ai.agent import process_message, stream_message, extract_ui_action
+from app.ai.chat_request import prepare_chat_args, format_sse, STAFF_HEADER
 from app.config import Config
+from app.utils.storage_utils import get_storage, LocalStorage
+from app.utils.upload_utils import store_upload, UploadRejectedError
+from app.utils.metrics import request_metrics, render_metrics
+from app.utils.profiler import profile_request, PROFILE_HEADER
 
 app = Flask(__name__)
+# Let Werkzeug reject oversized bodies before they are read
+app.config['MAX_CONTENT_LENGTH'] = Config.UPLOAD_MAX_BYTES + 64 * 1024
 CORS(app)
 
 @app.route('/api/chat', methods=['POST'])
 def chat_endpoint():
-    data = request.json
-    user_message = data.get('message', '')
-    current_step = data.get('current_step', None)
-    session_id = data.get('session_id')
-    image_url = data.get('image_url', None) # Optional image from frontend
-
-    # Generate a session ID if one doesn't exist (for new users)
-    if not session_id:
-        session_id = str(uuid.uuid4())
-
-    original_image_url = image_url
-
-    # Convert local image URLs to Base64 so OpenAI can access them
-    if image_url and ("localhost" in image_url or "127.0.0.1" in image_url) and "uploads/" in image_url:
-        try:
-            filename = image_url.split("uploads/")[-1]
-            # Resolve path relative to this file
-            uploads_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'uploads'))
-            file_path = os.path.join(uploads_path, filename)
-            
-            if os.path.exists(file_path):
-                with open(file_path, "rb") as img_file:
-                    b64_str = base64.b64encode(img_file.read()).decode('utf-8')
-                    # Determine extension
-                    ext = os.path.splitext(filename)[1].lower().replace('.', '')
-                    if ext == 'jpg': ext = 'jpeg'
-                    # Update image_url to data URI
-                    image_url = f"data:image/{ext};base64,{b64_str}"
-        except Exception as e:
-            print(f"Warning: Could not convert local image to Base64: {e}")
+    chat_args = prepare_chat_args(request.json, request.host, request.headers.get(STAFF_HEADER))
+    session_id = chat_args["thread_id"]
 
     try:
         # --- CALL THE AI AGENT ---
-        # Pass current_step if your agent uses it, otherwise just message/session/image
-        ai_response = process_message(user_message, session_id, image_url, original_image_url)
+        step = request.json.get('current_step') or "chat"
+        with request_metrics("chat", session_id), \
+                profile_request(session_id, step, request.headers.get(PROFILE_HEADER)):
+            ai_response = process_message(**chat_args)
         
         # Check for UI Triggers based on tags in the response
-        ui_action = None
-        
-        if "[SHOW_COURSE_SELECTOR]" in ai_response:
-            ui_action = "show_course_selector"
-            ai_response = ai_response.replace("[SHOW_COURSE_SELECTOR]", "")
-        elif "[SHOW_REGISTRATION_FORM]" in ai_response:
-            ui_action = "show_registration_form"
-            ai_response = ai_response.replace("[SHOW_REGISTRATION_FORM]", "")
-        elif "[SHOW_UPLOAD]" in ai_response:
-            ui_action = "show_upload"
-            ai_response = ai_response.replace("[SHOW_UPLOAD]", "")
-        elif "[SHOW_PAYMENT]" in ai_response:
-            ui_action = "show_payment"
-            ai_response = ai_response.replace("[SHOW_PAYMENT]", "")
-        elif "[SUCCESS_COMPLETION]" in ai_response:
-            ui_action = "success_completion"
-            ai_response = ai_response.replace("[SUCCESS_COMPLETION]", "")
+        ai_response, ui_action = extract_ui_action(ai_response)
 
         return jsonify({
             "response": ai_response.strip(),
@@ -79,48 +40,88 @@ def chat_endpoint():
         print(f"Error: {e}")
         return jsonify({"error": "Something went wrong"}), 500
 
+@app.route('/api/chat/stream', methods=['POST'])
+def chat_stream_endpoint():
+    """
+    Same request body as /api/chat, answered as server-sent events: reply
+    tokens, tool progress and the UI action arrive as they happen.
+    """
+    chat_args = prepare_chat_args(request.json, request.host, request.headers.get(STAFF_HEADER))
+    session_id = chat_args["thread_id"]
+    step = request.json.get('current_step') or "chat_stream"
+    profile_token = request.headers.get(PROFILE_HEADER)
+
+    def generate():
+        yield format_sse("session", {"session_id": session_id})
+        try:
+            with request_metrics("chat_stream", session_id), \
+                    profile_request(session_id, step, profile_token):
+                for event, data in stream_message(**chat_args):
+                    if event == "done":
+                        data = {**data, "session_id": session_id}
+                    yield format_sse(event, data)
+        except Exception as e:
+            print(f"Error: {e}")
+            yield format_sse("error", {"error": "Something went wrong"})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
     """
-    Simple endpoint to save an image and return a URL/Path.
-    In production, upload this to S3/Supabase Storage.
+    Save an image to the configured storage backend and return a URL for it.
+
+    Accepts either a multipart form with a `file` field, or a raw image body
+    (Content-Type: image/*) with the original name in `?filename=`; the raw
+    body is streamed straight to storage without being buffered.
     """
-    if 'file' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({"error": "No selected file"}), 400
-
-    # Restrict to common image extensions
-    ALLOWED_EXT = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp'}
-    filename = secure_filename(file.filename)
-    name, ext = os.path.splitext(filename)
-    if ext.lower() not in ALLOWED_EXT:
-        return jsonify({"error": "Unsupported file type"}), 400
-
-    # Ensure uploads dir exists
-    uploads_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-    uploads_dir = os.path.abspath(uploads_dir)
-    os.makedirs(uploads_dir, exist_ok=True)
-
-    # Generate unique filename to avoid collisions
-    unique_name = f"{uuid.uuid4().hex}{ext.lower()}"
-    save_path = os.path.join(uploads_dir, unique_name)
-    file.save(save_path)
-
-    # Build a URL for the saved file (served by the /uploads/<filename> route)
+    if request.mimetype and request.mimetype.startswith('image/'):
+        original_name = request.args.get('filename', '')
+        stream = request.stream
+        mime_type = request.mimetype
+    else:
+        if 'file' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({"error": "No selected file"}), 400
+        original_name = file.filename
+        stream = file.stream
+        mime_type = file.mimetype
+
+    try:
+        with request_metrics("upload"), profile_request(step="upload", token=request.headers.get(PROFILE_HEADER)):
+            url_path = store_upload(stream, original_name, mime_type)
+    except UploadRejectedError as e:
+        return jsonify({"error": str(e)}), e.status_code
+
+    # Build a URL for the saved file (served by the /uploads/<filename> route on any node)
     # Use request.host_url which includes scheme and host:port
-    file_url = request.host_url.rstrip('/') + f"/uploads/{unique_name}"
+    file_url = request.host_url.rstrip('/') + url_path
     return jsonify({"url": file_url})
 
 
 @app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    """Serve uploaded files from the uploads directory."""
-    uploads_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-    uploads_dir = os.path.abspath(uploads_dir)
-    return send_from_directory(uploads_dir, filename)
+    """Serve uploaded files from the configured storage backend."""
+    storage = get_storage()
+    if isinstance(storage, LocalStorage):
+        return send_from_directory(storage.root, filename)
+    if ".." in filename.split("/"):
+        abort(404)
+    return redirect(storage.presigned_url(filename))
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus scrape endpoint (stage and request duration histograms)."""
+    if not Config.METRICS_ENABLED:
+        abort(404)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
     app.run(debug=Config.FLASK_DEBUG, port=Config.FLASK_PORT)